@@ -6,26 +6,37 @@
 @ Company: Ntels Co., Ltd
 """
 
-import pandas as pd
 import os
+import gc
+import csv
 import config.file_path as file_path
 import argparse
 import time
-import glob
 import numpy as np
-import traceback
 import timeit
 import utils.marker as mk
-import dill
-import pickle
 
-from models.anomaly_detector import AnomalyDetector
-from datetime import datetime, timedelta
+from models.anomaly_detector import AnomalyDetector, JointAnomalyDetector
+from datetime import date, datetime
 from utils.queue import Queue
 from utils.logger import FileLogger, StreamLogger
 from utils.graceful_killer import GracefulKiller
+from utils.transport import SocketReceiver
+from utils.metrics import Metrics, event_lag, watch_gc, LAG_BUCKETS
+from utils.profiler import Profiler
+from utils.hibernation import Hibernator
+from utils.wal import WriteAheadLog, Checkpointer, read_checkpoint, read_segment
+from utils.backpressure import Degrader, publish_load
+from models.snapshot import load_forest
 
 SLOG_LEVEL = "INFO"
+hibernator = None
+wal = None
+checkpointer = None
+# [*]Marker of the last DTmm whose output is written. Only kept while the WAL is enabled.
+output_mark = None
+backlog = 0
+last_lag = None
 
 
 class Clean(GracefulKiller):
@@ -37,124 +48,288 @@ class Clean(GracefulKiller):
     def exit_gracefully(self, signum, frame):
         # [*]Process killed by command or Keyboard Interrupt.
         os.remove(file_path.run_dir() + "{}_{}.detector.run".format(self.ip, self.svc))
-        slogger.info("anomaly detector - {}:{} is end.".format(self.ip, self.svc))
+        slogger.info("anomaly detector - %s:%s is end.", self.ip, self.svc)
         self.kill_now = True
         logger.debug("Program killed by signal.")
         # raise SystemExit
 
 
-def data_loader(input_dir):
+def read_records(file):
     """
-    Load the train data from input directory.
-    :param input_dir: A String. Train data path.
+    Read a .DAT file written by file handler. It replaces pandas on the hot path.
+    :param file: A String. .DAT file path.
     :return:
-        - queue: A Queue object.
-        - boolean: if file exist returns True, else returns False.
+        - A numpy object array. Rows of [PGW_IP, DTmm, SVC_TYPE, UP, DN]. UP and DN are floats.
     """
+    rows = []
+    with open(file, "r", newline="") as f:
+        for r in csv.reader(f, delimiter='|'):
+            if r:
+                rows.append([r[0], r[1], r[2], float(r[3]), float(r[4])])
+    return np.array(rows, dtype=object)
+
+
+def data_loader(input_dir, max_files=0, coalesce=False, receiver=None):
+    """
+    Load every pending input file from input directory in timestamp order.
+    :param input_dir: A String. Train data path. (A List: every input directory of a joint detector)
+    :param max_files: An Integer. Maximum number of files (or socket messages) to drain in one cycle. (0: no limit)
+    :param coalesce: A Boolean. Merge all drained files into one batch if it is True.
+    :param receiver: A SocketReceiver object. In-memory transport from file handler. (None: file protocol only)
+    Loaded records are appended to the WAL (if it is enabled) before their input files are removed.
+    :return:
+        - batches: A List. List of numpy arrays, one per file (or only one if coalesced).
+                   Empty list if there is no pending file.
+    """
+    import glob
+    global backlog
+
     stime = timeit.default_timer()
 
-    info_file_list = glob.glob(input_dir + "*.DAT.INFO")
+    batches = []
+
+    # [*]Socket first: anything spilled to disk before these messages is picked up below.
+    if receiver is not None:
+        messages = receiver.receive(max_messages=max_files)
+        for rows in messages:
+            if rows:
+                batches.append(np.array(rows, dtype=object))
+                metrics.inc('rows_total', len(rows), help_text="Received input rows.", transport='socket')
+        if messages:
+            logger.info("Socket messages are received: %s", len(messages))
+
+    info_file_list = []
+    for directory in (input_dir if isinstance(input_dir, list) else [input_dir]):
+        info_file_list += glob.glob(directory + "*.DAT.INFO")
+    backlog = len(info_file_list)
+    metrics.set('queue_depth', backlog, help_text="Pending input files.")
+    loaded = []
     if info_file_list:
-        info_file_list = sorted(info_file_list)
+        # [*]File names are the datetime written by file handler, so it is sorted by timestamp.
+        info_file_list = sorted(info_file_list, key=os.path.basename)
+        if max_files > 0:
+            info_file_list = info_file_list[:max(max_files - len(batches), 0)]
+
+        for info_file in info_file_list:
+            logger.info(".INFO file is detected: %s", info_file)
+
+            # [*]Remove .INFO extension.
+            file = info_file[:-5]
+            with metrics.time('parse_seconds', help_text="Parse time of an input file."):
+                df = read_records(file)
+            metrics.inc('files_total', help_text="Processed input files.")
+            metrics.inc('rows_total', len(df), help_text="Received input rows.", transport='file')
+
+            logger.info("Data file is opened: %s", file)
+            logger.debug("Dataframe: %s", df)
+            loaded.append(info_file)
+
+            if len(df) > 0:
+                batches.append(df)
+
+    # [*]Records are logged before their input files are gone and before they change the detector.
+    if wal is not None and batches:
+        for data in batches:
+            wal.append(data)
+            metrics.inc('wal_rows_total', len(data), help_text="Records appended to the WAL.")
+        wal.flush()
+
+    for info_file in loaded:
+        # [*]Remove loaded file list.
+        os.remove(info_file)
+        os.remove(info_file[:-5])
+
+        logger.debug(".INFO file is removed: %s", info_file)
+        logger.debug(".DAT file is removed: %s", info_file[:-5])
+
+    if len(batches) > 1:
+        if coalesce:
+            # [*]Stable sort by DTmm keeps the arrival order for the same minute.
+            merged = np.concatenate(batches)
+            merged = merged[np.argsort(merged[:, 1], kind='stable')]
+            batches = [merged]
+        elif receiver is not None:
+            # [*]Socket and spilled batches are interleaved by their first DTmm.
+            batches = sorted(batches, key=lambda b: b[0][1])
+
+    if batches:
+        etime = timeit.default_timer()
+        logger.info("Data loader required time: %s (%s batches)", etime - stime, len(batches))
 
-        # [*] Work with first file
-        file = info_file_list[0]
-        logger.info(".INFO file is detected: {}".format(file))
+    return batches
 
-        # [*]Remove .INFO extension.
-        file = file[:-5]
-        df = pd.read_csv(file, delimiter='|', names=['PGW_IP', 'DTmm', 'SVC_TYPE', 'UP', 'DN'], dtype={
-            "PGW_IP": str,
-            "DTmm": str,
-            "SVC_TYPE": str,
-            "UP": float,
-            "DN": float
-        }).to_numpy()
 
-        logger.info("Data file is opened: {}".format(file))
-        logger.info("Dataframe: {}".format(df))
+def drain_socket(receiver):
+    """
+    Close the detector socket without losing the records queued in it.
+    File handler counted them as sent, so they are written into the input directory as a .DAT/.INFO pair,
+    and loaded like a spilled file on the next start.
+    :param receiver: A SocketReceiver object. (None: file protocol only)
+    :return: None
+    """
+    if receiver is None:
+        return
+    rows = [r for message in receiver.drain() for r in message]
+    if not rows:
+        return
 
-        # [*]Remove loaded file list.
-        os.remove(info_file_list[0])
-        os.remove(file)
+    output_path = INPUT_DIR + '{}.DAT'.format(datetime.now())
+    with open(output_path, "w", newline="") as out:
+        csv.writer(out, delimiter='|').writerows(rows)
+    with open(output_path + ".INFO", "w") as out:
+        out.write("")
+    logger.info("Socket is drained into %s: %s records", output_path, len(rows))
 
-        logger.debug(".INFO file is removed: {}".format(info_file_list[0]))
-        logger.debug(".DAT file is removed: {}".format(file))
 
-        etime = timeit.default_timer()
-        logger.info("Data loader required time: {}".format(etime - stime))
+def read_output_mark():
+    """
+    Read the last DTmm whose output is written.
+    :return:
+        - A String. DTmm. (None: no marker)
+    """
+    if output_mark is None or not os.path.exists(output_mark):
+        return None
+    with open(output_mark, "r") as file:
+        return file.read().strip() or None
+
 
-        return df
-    return None
+def write_output_mark(dtmm):
+    temp = output_mark + ".tmp"
+    with open(temp, "w") as file:
+        file.write(dtmm)
+    os.replace(temp, output_mark)
 
 
-def detection(detector, data, output_dir):
+def detection(detector, data, output_dir, written=None):
     """
     Compute the anomaly scores and write a output into a file.
     :param detector: An Anomaly Detector object. Anomaly Detector that contains its ip address and service type.
     :param data: A Queue object. Input training data.
-    :param output_dir: A String. Output directory path.
+    :param output_dir: A String. Output directory path. (None: outputs are not written)
+    :param written: A String. Last DTmm whose output is already written, e.g. on WAL replay.
+                    Outputs of it and the earlier minutes are not written again. (None: every output is written)
     :return: None
     """
+    global last_lag
 
+    # [*]Records of a joint detector are combined into minutes of every service.
+    data = detector.assemble(data)
     for d in data:
         if dstore.full():
             dstore.get()
             dstore.put([d[1], d[3:]])
-            training_data = np.array(dstore.indexList)
+            training_data = np.array(dstore.indexList, dtype=object)
             t_date = training_data[:, 0]
             t_data = training_data[:, 1]
 
             np_data = []
             for t in t_data:
-                np_data.append(np.array(t, dtype=np.float))
+                np_data.append(np.array(t, dtype=float))
             np_data = np.array(np_data)
-            logger.info("Detection input data ({})".format(np_data))
-            output_path = output_dir + '{}_{}_{}.DAT'.format(detector.ip, detector.svc_type, t_date[-1])
-            detector.compute_anomaly_score(t_date, np_data, output_path, detector_logger)
-            logger.info("Threshold value: {}".format(detector.rrcf.threshold))
+            logger.debug("Detection input data (%s)", np_data)
+            output_path = None
+            if output_dir is not None and (written is None or t_date[-1] > written):
+                output_path = output_dir + '{}_{}_{}.DAT'.format(detector.ip, detector.svc_type, t_date[-1])
+            # [*]Restore the forest, if it is hibernated. Minutes skipped by the stride don't need it.
+            if detector.due():
+                hibernator.touch()
+            detector.compute_anomaly_score(t_date, np_data, output_path, detector_logger, metrics=metrics)
+            if output_path is not None and output_mark is not None:
+                write_output_mark(t_date[-1])
+
+            # [*]Lag of the scored minute from its event time.
+            lag = event_lag(t_date[-1]) if output_path is not None else None
+            if lag is not None:
+                last_lag = lag
+                metrics.observe('lag_seconds', lag, buckets=LAG_BUCKETS, help_text="Output lag from DTmm.")
+                metrics.set('last_lag_seconds', lag, help_text="Output lag of the last scored DTmm.")
+            logger.info("Threshold value: %s", detector.rrcf.threshold)
         else:
             dstore.put([d[1], d[3:]])
-            logger.debug("dstore: {}".format(dstore.indexList))
+            logger.debug("dstore: %s", dstore.indexList)
+
+
+def checkpoint_state():
+    """
+    Detector state of a checkpoint. It is called in the checkpoint child,
+    so a hibernated forest is read from its snapshot without restoring the one of the parent.
+    :return:
+        - A Dictionary. Detector, data queue and the random state, so that WAL replay makes the same cuts.
+    """
+    if hibernator is not None and hibernator.hibernated:
+        anomaly_detector.rrcf.forest = load_forest(hibernator.snapshot_path)
+    return {'detector': anomaly_detector, 'dstore': dstore, 'random': np.random.get_state()}
+
+
+def replay(covered):
+    """
+    Replay WAL segments after the checkpoint into the detector.
+    Records are logged before they are scored, so the WAL tail could have minutes whose output was never written.
+    Outputs are written for the minutes after the output marker, and not again for the ones before it.
+    :param covered: An Integer. Last WAL segment covered by the loaded state. (-1: none)
+    :return: None
+    """
+    stime = timeit.default_timer()
+    rows = 0
+    written = read_output_mark()
+    for segment, path in wal.segments(after=covered):
+        if segment == wal.segment:
+            continue
+        data = np.array(read_segment(path), dtype=object)
+        if len(data) > 0:
+            detection(anomaly_detector, data, OUTPUT_DIR, written=written)
+        rows += len(data)
+
+    etime = timeit.default_timer()
+    metrics.set('replay_seconds', etime - stime, help_text="WAL replay time on start up.")
+    metrics.set('replay_rows', rows, help_text="Records replayed from the WAL on start up.")
+    if rows > 0:
+        logger.info("WAL is replayed after segment %s: %s records in %ss", covered, rows, etime - stime)
+        slogger.info("WAL is replayed: %s records", rows)
 
 
 def directory_check():
     # [*]Create directory if doesn't exist.
     if not os.path.exists(LOG_DIR):
         os.makedirs(LOG_DIR)
-        slogger.debug("LOG directory doesn't exist. Create one; ({})".format(LOG_DIR))
+        slogger.debug("LOG directory doesn't exist. Create one; (%s)", LOG_DIR)
 
     if not os.path.exists(INPUT_DIR):
         os.makedirs(INPUT_DIR)
-        slogger.debug("INPUT directory doesn't exist. Create one; ({})".format(INPUT_DIR))
+        slogger.debug("INPUT directory doesn't exist. Create one; (%s)", INPUT_DIR)
 
     if not os.path.exists(OUTPUT_DIR):
         os.makedirs(OUTPUT_DIR)
-        slogger.debug("OUTPUT directory doesn't exist. Create one; ({})".format(OUTPUT_DIR))
+        slogger.debug("OUTPUT directory doesn't exist. Create one; (%s)", OUTPUT_DIR)
 
     if not os.path.exists(FINAL_OUTPUT_DIR):
         os.makedirs(FINAL_OUTPUT_DIR)
-        slogger.debug("FINAL_OUTPUT directory doesn't exist. Create one; ({})".format(FINAL_OUTPUT_DIR))
+        slogger.debug("FINAL_OUTPUT directory doesn't exist. Create one; (%s)", FINAL_OUTPUT_DIR)
 
     if not os.path.exists(RUN_DIR):
         os.makedirs(RUN_DIR)
-        slogger.debug("RUNNING directory doesn't exist. Create one; ({})".format(RUN_DIR))
+        slogger.debug("RUNNING directory doesn't exist. Create one; (%s)", RUN_DIR)
 
     if not os.path.exists(INSTANCE_DIR):
         os.makedirs(INSTANCE_DIR)
-        slogger.debug("INSTANCE_DIR directory doesn't exist. Create one; ({})".format(RUN_DIR))
+        slogger.debug("INSTANCE_DIR directory doesn't exist. Create one; (%s)", RUN_DIR)
 
 
-def main(ip, svc, t, l, seq, q):
+def main(ip, svc, t, l, seq, q, max_files=0, coalesce=False, transport='file', hibernate_after=0, memory_budget=0,
+         checkpoint_interval=0, wal_fsync=False, early_exit=0, min_trees=0, degrade_backlog=0, degrade_lag=0,
+         degrade_trees=0.5, degrade_hold=30, gc_freeze=600, sample_rate=1.0, rebuild_epoch=0,
+         stride=1, joint=None, cap_pause=0.1):
     """
     Work flow:
         1) Directory creation, if doesn't exist.
         2) Logger define.
-        3) Anomaly Detector define.
+        3) Anomaly Detector define. (Latest checkpoint and WAL replay, if checkpoints are enabled)
         4) While roof
-            4-1) Check logger's date.
-            4-2) Loading the data, if input file exists.
+            4-1) Loading every pending data file, if input file exists.
+            4-2) Appending the loaded records to the WAL, before their input files are removed.
             4-3) Anomaly detection, if data queue is full and file is read.
+            4-4) Checkpoint in a forked child, if it is due.
+            4-5) Sleep when there was nothing to load, or briefly when max_files capped the cycle.
 
     :param ip: A String. P-gateway address.
     :param svc: A String. Service Type.
@@ -162,13 +337,31 @@ def main(ip, svc, t, l, seq, q):
     :param l: An Integer. Leaf size.
     :param seq: An Integer. Sequences.
     :param q: A Float. Quantile.
+    :param max_files: An Integer. Maximum number of input files to drain in one cycle. (0: no limit)
+    :param coalesce: A Boolean. Merge drained input files into one batch.
+    :param transport: A String. 'socket' receives records from file handler in memory, 'file' uses files only.
+    :param hibernate_after: A Float. Idle seconds before the forest is hibernated. (0: never by idle time)
+    :param memory_budget: An Integer. Bytes of resident forests of every detector of the processor. (0: no budget)
+    :param checkpoint_interval: A Float. Seconds between checkpoints. (0: no WAL and no checkpoint)
+    :param wal_fsync: A Boolean. fsync the WAL on every cycle.
+    :param early_exit: A Float. Confidence of the early exit of tree scoring. (0: every tree is scored)
+    :param min_trees: An Integer. Trees scored before an early exit. (0: a tenth of the trees, at least 5)
+    :param degrade_backlog: An Integer. Pending input files to enter the degraded mode. (0: not by backlog)
+    :param degrade_lag: A Float. Output lag in seconds to enter the degraded mode. (0: not by lag)
+    :param degrade_trees: A Float. Fraction of trees updated and scored in the degraded mode.
+    :param degrade_hold: A Float. Seconds under half of the limits before it leaves the degraded mode.
+    :param gc_freeze: A Float. Seconds between gc.freeze() while idle. (0: objects are never frozen)
+    :param sample_rate: A Float. Probability that a tree is updated with a point. (1: every tree)
+    :param rebuild_epoch: An Integer. Points between background rebuilds of the trees. (0: no rebuild)
+    :param stride: An Integer. Minutes between scored points. (1: every minute)
+    :param cap_pause: A Float. Seconds to yield after a cycle capped by max_files, while files are still pending.
+    :param joint: A List. Service types scored by one forest, and 'svc' is the name of the group. (None: only 'svc')
     :return: None.
     """
     global slogger, logger, elogger, detector_logger, elog_path
-    global today, tomorrow
     global dstore
     global LOG_LEVEL
-    global anomaly_detector
+    global anomaly_detector, hibernator, wal, checkpointer, output_mark
 
     logger.info("\n\t\t@Hyper parameters: \n"
                 "\t\t\t+IP addr: {}\n"
@@ -183,88 +376,238 @@ def main(ip, svc, t, l, seq, q):
     '''
     killer = Clean(ip, svc)
 
+    # [*]Only needed on start up and error paths.
+    import pickle
+    import traceback
+
+    # [*]A joint detector reads the input directories of its services. File handler sends records per service.
+    input_dirs = INPUT_DIR
+    if joint:
+        input_dirs = [file_path.input_dir(ip, s) for s in joint]
+        if transport == 'socket':
+            logger.warning("Joint detector %s:%s reads input files only. Socket transport is not used.", ip, svc)
+            transport = 'file'
+
+    receiver = None
+    if transport == 'socket':
+        receiver = SocketReceiver(file_path.socket_path(ip, svc))
+        logger.info("Detector socket is bound: %s", receiver.path)
+
+    covered = -1
     try:
-        if os.path.exists(INSTANCE_DIR + "model.pkl"):
+        # [*]Latest checkpoint, unless a newer model.pkl replaced it.
+        checkpoint = None
+        if checkpoint_interval > 0:
+            checkpoint = read_checkpoint(INSTANCE_DIR + "checkpoint.pkl", INSTANCE_DIR + "model.pkl")
+
+        if checkpoint is not None:
+            anomaly_detector = checkpoint['detector']
+            dstore = checkpoint['dstore']
+            np.random.set_state(checkpoint['random'])
+            covered = checkpoint['segment']
+            slogger.info("Checkpoint is loaded successfully!")
+            logger.info("Anomaly Detector is loaded from the checkpoint. (WAL segment %s)", covered)
+        elif os.path.exists(INSTANCE_DIR + "model.pkl"):
             with open(INSTANCE_DIR+"model.pkl", "rb") as model:
                 anomaly_detector = pickle.load(model)
             slogger.info("Model is already exist. Loaded successfully!")
             logger.info("Anomaly Detector successfully loaded.")
-            logger.info(anomaly_detector.rrcf.forest)
+            logger.debug("Forest: %s", anomaly_detector.rrcf.forest)
         else:
-            anomaly_detector = AnomalyDetector(t, l, sequences=seq, quantile=q, ip=ip, svc_type=svc)
+            if joint:
+                anomaly_detector = JointAnomalyDetector(t, l, seq, joint, quantile=q, ip=ip, group=svc)
+            else:
+                anomaly_detector = AnomalyDetector(t, l, sequences=seq, quantile=q, ip=ip, svc_type=svc)
             logger.info("Anomaly Detector successfully created.")
 
-        if os.path.exists(INSTANCE_DIR + "dstore.pkl"):
+        if joint and getattr(anomaly_detector, 'services', None) != joint:
+            raise ValueError("Services of the loaded model {} are not {}".format(
+                getattr(anomaly_detector, 'services', None), joint))
+
+        if checkpoint is None and os.path.exists(INSTANCE_DIR + "dstore.pkl"):
             with open(INSTANCE_DIR + "dstore.pkl", "rb") as ds:
                 dstore = pickle.load(ds)
 
     except Exception:
         elogger.error(traceback.format_exc())
-        slogger.error("Anomaly Detector couldn't be created. Check your error log: {}".format(elog_path))
+        slogger.error("Anomaly Detector couldn't be created. Check your error log: %s",
+                      elog_path.format(date.today()))
         os.remove(file_path.run_dir() + "{}_{}.detector.run".format(ip, svc))
+        drain_socket(receiver)
         model_save()
         raise SystemExit
 
-    while not killer.kill_now:
-        # [*] Check directory existence.
-        directory_check()
+    # [*]Runtime options, not a part of the saved model.
+    anomaly_detector.rrcf.set_early_exit(early_exit, min_trees)
+    anomaly_detector.rrcf.set_active_trees(None)
+    anomaly_detector.rrcf.set_sampling(sample_rate)
+    anomaly_detector.rrcf.set_rebuild(rebuild_epoch)
+    anomaly_detector.set_stride(stride)
+    rebuilds = 0
+    rebuild_failures = 0
+
+    # [*]Backpressure: load is published for file handler, and the detector degrades itself while it is behind.
+    degrader = Degrader(backlog=degrade_backlog, lag=degrade_lag, hold=degrade_hold, metrics=metrics, logger=logger)
+    degraded_trees = max(int(anomaly_detector.rrcf.num_trees * degrade_trees), 1)
+    load_path = RUN_DIR + "detector_{}_{}.load".format(ip, svc)
+
+    # [*]Forest hibernation of an idle detector.
+    hibernator = Hibernator('detector_{}_{}'.format(ip, svc), anomaly_detector.rrcf, INSTANCE_DIR, RUN_DIR,
+                            idle_time=hibernate_after, budget=memory_budget, metrics=metrics, logger=logger)
+
+    # [*]Write-ahead log of ingested records and periodic checkpoints. Restart replays only the WAL tail.
+    if checkpoint_interval > 0:
+        output_mark = INSTANCE_DIR + "output.mark"
+        wal = WriteAheadLog(INSTANCE_DIR + "wal/", fsync=wal_fsync)
+        checkpointer = Checkpointer(INSTANCE_DIR + "checkpoint.pkl", checkpoint_interval, logger=logger,
+                                    metrics=metrics)
+        try:
+            replay(covered)
+        except Exception:
+            elogger.error(traceback.format_exc())
+            slogger.error("WAL couldn't be replayed. Check your error log: %s", elog_path.format(date.today()))
+            os.remove(file_path.run_dir() + "{}_{}.detector.run".format(ip, svc))
+            drain_socket(receiver)
+            raise SystemExit
 
-        # [*]If Day pass by create a new log file.
-        today = datetime.now().date()
-        if today >= tomorrow:
-            tomorrow = today + timedelta(days=1)
+    # [*]Tree nodes have no reference cycle, so the loaded model is moved out of the collector's sight.
+    # Frozen objects are still freed by reference counting.
+    watch_gc(metrics)
+    if gc_freeze > 0:
+        gc.collect()
+        gc.freeze()
+    frozen_at = time.time()
 
-            # [*]Log handler updates
-            update_log_path = file_path.svc_log_dir(ip, svc) + 'anomaly_detection_{}.log'.format(today)
-            update_elog_path = file_path.svc_log_dir(ip, svc) + 'anomaly_detection_error_{}.log'.format(today)
-            update_dlog_path = file_path.svc_log_dir(ip, svc) + 'anomaly_detector_{}.log'.format(today)
+    # [*]On-demand profiling by SIGUSR1 or 'detector_{ip}_{svc}.profile' in the running directory.
+    profiler = Profiler('detector_{}_{}'.format(ip, svc), RUN_DIR, LOG_DIR, logger)
 
-            slogger = StreamLogger('anomaly_detection_stream_logger', level=SLOG_LEVEL).get_instance()
-            logger = FileLogger('anomaly_detection_info', log_path=update_log_path, level=LOG_LEVEL).get_instance()
-            elogger = FileLogger('anomaly_detection_error', log_path=update_elog_path, level='WARNING').get_instance()
-            detector_logger = FileLogger('anomaly_detector', log_path=update_dlog_path, level=LOG_LEVEL).get_instance()
+    while not killer.kill_now:
+        # [*] Check directory existence.
+        directory_check()
+        profiler.tick()
 
         try:
             # [*]Loading the data and save it into queue.
-            data = data_loader(INPUT_DIR)
-            slogger.debug("Read status: {}".format(data))
+            batches = data_loader(input_dirs, max_files=max_files, coalesce=coalesce, receiver=receiver)
+            slogger.debug("Read status: %s batches", len(batches))
+
+            if degrader.update(backlog, last_lag):
+                anomaly_detector.rrcf.set_active_trees(degraded_trees if degrader.degraded else None)
+            publish_load(load_path, backlog, last_lag, degrader.degraded)
         except Exception:
             elogger.error(traceback.format_exc())
-            slogger.error("Data loader can't work properly. Check your error log: {}".format(elog_path))
+            slogger.error("Data loader can't work properly. Check your error log: %s",
+                          elog_path.format(date.today()))
             os.remove(file_path.run_dir() + "{}_{}.detector.run".format(ip, svc))
+            drain_socket(receiver)
             model_save()
             raise SystemExit
 
         try:
-            if data is not None:
+            for data in batches:
                 stime = timeit.default_timer()
                 # [*]Anomaly Detection.
                 detection(anomaly_detector, data, OUTPUT_DIR)
                 etime = timeit.default_timer()
-                logger.info("Detection required time: {}".format(etime - stime))
+                logger.info("Detection required time: %s", etime - stime)
+                metrics.observe('detection_seconds', etime - stime, help_text="Detection time of a batch.")
                 slogger.debug("Detection is normally worked.")
-            time.sleep(1)
+            if checkpointer is not None:
+                covered = checkpointer.poll()
+                if covered is not None:
+                    wal.truncate(covered)
+                if checkpointer.due():
+                    checkpointer.start(checkpoint_state, wal.rotate())
+            # [*]Rebuilt trees of the background worker.
+            if rebuild_epoch > 0:
+                if not batches and not hibernator.hibernated:
+                    anomaly_detector.rrcf.maintain()
+                stats = anomaly_detector.rrcf.rebuild_stats
+                if stats['rebuilds'] > rebuilds:
+                    metrics.inc('rebuilds_total', stats['rebuilds'] - rebuilds, help_text="Swapped tree rebuilds.")
+                    metrics.observe('rebuild_seconds', stats['last_seconds'], help_text="Build time of a rebuild.")
+                    rebuilds = stats['rebuilds']
+                if stats['failures'] > rebuild_failures:
+                    logger.warning("Tree rebuild failed. Tombstones are forgotten and the old trees are kept.")
+                    metrics.inc('rebuild_failures_total', stats['failures'] - rebuild_failures,
+                                help_text="Failed tree rebuilds.")
+                    rebuild_failures = stats['failures']
+                metrics.set('tombstones', anomaly_detector.rrcf.tombstone_count(),
+                            help_text="Expired points left in the trees until the next rebuild.")
+            # [*]Tree updates deferred by the early exit are applied while it is idle.
+            if not batches:
+                anomaly_detector.rrcf.flush_deferred()
+
+                # [*]Nodes inserted since the last freeze. Garbage cycles are collected first, as on start up,
+                # or they would stay in the permanent generation for good.
+                if 0 < gc_freeze <= time.time() - frozen_at:
+                    gc.collect()
+                    gc.freeze()
+                    frozen_at = time.time()
+                    metrics.set('gc_frozen_objects', gc.get_freeze_count(), help_text="Objects in gc.freeze().")
+            hibernator.tick()
+            metrics.flush()
+
+            # [*]Sleep if the input queue is drained. A capped cycle with a backlog yields the CPU to the other
+            # detectors of the host, instead of spinning on the backlog.
+            if not batches:
+                time.sleep(1)
+            elif 0 < max_files < backlog:
+                time.sleep(cap_pause)
         except Exception:
             elogger.error(traceback.format_exc())
-            slogger.error("Detection method didn't work properly. Check your error log: {}".format(elog_path))
+            slogger.error("Detection method didn't work properly. Check your error log: %s",
+                          elog_path.format(date.today()))
             os.remove(file_path.run_dir() + "{}_{}.detector.run".format(ip, svc))
+            drain_socket(receiver)
             model_save()
             raise SystemExit
 
+    if early_exit > 0:
+        stats = anomaly_detector.rrcf.exit_stats
+        logger.info("Early exit: %s of %s points, %.1f trees per point", stats['early'], stats['points'],
+                    stats['trees'] / max(stats['points'], 1))
+
+    # [*]Rows still queued in the socket are kept in a file. New rows of file handler are spilled from now on.
+    drain_socket(receiver)
+    if os.path.exists(load_path):
+        os.remove(load_path)
     model_save()
+    hibernator.close()
+    metrics.flush(force=True)
 
 
 def model_save():
+    import dill
+
+    # [*]The model is saved with its forest.
+    if hibernator is not None:
+        hibernator.restore()
+
     with open(INSTANCE_DIR + "model.pkl", "wb") as output:
         dill.dump(anomaly_detector, output)
         logger.info("Model is saved..")
 
     with open(INSTANCE_DIR + "dstore.pkl", "wb") as output:
         dill.dump(dstore, output)
-        logger.info("Data queue is saved : {}".format(dstore))
+        logger.info("Data queue is saved : %s", dstore)
 
+    # [*]Final checkpoint covers every record and is newer than model.pkl, so nothing is replayed on the next start.
+    if checkpointer is not None:
+        checkpointer.poll(block=True)
+        segment = wal.rotate()
+        checkpointer.run_sync(checkpoint_state, segment)
+        wal.truncate(segment)
+        wal.close()
 
-if __name__ == '__main__':
+
+def parse_args(argv=None):
+    """
+    Parse command line arguments.
+    :param argv: A List. Arguments to parse. (Default: sys.argv)
+    :return:
+        - An argparse Namespace.
+    """
     parser = argparse.ArgumentParser(description='CDR anomaly detection module.')
     # [*]Mandatory parameters.
     parser.add_argument('--ip', type=str, help='IP address of services.', required=True)
@@ -278,7 +621,79 @@ if __name__ == '__main__':
     parser.add_argument('--q', type=float, help='Quantile value.(Default: 0.99)', default=0.99)
     parser.add_argument('--log', type=str, help='Set log level', default="INFO")
 
-    args = parser.parse_args()
+    # [*]Ingestion parameters.
+    parser.add_argument('--max_files', type=int, help='Max input files to drain per cycle.(Default: 0, no limit)',
+                        default=0)
+    parser.add_argument('--cap_pause', type=float, help='Seconds to yield after a cycle capped by --max_files while '
+                                                        'files are pending.(Default: 0.1)', default=0.1)
+    parser.add_argument('--coalesce', action='store_true', help='Merge drained input files into one batch.')
+    parser.add_argument('--transport', type=str, choices=['file', 'socket'], default='file',
+                        help='Receive records from file handler through a socket as well as files.(Default: file)')
+
+    # [*]Memory parameters.
+    parser.add_argument('--hibernate_after', type=float, help='Idle seconds before the forest is written to disk '
+                                                              'and dropped from memory.(Default: 0, never)', default=0)
+    parser.add_argument('--memory_budget', type=int, help='Resident forests of every detector in MB. The least '
+                                                          'recently used ones are hibernated.(Default: 0, no budget)',
+                        default=0)
+
+    # [*]Recovery parameters.
+    parser.add_argument('--checkpoint_interval', type=float, help='Seconds between background checkpoints of the '
+                                                                  'detector. Records are kept in a WAL in between.'
+                                                                  'e.g. 300(Default: 0, no WAL and no checkpoint)',
+                        default=0)
+    parser.add_argument('--wal_fsync', action='store_true', help='fsync the WAL on every cycle.')
+
+    # [*]Latency parameters.
+    parser.add_argument('--early_exit', type=float, help='Stop scoring trees once the decision against the threshold '
+                                                         'is this certain. Not with --sample_rate below 1.'
+                                                         'e.g. 0.99(Default: 0, every tree)', default=0)
+    parser.add_argument('--min_trees', type=int, help='Trees scored before an early exit.'
+                                                      '(Default: 0, a tenth of the trees and at least 5)', default=0)
+
+    parser.add_argument('--sample_rate', type=float, help='Probability that a tree is updated with a point. The others '
+                                                          'score it without an update. Not with --early_exit.'
+                                                          '(Default: 1.0, every tree)', default=1.0)
+    parser.add_argument('--stride', type=int, help='Minutes between scored points, for low priority services. The '
+                                                   'others only move the window.(Default: 1, every minute)', default=1)
+
+    parser.add_argument('--joint', type=str, help='Comma separated service types scored by one forest. --svc is then '
+                                                  'the name of the group, and the services must not have their own '
+                                                  'detectors.(Default: None)', default=None)
+    parser.add_argument('--rebuild_epoch', type=int, help='Points between background rebuilds of the trees. Expired '
+                                                          'points are only tombstoned in between. e.g. the leaf size'
+                                                          '(Default: 0, every expired point is forgotten)', default=0)
+
+    # [*]Backpressure parameters.
+    parser.add_argument('--degrade_backlog', type=int, help='Pending input files to enter the degraded mode.'
+                                                            '(Default: 0, not by backlog)', default=0)
+    parser.add_argument('--degrade_lag', type=float, help='Output lag in seconds to enter the degraded mode.'
+                                                          '(Default: 0, not by lag)', default=0)
+    parser.add_argument('--degrade_trees', type=float, help='Fraction of trees updated and scored in the degraded '
+                                                            'mode.(Default: 0.5)', default=0.5)
+    parser.add_argument('--degrade_hold', type=float, help='Seconds under half of the limits before the degraded '
+                                                           'mode ends.(Default: 30)', default=30)
+
+    # [*]Garbage collector parameters.
+    parser.add_argument('--gc_freeze', type=float, help='Seconds between gc.freeze() of long lived objects while '
+                                                        'idle.(Default: 600, 0 never freezes)', default=600)
+
+    args = parser.parse_args(argv)
+    # [*]Early exit scores a point once a threshold exists, and it would silently take the place of sampling.
+    if args.early_exit > 0 and args.sample_rate < 1:
+        parser.error("--early_exit and --sample_rate below 1 can't be used together. Choose one of them.")
+    return args
+
+
+def run(args):
+    """
+    Entry point of an anomaly detector process. It is called by __main__ or by a forked supervisor child.
+    :param args: An argparse Namespace. Parsed by parse_args.
+    :return: None.
+    """
+    global LOG_DIR, INPUT_DIR, OUTPUT_DIR, INSTANCE_DIR, FINAL_OUTPUT_DIR, RUN_DIR, LOG_LEVEL
+    global slogger, logger, elogger, detector_logger, log_path, elog_path, dlog_path
+    global dstore, metrics
 
     file_path.IDX = args.id
 
@@ -298,13 +713,10 @@ if __name__ == '__main__':
     # [*] Check directory existence.
     directory_check()
 
-    # [*]Every day logging in different fie.
-    today = datetime.now().date()
-    tomorrow = today + timedelta(days=1)
-
-    log_path = file_path.svc_log_dir(args.ip, args.svc) + 'anomaly_detection_{}.log'.format(today)
-    elog_path = file_path.svc_log_dir(args.ip, args.svc) + 'anomaly_detection_error_{}.log'.format(today)
-    dlog_path = file_path.svc_log_dir(args.ip, args.svc) + 'anomaly_detector_{}.log'.format(today)
+    # [*]Every day logging in different fie. '{}' is replaced by the date and rotates daily.
+    log_path = file_path.svc_log_dir(args.ip, args.svc) + 'anomaly_detection_{}.log'
+    elog_path = file_path.svc_log_dir(args.ip, args.svc) + 'anomaly_detection_error_{}.log'
+    dlog_path = file_path.svc_log_dir(args.ip, args.svc) + 'anomaly_detector_{}.log'
 
     '''
         - logger; Informative logger.
@@ -315,8 +727,8 @@ if __name__ == '__main__':
     detector_logger = FileLogger('anomaly_detector', log_path=dlog_path, level=LOG_LEVEL).get_instance()
 
     if os.path.exists(RUN_DIR + '{}_{}.detector.run'.format(args.ip, args.svc)):
-        elogger.error("Anomaly detector of {}:{} is already running. Program exit.".format(args.ip, args.svc))
-        slogger.error("Anomaly detector of {}:{} is already running. Program exit.".format(args.ip, args.svc))
+        elogger.error("Anomaly detector of %s:%s is already running. Program exit.", args.ip, args.svc)
+        slogger.error("Anomaly detector of %s:%s is already running. Program exit.", args.ip, args.svc)
         raise SystemExit
     else:
         with open(RUN_DIR + '{}_{}.detector.run'.format(args.ip, args.svc), "w") as out:
@@ -327,4 +739,20 @@ if __name__ == '__main__':
     # [*] NOTE: Global Queue
     dstore = Queue(args.seq)
 
-    main(args.ip, args.svc, args.trees, args.leaves, args.seq, args.q)
+    # [*]Stage metrics. Written into the metrics directory of the processor.
+    metrics = Metrics('detector_{}_{}'.format(args.ip, args.svc),
+                      {'stage': 'detector', 'ip': args.ip, 'svc': args.svc})
+
+    main(args.ip, args.svc, args.trees, args.leaves, args.seq, args.q,
+         max_files=args.max_files, coalesce=args.coalesce, transport=args.transport,
+         hibernate_after=args.hibernate_after, memory_budget=args.memory_budget * 1024 * 1024,
+         checkpoint_interval=args.checkpoint_interval, wal_fsync=args.wal_fsync,
+         early_exit=args.early_exit, min_trees=args.min_trees, degrade_backlog=args.degrade_backlog,
+         degrade_lag=args.degrade_lag, degrade_trees=args.degrade_trees, degrade_hold=args.degrade_hold,
+         gc_freeze=args.gc_freeze, sample_rate=args.sample_rate, rebuild_epoch=args.rebuild_epoch,
+         stride=args.stride, cap_pause=args.cap_pause,
+         joint=[s for s in args.joint.split(",") if s] if args.joint else None)
+
+
+if __name__ == '__main__':
+    run(parse_args())
@@ -0,0 +1,581 @@
+"""
+@ File name: benchmark.py
+@ Version: 1.0.0
+@ Last update: 2026.OCT.19
+@ Company: Ntels Co., Ltd
+
+Micro benchmarks of the RCTree and RRCF hot paths.
+    - RCTree: insert_point, forget_point, codisp and find_duplicate on a full tree (sliding window).
+    - RRCF: a full anomaly_score step on a full forest, calc_threshold, and CoDisp of the whole window.
+Each case reports throughput, latency percentiles and peak memory (tracemalloc, on a separate pass).
+
+With --engine, an alternative RCTree module is checked to give the same scores as models/rrcf.py
+on the same seed before it is benchmarked.
+
+With --early_exit, anomaly_score with the confidence based early exit is compared with the full forest
+on the same seed and threshold: latency, deferred update time, exit rate, scored trees per point and
+decision agreement with the mean of every tree.
+
+With --sampling, anomaly_score with sub-sampled tree updates is compared with the full forest on the spiky data,
+where spikes are known: latency, tree updates per point, rank correlation of the scores, and recall of the spikes
+and agreement of the decisions with the threshold fixed to the 0.99 quantile of the warm-up scores.
+
+With --gc, anomaly_score steps are run under the cyclic garbage collector, with and without gc.freeze() after
+the forest is built: collections, pause time and objects freed by the collector. (--engine compares another
+RCTree module, e.g. one with strong parent links)
+
+Usage:
+    python3 benchmark.py --trees 20,80 --leaves 256,864 --seq 6 --dist random,constant,spiky
+    python3 benchmark.py --engine models.rrcf_fast --check_only
+    python3 benchmark.py --trees 80 --leaves 864 --early_exit 0.9,0.99,0.999
+    python3 benchmark.py --trees 80 --leaves 864 --dist random --gc
+    python3 benchmark.py --trees 80 --leaves 864 --sampling 0.5,0.25,0.1
+"""
+import sys
+import csv
+import timeit
+import gc
+import argparse
+import importlib
+import tracemalloc
+import numpy as np
+import models.rrcf as rrcf
+import models.rrcf_cls as rrcf_cls
+
+from models.rrcf_cls import RRCF
+
+COLUMNS = ['case', 'engine', 'dist', 'trees', 'leaves', 'seq', 'ops', 'ops_per_sec', 'p50_us', 'p90_us', 'p99_us',
+           'max_us', 'peak_mem_kb', 'exit_rate', 'mean_trees', 'agreement',
+           'gc_count', 'gc_pause_ms', 'gc_max_ms', 'gc_collected', 'updates', 'rank_corr', 'recall']
+
+
+def make_data(dist, n, seed):
+    """
+    Synthetic UP/DN series.
+    :param dist: A String. 'random', 'constant' or 'spiky'.
+    :param n: An Integer. Number of rows.
+    :param seed: An Integer. Random seed.
+    :return:
+        - A numpy array. (n x 2)
+    """
+    rng = np.random.RandomState(seed)
+    if dist == 'random':
+        return rng.normal(1000, 100, size=(n, 2))
+    elif dist == 'constant':
+        # [*]Every point is a duplicate. Worst case of find_duplicate and the leaf counts.
+        return np.full((n, 2), 1000.0)
+    elif dist == 'spiky':
+        data = rng.normal(1000, 10, size=(n, 2))
+        spikes = rng.random_sample(n) < 0.01
+        data[spikes] *= rng.uniform(5, 20, size=(spikes.sum(), 1))
+        return data
+    raise ValueError("Unknown distribution '{}'".format(dist))
+
+
+def shingled(data, seq):
+    return np.asarray([data[i:i + seq] for i in range(len(data) - seq + 1)])
+
+
+def summary(latencies):
+    latencies = np.asarray(latencies) * 1e6
+    total = latencies.sum()
+    return {
+        'ops': len(latencies),
+        'ops_per_sec': len(latencies) / total * 1e6 if total > 0 else float('inf'),
+        'p50_us': np.percentile(latencies, 50),
+        'p90_us': np.percentile(latencies, 90),
+        'p99_us': np.percentile(latencies, 99),
+        'max_us': latencies.max()
+    }
+
+
+def tree_ops(engine, points, leaves, ops, timer=timeit.default_timer):
+    """
+    Fill a tree up to 'leaves' points, then slide the window by 'ops' points.
+    :return:
+        - A Dictionary. Latency list by operation name.
+    """
+    tree = engine.RCTree()
+    for index in range(leaves):
+        tree.insert_point(points[index], index=index)
+
+    latencies = {'insert_point': [], 'forget_point': [], 'codisp': [], 'find_duplicate': []}
+    for index in range(leaves, leaves + ops):
+        point = points[index % len(points)]
+
+        t0 = timer()
+        tree.forget_point(index - leaves)
+        t1 = timer()
+        tree.find_duplicate(point.ravel())
+        t2 = timer()
+        tree.insert_point(point, index=index)
+        t3 = timer()
+        tree.codisp(index)
+        t4 = timer()
+
+        latencies['forget_point'].append(t1 - t0)
+        latencies['find_duplicate'].append(t2 - t1)
+        latencies['insert_point'].append(t3 - t2)
+        latencies['codisp'].append(t4 - t3)
+    return latencies
+
+
+def forest_ops(engine, data, trees, leaves, seq, ops, timer=timeit.default_timer):
+    """
+    Fill a forest through RRCF.anomaly_score, then time 'ops' more steps and calc_threshold over the scores.
+    :return:
+        - A Dictionary. Latency list by operation name.
+    """
+    rrcf_cls.rrcf = engine
+    try:
+        model = RRCF(num_trees=trees, sequences=seq, leaves_size=leaves)
+        points = shingled(data, seq)
+        for index in range(leaves):
+            model.anomaly_score(None, points[index % len(points)])
+
+        scores = {}
+        latencies = {'anomaly_score': [], 'calc_threshold': []}
+        for index in range(leaves, leaves + ops):
+            t0 = timer()
+            scores[index] = model.anomaly_score(None, points[index % len(points)])
+            latencies['anomaly_score'].append(timer() - t0)
+
+        for _ in range(max(ops // 10, 1)):
+            t0 = timer()
+            model.calc_threshold(scores, 0.99)
+            latencies['calc_threshold'].append(timer() - t0)
+
+        # [*]Rescoring the whole window: a codisp walk per leaf, and one pass per tree.
+        if hasattr(engine.RCTree, 'codisp_all'):
+            latencies['rescore_walk'] = []
+            latencies['rescore_pass'] = []
+            for _ in range(max(ops // 100, 1)):
+                t0 = timer()
+                for tree in model.forest:
+                    for key in tree.leaves:
+                        tree.codisp(key)
+                t1 = timer()
+                model.codisp_all()
+                latencies['rescore_walk'].append(t1 - t0)
+                latencies['rescore_pass'].append(timer() - t1)
+        return latencies
+    finally:
+        rrcf_cls.rrcf = rrcf
+
+
+def early_exit_ops(data, trees, leaves, seq, ops, seed, confidence, q=0.99, timer=timeit.default_timer):
+    """
+    Score the same points with and without early exit. The threshold is fixed to the q quantile of the warm-up
+    scores. Deferred tree updates are timed apart, as the detector applies them when it is idle.
+    Agreement compares each early decision with the mean of every tree of the same forest, computed untimed.
+    :return:
+        - A Dictionary. Latency list by case name.
+        - A Dictionary. Exit rate, mean scored trees and decision agreement with every tree.
+    """
+    points = shingled(data, seq)
+    latencies = {'score_full': [], 'score_early': [], 'deferred': []}
+    scored_trees = []
+    agree = []
+    for case, conf in [('score_full', 0), ('score_early', confidence)]:
+        np.random.seed(seed)
+        model = RRCF(num_trees=trees, sequences=seq, leaves_size=leaves)
+        warmup = {index: model.anomaly_score(None, points[index % len(points)]) for index in range(leaves)}
+        model.threshold = model.calc_threshold(warmup, q)
+        model.set_early_exit(conf, seed=seed)
+
+        for index in range(leaves, leaves + ops):
+            t0 = timer()
+            score = model.anomaly_score(None, points[index % len(points)])
+            latencies[case].append(timer() - t0)
+            if conf <= 0:
+                continue
+
+            t0 = timer()
+            model.flush_deferred()
+            latencies['deferred'].append(timer() - t0)
+
+            scored_trees.append(model.last_trees)
+            leaf = model.index_queue.indexList[-1]
+            full = np.mean([tree.codisp(leaf) for tree in model.forest])
+            agree.append((score >= model.threshold) == (full >= model.threshold))
+
+    scored_trees = np.asarray(scored_trees)
+    quality = {
+        'exit_rate': np.mean(scored_trees < trees),
+        'mean_trees': scored_trees.mean(),
+        'agreement': np.mean(agree)
+    }
+    return latencies, quality
+
+
+def sampling_ops(data, trees, leaves, seq, ops, seed, rate, q=0.99, timer=timeit.default_timer):
+    """
+    Score the same points with every tree updated and with sub-sampled updates.
+    :return:
+        - A Dictionary. Latency list by case name.
+        - A Dictionary. Updates per point, rank correlation with the full scores, spike recall and agreement.
+    """
+    points = shingled(data, seq)
+    # [*]Spikes of make_data('spiky') are 5 times the level or more.
+    spikes = np.array([points[index % len(points)][-1].max() > 2000 for index in range(leaves, leaves + ops)])
+    latencies = {}
+    scores = {}
+    updates = []
+    for case, r in [('score_full', 1.0), ('score_sampled', rate)]:
+        np.random.seed(seed)
+        model = RRCF(num_trees=trees, sequences=seq, leaves_size=leaves)
+        warmup = {index: model.anomaly_score(None, points[index % len(points)]) for index in range(leaves)}
+        threshold = model.calc_threshold(warmup, q)
+        model.set_sampling(r, seed=seed)
+
+        latencies[case] = []
+        scores[case] = []
+        for index in range(leaves, leaves + ops):
+            t0 = timer()
+            scores[case].append(model.anomaly_score(None, points[index % len(points)]))
+            latencies[case].append(timer() - t0)
+            if r < 1:
+                updates.append(model.last_updates)
+
+    full = np.asarray(scores['score_full'])
+    sampled = np.asarray(scores['score_sampled'])
+    ranks = [np.argsort(np.argsort(v)) for v in (full, sampled)]
+    quality = {
+        'updates': np.mean(updates),
+        'rank_corr': np.corrcoef(ranks[0], ranks[1])[0, 1],
+        'recall': np.mean(sampled[spikes] >= threshold) if spikes.any() else float('nan'),
+        'agreement': np.mean((full >= threshold) == (sampled >= threshold))
+    }
+    full_recall = np.mean(full[spikes] >= threshold) if spikes.any() else float('nan')
+    return latencies, quality, full_recall
+
+
+def gc_ops(engine, data, trees, leaves, seq, ops, freeze, timer=timeit.default_timer):
+    """
+    Build a forest through RRCF.anomaly_score, then time 'ops' more steps with the garbage collector watched.
+    :param freeze: A Boolean. gc.freeze() after the forest is built.
+    :return:
+        - A Dictionary. Latency list by case name.
+        - A Dictionary. Collections, total and max pause in ms, and objects freed by the collector.
+    """
+    pauses = []
+    collected = [0]
+    started = {}
+
+    def callback(phase, info):
+        if phase == 'start':
+            started['time'] = timer()
+        elif 'time' in started:
+            pauses.append(timer() - started.pop('time'))
+            collected[0] += info['collected']
+
+    rrcf_cls.rrcf = engine
+    gc.collect()
+    try:
+        model = RRCF(num_trees=trees, sequences=seq, leaves_size=leaves)
+        points = shingled(data, seq)
+        for index in range(leaves):
+            model.anomaly_score(None, points[index % len(points)])
+        if freeze:
+            gc.collect()
+            gc.freeze()
+
+        latencies = []
+        gc.callbacks.append(callback)
+        for index in range(leaves, leaves + ops):
+            t0 = timer()
+            model.anomaly_score(None, points[index % len(points)])
+            latencies.append(timer() - t0)
+    finally:
+        if callback in gc.callbacks:
+            gc.callbacks.remove(callback)
+        gc.unfreeze()
+        rrcf_cls.rrcf = rrcf
+
+    pauses = np.asarray(pauses) * 1e3
+    stats = {
+        'gc_count': len(pauses),
+        'gc_pause_ms': pauses.sum(),
+        'gc_max_ms': pauses.max() if len(pauses) else 0.0,
+        'gc_collected': collected[0]
+    }
+    return {'gc_frozen' if freeze else 'gc': latencies}, stats
+
+
+def peak_memory(func, *args):
+    """
+    Peak memory of a call in KB. The call is traced, so it is run apart from the timing pass.
+    """
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024
+
+
+def reference_scores(engine, data, trees, leaves, seq, ops, seed):
+    """
+    Scores of a scripted run on the same seed. Tree level CoDisp and RRCF scores.
+    """
+    points = shingled(data, seq)
+
+    np.random.seed(seed)
+    tree_codisp = []
+    tree = engine.RCTree()
+    for index in range(leaves + ops):
+        if index >= leaves:
+            tree.forget_point(index - leaves)
+        tree.insert_point(points[index % len(points)], index=index)
+        tree_codisp.append(tree.codisp(index))
+
+    np.random.seed(seed)
+    rrcf_cls.rrcf = engine
+    try:
+        model = RRCF(num_trees=trees, sequences=seq, leaves_size=leaves)
+        forest_codisp = [model.anomaly_score(None, points[index % len(points)]) for index in range(leaves + ops)]
+    finally:
+        rrcf_cls.rrcf = rrcf
+
+    return np.asarray(tree_codisp), np.asarray(forest_codisp)
+
+
+def check_equivalence(engine, dists, trees, leaves, seq, ops, seed, rtol):
+    """
+    Compare the scores of an engine with models/rrcf.py.
+    :return:
+        - A Boolean. True if every case matches.
+    """
+    ok = True
+    for dist in dists:
+        data = make_data(dist, leaves + ops + seq, seed)
+        ref_tree, ref_forest = reference_scores(rrcf, data, trees, leaves, seq, ops, seed)
+        alt_tree, alt_forest = reference_scores(engine, data, trees, leaves, seq, ops, seed)
+
+        for name, ref, alt in [('tree codisp', ref_tree, alt_tree), ('forest score', ref_forest, alt_forest)]:
+            same = ref.shape == alt.shape and np.allclose(ref, alt, rtol=rtol, atol=0, equal_nan=True)
+            if not same:
+                ok = False
+                diff = np.flatnonzero(~np.isclose(ref, alt, rtol=rtol, atol=0, equal_nan=True)) \
+                    if ref.shape == alt.shape else []
+                print("[!] {} {}: differs at {} of {} points (first: {})".format(
+                    dist, name, len(diff), len(ref), diff[0] if len(diff) else "shape"))
+            else:
+                print("[*] {} {}: same on {} points".format(dist, name, len(ref)))
+    return ok
+
+
+def run_early_exit(dists, trees_list, leaves_list, seqs, ops, seed, confidences):
+    rows = []
+    for dist in dists:
+        for seq in seqs:
+            for leaves in leaves_list:
+                data = make_data(dist, leaves + ops + seq, seed)
+                for trees in trees_list:
+                    for confidence in confidences:
+                        latencies, quality = early_exit_ops(data, trees, leaves, seq, ops, seed, confidence)
+                        for case, latency in latencies.items():
+                            row = dict(case=case, engine='models.rrcf', dist=dist, trees=trees, leaves=leaves,
+                                       seq=seq, peak_mem_kb=float('nan'), **summary(latency))
+                            if case != 'score_full':
+                                row.update(case='{}@{}'.format(case, confidence), **quality)
+                            rows.append(row)
+                        print("[*] {} seq={} leaves={} trees={} early exit {} is done.".format(
+                            dist, seq, leaves, trees, confidence), file=sys.stderr)
+    return rows
+
+
+def run_sampling(trees_list, leaves_list, seqs, ops, seed, rates):
+    rows = []
+    for seq in seqs:
+        for leaves in leaves_list:
+            data = make_data('spiky', leaves + ops + seq, seed)
+            for trees in trees_list:
+                for rate in rates:
+                    latencies, quality, full_recall = sampling_ops(data, trees, leaves, seq, ops, seed, rate)
+                    for case, latency in latencies.items():
+                        row = dict(case=case, engine='models.rrcf', dist='spiky', trees=trees, leaves=leaves, seq=seq,
+                                   peak_mem_kb=float('nan'), **summary(latency))
+                        if case == 'score_full':
+                            row.update(updates=trees, rank_corr=1.0, recall=full_recall, agreement=1.0)
+                        else:
+                            row.update(case='{}@{}'.format(case, rate), **quality)
+                        rows.append(row)
+                    print("[*] seq={} leaves={} trees={} sampling {} is done.".format(seq, leaves, trees, rate),
+                          file=sys.stderr)
+    return rows
+
+
+def run_gc(engines, dists, trees_list, leaves_list, seqs, ops, seed):
+    rows = []
+    for name, engine in engines:
+        for dist in dists:
+            for seq in seqs:
+                for leaves in leaves_list:
+                    data = make_data(dist, leaves + ops + seq, seed)
+                    for trees in trees_list:
+                        for freeze in (False, True):
+                            np.random.seed(seed)
+                            latencies, stats = gc_ops(engine, data, trees, leaves, seq, ops, freeze)
+                            for case, latency in latencies.items():
+                                rows.append(dict(case=case, engine=name, dist=dist, trees=trees, leaves=leaves,
+                                                 seq=seq, peak_mem_kb=float('nan'), **summary(latency), **stats))
+                        print("[*] {} {} seq={} leaves={} trees={} gc is done.".format(
+                            name, dist, seq, leaves, trees), file=sys.stderr)
+    return rows
+
+
+def run_cases(engine_name, engine, dists, trees_list, leaves_list, seqs, ops, seed, memory):
+    rows = []
+    for dist in dists:
+        for seq in seqs:
+            for leaves in leaves_list:
+                data = make_data(dist, leaves + ops + seq, seed)
+                points = shingled(data, seq)
+
+                np.random.seed(seed)
+                peak = peak_memory(tree_ops, engine, points, leaves, ops) if memory else float('nan')
+                np.random.seed(seed)
+                for case, latencies in tree_ops(engine, points, leaves, ops).items():
+                    rows.append(dict(case=case, engine=engine_name, dist=dist, trees=1, leaves=leaves, seq=seq,
+                                     peak_mem_kb=peak, **summary(latencies)))
+
+                for trees in trees_list:
+                    np.random.seed(seed)
+                    peak = peak_memory(forest_ops, engine, data, trees, leaves, seq, ops) if memory else float('nan')
+                    np.random.seed(seed)
+                    for case, latencies in forest_ops(engine, data, trees, leaves, seq, ops).items():
+                        rows.append(dict(case=case, engine=engine_name, dist=dist, trees=trees, leaves=leaves,
+                                         seq=seq, peak_mem_kb=peak, **summary(latencies)))
+                    print("[*] {} seq={} leaves={} trees={} is done.".format(dist, seq, leaves, trees),
+                          file=sys.stderr)
+    return rows
+
+
+def report(rows):
+    print("{:<15} {:<9} {:>6} {:>6} {:>4} {:>12} {:>10} {:>10} {:>10} {:>11}".format(
+        "CASE", "DIST", "TREES", "LEAVES", "SEQ", "OPS/SEC", "P50(us)", "P99(us)", "MAX(us)", "PEAK(KB)"))
+    for r in rows:
+        print("{:<15} {:<9} {:>6} {:>6} {:>4} {:>12.1f} {:>10.1f} {:>10.1f} {:>10.1f} {:>11.1f}".format(
+            r['case'], r['dist'], r['trees'], r['leaves'], r['seq'], r['ops_per_sec'], r['p50_us'], r['p99_us'],
+            r['max_us'], r['peak_mem_kb']))
+
+
+def report_early_exit(rows):
+    print("{:<20} {:<9} {:>6} {:>6} {:>4} {:>10} {:>10} {:>10} {:>11} {:>10}".format(
+        "CASE", "DIST", "TREES", "LEAVES", "SEQ", "P50(us)", "P99(us)", "EXIT RATE", "MEAN TREES", "AGREEMENT"))
+    for r in rows:
+        print("{:<20} {:<9} {:>6} {:>6} {:>4} {:>10.1f} {:>10.1f} {:>10} {:>11} {:>10}".format(
+            r['case'], r['dist'], r['trees'], r['leaves'], r['seq'], r['p50_us'], r['p99_us'],
+            "{:.3f}".format(r['exit_rate']) if 'exit_rate' in r else "-",
+            "{:.1f}".format(r['mean_trees']) if 'mean_trees' in r else "-",
+            "{:.4f}".format(r['agreement']) if 'agreement' in r else "-"))
+
+
+def report_sampling(rows):
+    print("{:<20} {:>6} {:>6} {:>4} {:>10} {:>10} {:>8} {:>10} {:>8} {:>10}".format(
+        "CASE", "TREES", "LEAVES", "SEQ", "P50(us)", "P99(us)", "UPDATES", "RANK CORR", "RECALL", "AGREEMENT"))
+    for r in rows:
+        print("{:<20} {:>6} {:>6} {:>4} {:>10.1f} {:>10.1f} {:>8.1f} {:>10.4f} {:>8.3f} {:>10.4f}".format(
+            r['case'], r['trees'], r['leaves'], r['seq'], r['p50_us'], r['p99_us'], r['updates'], r['rank_corr'],
+            r['recall'], r['agreement']))
+
+
+def report_gc(rows):
+    print("{:<24} {:<10} {:<9} {:>6} {:>6} {:>10} {:>10} {:>9} {:>12} {:>10} {:>12}".format(
+        "ENGINE", "CASE", "DIST", "TREES", "LEAVES", "P50(us)", "P99(us)", "GC COUNT", "GC PAUSE(ms)", "GC MAX(ms)",
+        "GC FREED"))
+    for r in rows:
+        print("{:<24} {:<10} {:<9} {:>6} {:>6} {:>10.1f} {:>10.1f} {:>9} {:>12.1f} {:>10.2f} {:>12}".format(
+            r['engine'], r['case'], r['dist'], r['trees'], r['leaves'], r['p50_us'], r['p99_us'], r['gc_count'],
+            r['gc_pause_ms'], r['gc_max_ms'], r['gc_collected']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro benchmarks of RCTree and RRCF.')
+    parser.add_argument('--trees', type=str, help='Comma separated number of trees.(Default: 20,80)',
+                        default='20,80')
+    parser.add_argument('--leaves', type=str, help='Comma separated leaf sizes.(Default: 256,864)',
+                        default='256,864')
+    parser.add_argument('--seq', type=str, help='Comma separated shingle sizes.(Default: 6)', default='6')
+    parser.add_argument('--dist', type=str, help='Comma separated data distributions.(Default: random,constant,spiky)',
+                        default='random,constant,spiky')
+    parser.add_argument('--ops', type=int, help='Timed operations per case.(Default: 500)', default=500)
+    parser.add_argument('--seed', type=int, help='Random seed.(Default: 0)', default=0)
+    parser.add_argument('--engine', type=str, help='Module of an alternative RCTree engine.(Default: None)',
+                        default=None)
+    parser.add_argument('--rtol', type=float, help='Relative tolerance of the score check.(Default: 1e-9)',
+                        default=1e-9)
+    parser.add_argument('--check_only', action='store_true', help='Only run the score check of the engine.')
+    parser.add_argument('--no_memory', action='store_true', help='Skip the peak memory pass.')
+    parser.add_argument('--early_exit', type=str, help='Comma separated confidences of the early exit to compare '
+                                                       'with the full forest. It replaces the other cases.'
+                                                       '(Default: None)', default=None)
+    parser.add_argument('--sampling', type=str, help='Comma separated rates of sub-sampled tree updates to compare '
+                                                     'with the full forest on spiky data. It replaces the other cases.'
+                                                     '(Default: None)', default=None)
+    parser.add_argument('--gc', action='store_true', help='Garbage collector pauses with and without gc.freeze(). '
+                                                          'It replaces the other cases.')
+    parser.add_argument('--out', type=str, help='Write the results to a CSV file.', default=None)
+    args = parser.parse_args()
+
+    trees_list = [int(v) for v in args.trees.split(",") if v]
+    leaves_list = [int(v) for v in args.leaves.split(",") if v]
+    seqs = [int(v) for v in args.seq.split(",") if v]
+    dists = [v for v in args.dist.split(",") if v]
+
+    rows = []
+    engines = []
+    if args.early_exit:
+        confidences = [float(v) for v in args.early_exit.split(",") if v]
+        rows = run_early_exit(dists, trees_list, leaves_list, seqs, args.ops, args.seed, confidences)
+        print("=" * 100)
+        report_early_exit(rows)
+    else:
+        engines = [('models.rrcf', rrcf)]
+
+    if args.sampling:
+        rates = [float(v) for v in args.sampling.split(",") if v]
+        rows = run_sampling(trees_list, leaves_list, seqs, args.ops, args.seed, rates)
+        print("=" * 100)
+        report_sampling(rows)
+        engines = []
+
+    if args.gc:
+        engines = [('models.rrcf', rrcf)]
+        if args.engine:
+            engines.append((args.engine, importlib.import_module(args.engine)))
+        rows = run_gc(engines, dists, trees_list, leaves_list, seqs, args.ops, args.seed)
+        print("=" * 100)
+        report_gc(rows)
+        engines = []
+
+    if args.engine and engines:
+        engine = importlib.import_module(args.engine)
+        if not check_equivalence(engine, dists, min(trees_list), min(leaves_list), min(seqs), args.ops, args.seed,
+                                 args.rtol):
+            print("[!] '{}' does not give the same scores as models/rrcf.py.".format(args.engine))
+            sys.exit(1)
+        if args.check_only:
+            return
+        engines.append((args.engine, engine))
+
+    for name, engine in engines:
+        rows += run_cases(name, engine, dists, trees_list, leaves_list, seqs, args.ops, args.seed,
+                          not args.no_memory)
+
+    for name, _ in engines:
+        print("=" * 100)
+        print(name)
+        report([r for r in rows if r['engine'] == name])
+
+    if args.out:
+        with open(args.out, "w") as file:
+            writer = csv.DictWriter(file, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -53,3 +53,15 @@ def run_dir():
 def backup_dir():
     return "{}/BACKUP/".format(mother_dir())
 
+
+
+def socket_dir():
+    return '{}/socket/'.format(management_dir())
+
+
+def socket_path(PGW_IP, SVC_TYPE):
+    return '{}{}_{}.sock'.format(socket_dir(), PGW_IP, SVC_TYPE)
+
+
+def metrics_dir():
+    return '{}/metrics/'.format(management_dir())
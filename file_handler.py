@@ -6,7 +6,6 @@
 @ Company: Ntels Co., Ltd
 """
 
-import pandas as pd
 import csv
 import glob
 import time
@@ -18,9 +17,13 @@ import utils.marker as mk
 import shutil
 import argparse
 
-from datetime import datetime, timedelta
+from datetime import date, datetime
 from utils.logger import FileLogger
 from utils.graceful_killer import GracefulKiller
+from utils.transport import SocketSender
+from utils.metrics import Metrics
+from utils.profiler import Profiler
+from utils.backpressure import read_loads
 
 
 class Clean(GracefulKiller):
@@ -32,24 +35,36 @@ class Clean(GracefulKiller):
         # raise SystemExit
 
 
-def file_handler(in_file):
+def file_handler(in_files):
     """
-    Read an original file and convert to trainable file. If finish converting, remove the original file.
-    :param in_file: A String. Input file path.
+    Read original files and convert to trainable files. If finish converting, remove the original files.
+    Several files are merged into one partition per detector.
+    :param in_files: A List. Input file paths.
     :return: None
     """
-    df = pd.read_csv(in_file, delimiter='|', header=None, names=['PGW_IP', 'DTmm', 'SVC_TYPE', 'UP', 'DN'],
-                     dtype={
-                         "PGW_IP": str,
-                         "DTmm": str,
-                         "SVC_TYPE": str,
-                         "UP": float,
-                         "DN": float
-                     })
+    import pandas as pd
+
+    frames = []
+    for in_file in in_files:
+        with metrics.time('parse_seconds', help_text="Parse time of an input file."):
+            frames.append(pd.read_csv(in_file, delimiter='|', header=None,
+                                      names=['PGW_IP', 'DTmm', 'SVC_TYPE', 'UP', 'DN'],
+                                      dtype={
+                                          "PGW_IP": str,
+                                          "DTmm": str,
+                                          "SVC_TYPE": str,
+                                          "UP": float,
+                                          "DN": float
+                                      }))
+        metrics.inc('files_total', help_text="Processed input files.")
+        metrics.inc('rows_total', len(frames[-1]), help_text="Processed input rows.")
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
 
     # Drop Empty Rows
-    elogger.warning("Empty filed data is occurred: \n{}".format(df[df.isnull().any(axis=1)]))
-    df = df.dropna()
+    empty = df.isnull().any(axis=1)
+    if empty.any():
+        elogger.warning("Empty filed data is occurred: \n%s", df[empty])
+        df = df.dropna()
 
     ip_addr = df['PGW_IP'].unique().tolist()
     svc_type = df['SVC_TYPE'].unique().tolist()
@@ -66,66 +81,107 @@ def file_handler(in_file):
 
             selected = df.loc[(df['PGW_IP'] == ip) & (df['SVC_TYPE'] == svc)]
 
-            selected = selected.sort_values(['DTmm']).reset_index(drop=True)
+            selected = selected.sort_values(['DTmm'], kind='stable').reset_index(drop=True)
             selected = selected.values.tolist()
 
             if len(selected) > 0:
-                # [*]Output file path
-                output_path = output_path + '{}.DAT'.format(datetime.now())
+                # [*]Hand the partition over through detector socket first, if it is enabled.
+                sent = 0
+                if sender is not None:
+                    sent = sender.send(fp.socket_path(ip, svc), selected)
+                    metrics.inc('socket_rows_total', sent, help_text="Rows handed over through detector sockets.")
+                    logger.info("Sent to detector socket: %s:%s (%s/%s rows)", ip, svc, sent, len(selected))
+
+                if sent < len(selected):
+                    # [*]Spill the rest into the file protocol.
+                    with metrics.time('write_seconds', help_text="Write time of a detector input file."):
+                        write_partition(output_path, selected[sent:])
+                logger.debug("%s :: %s", svc, selected)
+            else:
+                logger.info("Service type doesn't have any data: %s", svc)
 
-                with open(output_path, 'w') as out:
-                    writer = csv.writer(out, delimiter='|')
-                    for s in selected:
-                        writer.writerow(s)
+    for in_file in in_files:
+        # [*]Log
+        logger.info("Job is finished: %s", in_file)
 
-                with open(output_path + ".INFO", "w") as out:
-                    out.write("")
+        # [*]copy the file into backup directory.
+        file_name = in_file.split("/")[-1]
+        shutil.copyfile(in_file, fp.backup_dir()+file_name)
+        logger.debug("%s File is backed up into \'%s\'", file_name, fp.backup_dir())
 
-                # [*]Log
-                logger.info("Successfully write the file: {}".format(output_path))
-                logger.debug("Successfully write the info file: {}".format(output_path + ".INFO"))
-                logger.debug("{} :: {}".format(svc, selected))
-            else:
-                logger.info("Service type doesn't have any data: {}".format(svc))
+        # [*]If clearly finished, remove original file.
+        os.remove(in_file)
+        logger.debug("Files are deleted successfully: %s", in_file)
+
+
+def write_partition(output_dir, rows):
+    """
+    Write partitioned rows as a .DAT file and its .INFO marker.
+    :param output_dir: A String. Input directory of the anomaly detector.
+    :param rows: A List. Rows to write.
+    :return: None
+    """
+    # [*]Output file path
+    output_path = output_dir + '{}.DAT'.format(datetime.now())
+
+    with open(output_path, 'w') as out:
+        writer = csv.writer(out, delimiter='|')
+        for r in rows:
+            writer.writerow(r)
+
+    with open(output_path + ".INFO", "w") as out:
+        out.write("")
 
     # [*]Log
-    logger.info("Job is finished: {}".format(in_file))
+    logger.info("Successfully write the file: %s", output_path)
+    logger.debug("Successfully write the info file: %s", output_path + ".INFO")
 
-    # [*]copy the file into backup directory.
-    file_name = in_file.split("/")[-1]
-    shutil.copyfile(in_file, fp.backup_dir()+file_name)
-    logger.debug("{} File is backed up into \'{}\'".format(file_name, fp.backup_dir()))
 
-    # [*]If clearly finished, remove original file.
-    os.remove(in_file)
-    logger.debug("Files are deleted successfully: {}".format(in_file))
+def check_backpressure():
+    """
+    Switch the input batching by the loads published by detectors.
+    :return:
+        - A Boolean. True if input files are batched.
+    """
+    global batching
+
+    if batch_backlog <= 0:
+        return False
+
+    loads = read_loads(fp.run_dir())
+    behind = [n for n, load in loads.items() if load['backlog'] >= batch_backlog or load['degraded']]
+    if bool(behind) != batching:
+        batching = bool(behind)
+        metrics.inc('batching_transitions_total', help_text="Transitions of the input batching.",
+                    to='on' if batching else 'off')
+        logger.warning("Input batching is %s. (detectors behind: %s of %s, e.g. %s)",
+                       'on' if batching else 'off', len(behind), len(loads), behind[:5])
+    metrics.set('batching', int(batching), help_text="Input batching by backpressure. (1: on)")
+    metrics.set('detectors_behind', len(behind), help_text="Detectors over the backlog limit or degraded.")
+    return batching
 
 
 def main():
-    global today, tomorrow
     global logger, elogger
     global LOG_LEVEL, ID
 
     while not killer.kill_now:
         # [*]If file doesn't exist, make one.
         directory_check()
-        # [*]If Day pass by create a new log file.
-        today = datetime.now().date()
-        if today >= tomorrow:
-            tomorrow = today + timedelta(days=1)
-
-            # [*]Log handler updates
-            update_log_path = fp.log_dir() + 'file_handler_{}.log'.format(today)
-            update_elog_path = fp.log_dir() + 'file_handler_error_{}.log'.format(today)
-
-            logger = FileLogger('file_handler_info', log_path=update_log_path, level=LOG_LEVEL).get_instance()
-            elogger = FileLogger('file_handler_error', log_path=update_elog_path, level='WARNING').get_instance()
-
+        profiler.tick()
         try:
             # [*]File read & check
             info_list = glob.glob(fp.original_input_path() + '*.INFO')
+            metrics.set('queue_depth', len(info_list), help_text="Pending input files.")
+
+            # [*]While detectors are behind, input files are held until a batch is ready, and merged.
+            merge = check_backpressure()
+            if merge and info_list and len(info_list) < batch_files and \
+                    time.time() - min(os.path.getmtime(il) for il in info_list) < batch_wait:
+                info_list = []
+
             if info_list:
-                logger.debug("Info files: {}".format(info_list))
+                logger.debug("Info files: %s", info_list)
                 stime = timeit.default_timer()
                 file = []
                 for il in info_list:
@@ -133,25 +189,33 @@ def main():
                     temp = il[:-5]
                     file.append(temp)
                 file = sorted(file)
-                logger.debug("Loaded files: {}".format(file))
+                logger.debug("Loaded files: %s", file)
 
-                for f in file:
-                    file_handler(f)
+                if merge:
+                    file_handler(file)
+                else:
+                    for f in file:
+                        file_handler([f])
 
                 for il in info_list:
                     # [*]If clearly finished, remove original file.
                     os.remove(il)
-                logger.debug("Info files are removed: {}".format(info_list))
+                logger.debug("Info files are removed: %s", info_list)
                 etime = timeit.default_timer()
-                logger.info("Main job's running time: {}".format(etime-stime))
+                logger.info("Main job's running time: %s", etime-stime)
+                metrics.observe('cycle_seconds', etime - stime, help_text="Time to process a batch of input files.")
+            metrics.flush()
             time.sleep(1)
         except Exception:
             # [*]Log the errors.
             elogger.error(traceback.format_exc())
             os.remove(fp.run_dir() + "file_handler.run")
-            mk.debug_info("file_handler didn't work properly. Check your error log: {}".format(elog_path))
+            mk.debug_info("file_handler didn't work properly. Check your error log: {}"
+                          .format(elog_path.format(date.today())))
             raise SystemExit
 
+    metrics.flush(force=True)
+
 
 def directory_check():
     # [*]If file doesn't exist, make one.
@@ -176,7 +240,13 @@ def directory_check():
         mk.debug_info("BACKUP dir is not exist create one - {}".format(fp.backup_dir()), "INFO")
 
 
-if __name__ == '__main__':
+def parse_args(argv=None):
+    """
+    Parse command line arguments.
+    :param argv: A List. Arguments to parse. (Default: sys.argv)
+    :return:
+        - An argparse Namespace.
+    """
     parser = argparse.ArgumentParser(description='CDR output handler module.')
 
     # [*]Mandatory parameter.
@@ -184,20 +254,52 @@ if __name__ == '__main__':
 
     # [*]Hyper parameters.
     parser.add_argument('--log', type=str, help='Set the log level', default="INFO")
-    args = parser.parse_args()
+    parser.add_argument('--transport', type=str, choices=['file', 'socket'], default='file',
+                        help='Handoff to detectors. \'socket\' falls back to files if detector is down.(Default: file)')
+
+    # [*]Backpressure parameters.
+    parser.add_argument('--batch_backlog', type=int, help='Batch input files while a detector has this many pending '
+                                                          'files or is degraded. e.g. 5(Default: 0, no batching)',
+                        default=0)
+    parser.add_argument('--batch_files', type=int, help='Input files merged into a batch.(Default: 10)', default=10)
+    parser.add_argument('--batch_wait', type=float, help='Max seconds an input file is held for a batch.(Default: 10)',
+                        default=10)
+
+    return parser.parse_args(argv)
+
+
+def run(args):
+    """
+    Entry point of the file handler process. It is called by __main__ or by a forked supervisor child.
+    :param args: An argparse Namespace. Parsed by parse_args.
+    :return: None.
+    """
+    global LOG_LEVEL, sender, metrics
+    global batch_backlog, batch_files, batch_wait, batching
+    global logger, elogger, log_path, elog_path
+    global killer, profiler
 
     fp.IDX = args.id
     LOG_LEVEL = args.log
 
+    # [*]Backpressure from detectors.
+    batch_backlog = args.batch_backlog
+    batch_files = args.batch_files
+    batch_wait = args.batch_wait
+    batching = False
+
+    # [*]In-memory transport to detectors.
+    sender = SocketSender() if args.transport == 'socket' else None
+
+    # [*]Stage metrics. Written into the metrics directory of the processor.
+    metrics = Metrics('file_handler', {'stage': 'file_handler'})
+
     # [*]If file doesn't exist, make one.
     directory_check()
 
-    # [*]Every day logging in different fie.
-    today = datetime.now().date()
-    tomorrow = today + timedelta(days=1)
-
-    log_path = fp.log_dir() + 'file_handler_{}.log'.format(today)
-    elog_path = fp.log_dir() + 'file_handler_error_{}.log'.format(today)
+    # [*]Every day logging in different fie. '{}' is replaced by the date and rotates daily.
+    log_path = fp.log_dir() + 'file_handler_{}.log'
+    elog_path = fp.log_dir() + 'file_handler_error_{}.log'
 
     '''
         - logger; Informative logger.
@@ -218,7 +320,12 @@ if __name__ == '__main__':
     '''
     killer = Clean()
 
+    # [*]On-demand profiling by SIGUSR1 or 'file_handler.profile' in the running directory.
+    profiler = Profiler('file_handler', fp.run_dir(), fp.log_dir(), logger)
+
     mk.debug_info("file_handler start running.")
     main()
 
 
+if __name__ == '__main__':
+    run(parse_args())
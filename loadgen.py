@@ -0,0 +1,159 @@
+"""
+@ File name: loadgen.py
+@ Version: 1.0.0
+@ Last update: 2026.OCT.19
+@ Company: Ntels Co., Ltd
+
+Synthetic CDR load generator.
+Every simulated minute is written as one 'PGW_IP|DTmm|SVC_TYPE|UP|DN' file with its .INFO marker
+into SVCTYPE_{IDX}/INPUT, the same way as the upstream system hands files to file_handler.
+    - Traffic follows a daily curve per series, with multiplicative noise.
+    - Anomalies (spikes and drops) are injected at a given rate, and listed in a ground truth file.
+
+Usage:
+    python3 loadgen.py --id 1 --ips 10 --svcs 8 --speed 1 --minutes 1440
+"""
+import os
+import csv
+import time
+import argparse
+import numpy as np
+import config.file_path as fp
+import utils.marker as mk
+
+from datetime import datetime, timedelta
+
+DTMM_FORMAT = "%Y%m%d%H%M"
+
+
+class CdrGenerator(object):
+    def __init__(self, num_ips, num_svcs, anomaly_rate=0.001, seed=None):
+        """
+        Per minute CDR rows of num_ips x num_svcs series.
+        :param num_ips: An Integer. Number of P-gateways.
+        :param num_svcs: An Integer. Number of service types per P-gateway.
+        :param anomaly_rate: A Float. Probability of an injected anomaly per series and minute.
+        :param seed: An Integer. Random seed.
+        """
+        self.rng = np.random.RandomState(seed)
+        self.ips = ["10.{}.{}.{}".format(i // 65536 % 256, i // 256 % 256, i % 256 + 1) for i in range(num_ips)]
+        self.svcs = [str(s + 1) for s in range(num_svcs)]
+        self.anomaly_rate = anomaly_rate
+
+        n = num_ips * num_svcs
+        # [*]Series level scale, daily amplitude and peak hour.
+        self.scale = self.rng.lognormal(np.log(1e6), 1.0, size=(n, 2))
+        self.amplitude = self.rng.uniform(0.3, 0.8, size=(n, 1))
+        self.peak = self.rng.uniform(18 * 60, 22 * 60, size=(n, 1))
+        self.noise = self.rng.uniform(0.02, 0.1, size=(n, 1))
+
+    def rows(self, minute):
+        """
+        Rows of a minute.
+        :param minute: A datetime object. Minute to generate.
+        :return:
+            - rows: A List. [PGW_IP, DTmm, SVC_TYPE, UP, DN] rows.
+            - anomalies: A List. (PGW_IP, SVC_TYPE, kind) of injected anomalies.
+        """
+        n = len(self.ips) * len(self.svcs)
+        minute_of_day = minute.hour * 60 + minute.minute
+        daily = 1 + self.amplitude * np.cos(2 * np.pi * (minute_of_day - self.peak) / 1440)
+        values = self.scale * daily * self.rng.lognormal(0, self.noise, size=(n, 2))
+
+        anomalies = []
+        injected = np.flatnonzero(self.rng.random_sample(n) < self.anomaly_rate)
+        for i in injected:
+            if self.rng.random_sample() < 0.5:
+                values[i] *= self.rng.uniform(3, 10)
+                kind = 'spike'
+            else:
+                values[i] *= self.rng.uniform(0, 0.1)
+                kind = 'drop'
+            anomalies.append((self.ips[i // len(self.svcs)], self.svcs[i % len(self.svcs)], kind))
+
+        dtmm = minute.strftime(DTMM_FORMAT)
+        rows = []
+        for i, (up, dn) in enumerate(np.round(values, 1)):
+            rows.append([self.ips[i // len(self.svcs)], dtmm, self.svcs[i % len(self.svcs)], up, dn])
+        return rows, anomalies
+
+    def detectors(self):
+        """
+        (ip, svc) of every series.
+        """
+        return [(ip, svc) for ip in self.ips for svc in self.svcs]
+
+
+def write_input(rows, minute, input_dir=None):
+    """
+    Write rows into the original input directory, data file first and then its .INFO marker.
+    :param rows: A List. Rows to write.
+    :param minute: A datetime object. Minute of the rows.
+    :param input_dir: A String. (Default: fp.original_input_path())
+    :return:
+        - A String. Data file path.
+    """
+    input_dir = input_dir or fp.original_input_path()
+    path = input_dir + "CDR.{}.DAT".format(minute.strftime("%Y%m%d_%H%M"))
+
+    temp = path + ".tmp"
+    with open(temp, "w", newline="") as file:
+        writer = csv.writer(file, delimiter='|')
+        writer.writerows(rows)
+    os.replace(temp, path)
+
+    with open(path + ".INFO", "w") as file:
+        file.write("")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Synthetic CDR load generator.')
+    parser.add_argument('--id', type=str, help='ID of ML processor', default="main")
+    parser.add_argument('--ips', type=int, help='Number of P-gateways.(Default: 10)', default=10)
+    parser.add_argument('--svcs', type=int, help='Number of service types per P-gateway.(Default: 8)', default=8)
+    parser.add_argument('--speed', type=float, help='Simulated minutes per second. 0 is as fast as possible.'
+                                                    '(Default: 1)', default=1)
+    parser.add_argument('--minutes', type=int, help='Number of minutes to generate.(Default: 1440)', default=1440)
+    parser.add_argument('--start', type=str, help='First minute, YYYYmmddHHMM.(Default: 201908010000)',
+                        default='201908010000')
+    parser.add_argument('--anomaly_rate', type=float, help='Anomaly probability per series and minute.'
+                                                           '(Default: 0.001)', default=0.001)
+    parser.add_argument('--seed', type=int, help='Random seed.(Default: 0)', default=0)
+    parser.add_argument('--truth', type=str, help='Ground truth file of injected anomalies.(Default: None)',
+                        default=None)
+    args = parser.parse_args()
+
+    fp.IDX = args.id
+    if not os.path.exists(fp.original_input_path()):
+        os.makedirs(fp.original_input_path())
+
+    generator = CdrGenerator(args.ips, args.svcs, anomaly_rate=args.anomaly_rate, seed=args.seed)
+    start = datetime.strptime(args.start, DTMM_FORMAT)
+    truth = open(args.truth, "w") if args.truth else None
+
+    mk.debug_info("Generating {} minutes of {} series into {}".format(
+        args.minutes, len(generator.detectors()), fp.original_input_path()))
+    stime = time.time()
+    try:
+        for m in range(args.minutes):
+            minute = start + timedelta(minutes=m)
+            rows, anomalies = generator.rows(minute)
+            write_input(rows, minute)
+            if truth:
+                for ip, svc, kind in anomalies:
+                    truth.write("{}|{}|{}|{}\n".format(ip, minute.strftime(DTMM_FORMAT), svc, kind))
+
+            if args.speed > 0:
+                delay = stime + (m + 1) / args.speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+    finally:
+        if truth:
+            truth.close()
+
+    mk.debug_info("{} minutes are written in {:.1f}s".format(args.minutes, time.time() - stime))
+
+
+if __name__ == '__main__':
+    main()
@@ -9,7 +9,10 @@
 import json
 import csv
 import os
+import time
+import numpy as np
 import config.file_path as fp
+import utils.marker as marker
 
 from models.rrcf_cls import RRCF
 from utils.queue import Queue
@@ -27,7 +30,7 @@ class AnomalyDetector(object):
         4) Writing a result in file.
     """
 
-    def __init__(self, num_trees, leaves_size, sequences, quantile=0.99, ip='Unknown', svc_type='Unknown'):
+    def __init__(self, num_trees, leaves_size, sequences, quantile=0.99, ip='Unknown', svc_type='Unknown', stride=1):
         """
         Initialize the rrcf module, maximum threshold duration, and quantile value.
         :param num_trees: An integer. The number of trees.
@@ -36,11 +39,15 @@ class AnomalyDetector(object):
         :param quantile: An float. Quantile value.
         :param ip: A String. IP address of p-gateway.
         :param svc_type: A String. Service type.
+        :param stride: An integer. Minutes between scored points.
         """
         # [*]Create RRCF realtime detection object.
-        self.rrcf = RRCF(num_trees, sequences, leaves_size)
+        self.rrcf = RRCF(num_trees, sequences, leaves_size, stride=stride)
         # [*]Update duration of threshold value.
         self.max_threshold_duration = sequences * 24 * 60 * 30  # 30 days sequences = (24 hours * 60 minutes * 30 days)
+        self.max_threshold_duration //= stride
+        # [*]Minutes skipped since the last scored one. The first minute is scored.
+        self.skipped = stride - 1
         # [*]Collecting anomaly scores
         self.anomaly_score = []
         # [*]Anomaly counter queue
@@ -52,25 +59,105 @@ class AnomalyDetector(object):
         self.ip = ip
         self.svc_type = svc_type
 
-    def compute_anomaly_score(self, date, data, output_path, dlogger):
+    def set_stride(self, stride=1):
+        """
+        Score every 'stride' minutes. Minutes in between only move the window, and write an empty output.
+        Threshold and anomaly queue only see the scored points, so the anomaly queue spans 'sequences' scored points,
+        and the threshold duration is kept at 30 days.
+        :param stride: An integer. Minutes between scored points. (1: every minute)
+        :return: None
+        """
+        if stride < 1:
+            marker.debug_info("Stride should be range in 1 <= stride", m_type="ERROR")
+            raise SystemExit
+        self.rrcf.stride = stride
+        self.max_threshold_duration = self.rrcf.sequences * 24 * 60 * 30 // stride
+        self.skipped = min(getattr(self, 'skipped', stride - 1), stride - 1)
+
+    def due(self):
+        """
+        :return:
+            - A Boolean. True if the next minute is scored.
+        """
+        return getattr(self, 'skipped', 0) >= getattr(self.rrcf, 'stride', 1) - 1
+
+    def compute_anomaly_score(self, date, data, output_path, dlogger, metrics=None):
         """
         Calculate anomaly score, calculate threshold, and determine anomaly.
         :param date: A numpy array. Date and time of input training data.
         :param data: A numpy array. Input training data.
-        :param output_path: A String. The path of output result.
-        :return: None.
+        :param output_path: A String. The path of output result. (None: not written, e.g. WAL replay)
+        :param metrics: A Metrics object. Records score, threshold and write time. (None: not recorded)
+        :return:
+            - A Boolean. False if the minute is skipped by the stride.
         """
+        # [*]Minutes between strides. An empty output still tells output handler that the minute is done.
+        if not self.due():
+            self.skipped = getattr(self, 'skipped', 0) + 1
+            self._write_output(output_path, [], dlogger)
+            if metrics is not None:
+                metrics.inc('skipped_minutes_total', help_text="Minutes not scored by the stride.")
+            return False
+        self.skipped = 0
 
         # [*]Calculate the anomaly score.
-        r = self.rrcf.anomaly_score(date, data, with_date=True)
+        stime = time.perf_counter()
+        r = self.rrcf.anomaly_score(date, self._features(data), with_date=True)
         self.anomaly_score.append(r)
+        score_time = time.perf_counter()
 
         # [*]Calculate threshold.
         self._calculate_threshold()
+        threshold_time = time.perf_counter()
 
         # [*]Determine anomaly.
         output_result = self._determine_anomaly()
 
+        # [*]log the result
+        dlogger.info("%s", output_result)
+
+        # [*]Write the result in a file.
+        self._write_output(output_path, self._result_rows(date, data, output_result), dlogger)
+
+        if metrics is not None:
+            etime = time.perf_counter()
+            metrics.observe('score_seconds', score_time - stime, help_text="RRCF scoring time of a point.")
+            metrics.observe('threshold_seconds', threshold_time - score_time, help_text="Threshold update time.")
+            metrics.observe('write_seconds', etime - threshold_time, help_text="Anomaly decision and output time.")
+
+            # [*]Early exit rate is early_exits_total / points_scored_total.
+            trees = getattr(self.rrcf, 'last_trees', None)
+            if trees is not None:
+                metrics.inc('points_scored_total', help_text="Points scored with early exit enabled.")
+                metrics.inc('trees_scored_total', trees, help_text="Trees scored with early exit enabled.")
+                if trees < (getattr(self.rrcf, 'active_trees', None) or self.rrcf.num_trees):
+                    metrics.inc('early_exits_total', help_text="Points scored by a part of the trees.")
+            updates = getattr(self.rrcf, 'last_updates', None)
+            if updates is not None:
+                metrics.inc('tree_updates_total', updates, help_text="Tree updates with sub-sampling enabled.")
+        return True
+
+    def assemble(self, rows):
+        """
+        Input records as the minutes to score. Records of a single service detector are the minutes themselves.
+        :param rows: A numpy array. [PGW_IP, DTmm, SVC_TYPE, UP, DN] records.
+        :return:
+            - A numpy array. [PGW_IP, DTmm, SVC_TYPE, values...] minutes.
+        """
+        return rows
+
+    def _features(self, data):
+        """
+        RRCF input of the window.
+        """
+        return data
+
+    def _result_rows(self, date, data, output_result):
+        """
+        Output rows of a scored minute.
+        :return:
+            - A List of rows.
+        """
         if output_result['percentage'] == 'observing':
             final_result = [self.ip, date[-1], self.svc_type, data[-1][0], data[-1][1],
                             output_result['score'], output_result['estimate']]
@@ -80,19 +167,26 @@ class AnomalyDetector(object):
         else:
             final_result = [self.ip, date[-1], self.svc_type, data[-1][0], data[-1][1],
                             output_result['score'], output_result['estimate'], output_result['percentage'][-1]]
+        return [final_result]
 
-        # [*]log the result
-        dlogger.info(output_result)
+    def _write_output(self, output_path, rows, dlogger):
+        """
+        Write the result of a minute.
+        :param output_path: A String. The path of output result. (None: not written)
+        :param rows: A List of rows. (Empty: a heartbeat of the minute)
+        :return: None
+        """
+        if output_path is None:
+            return
 
-        # [*]Write the result in a file.
         with open(output_path, 'w') as file:
             csv_writer = csv.writer(file, delimiter='|')
-            csv_writer.writerow(final_result)
-            dlogger.debug("{} is written successfully.".format(output_path))
+            csv_writer.writerows(rows)
+            dlogger.debug("%s is written successfully.", output_path)
 
         with open(output_path + ".INFO", 'w') as file:
             file.write("")
-            dlogger.debug("{} is written successfully.".format(output_path+".INFO"))
+            dlogger.debug("%s is written successfully.", output_path+".INFO")
 
     def _calculate_threshold(self):
         """
@@ -203,3 +297,79 @@ class AnomayQueue(Queue):
         p = round(anomaly_counter / base, 3)
         percentage = [self.indexList[0][0], self.indexList[-1][0], p]
         return percentage
+
+
+class JointAnomalyDetector(AnomalyDetector):
+    """
+    One forest over the services of a p-gateway (or a family of them), instead of one forest per service.
+    A minute is the combined [UP, DN, UP, DN, ...] vector of the services, in log scale so that a small service
+    can still get cuts. The score of a minute is attributed to each service by the cut dimensions,
+    and every service gets its own output row.
+    """
+
+    def __init__(self, num_trees, leaves_size, sequences, services, quantile=0.99, ip='Unknown', group='JOINT',
+                 stride=1, hold=2):
+        """
+        :param services: A List. Service types of the forest, in the order of the vector.
+        :param group: A String. Name of the group. It takes the place of the service type of the detector.
+        :param hold: An integer. Minutes waiting for every service, before a minute is scored with the last values
+            of the missing services.
+        """
+        super().__init__(num_trees, leaves_size, sequences, quantile=quantile, ip=ip, svc_type=group, stride=stride)
+        self.services = list(services)
+        self.hold = hold
+        # [*]DTmm -> {svc: [UP, DN]}, minutes waiting for the other services.
+        self.pending = {}
+        self.last_minute = None
+        self.last_values = {svc: [0.0, 0.0] for svc in self.services}
+
+    def assemble(self, rows):
+        """
+        Combine the records of the services into minutes, in DTmm order.
+        A minute is ready once every service has it, or once more than 'hold' minutes are waiting.
+        Records of a minute that is already scored are dropped.
+        :param rows: A numpy array. [PGW_IP, DTmm, SVC_TYPE, UP, DN] records.
+        :return:
+            - A numpy array. [PGW_IP, DTmm, group, UP, DN, UP, DN, ...] minutes.
+        """
+        for r in rows:
+            dtmm = str(r[1])
+            if r[2] not in self.last_values or (self.last_minute is not None and dtmm <= self.last_minute):
+                continue
+            self.pending.setdefault(dtmm, {})[r[2]] = [float(r[3]), float(r[4])]
+
+        minutes = []
+        for dtmm in sorted(self.pending):
+            values = self.pending[dtmm]
+            if len(values) < len(self.services) and len(self.pending) <= self.hold:
+                break
+            del self.pending[dtmm]
+            self.last_minute = dtmm
+
+            row = [self.ip, dtmm, self.svc_type]
+            for svc in self.services:
+                self.last_values[svc] = values.get(svc, self.last_values[svc])
+                row.extend(self.last_values[svc])
+            minutes.append(row)
+        return np.array(minutes, dtype=object).reshape(len(minutes), 3 + 2 * len(self.services))
+
+    def _features(self, data):
+        return np.log1p(np.maximum(data, 0))
+
+    def _result_rows(self, date, data, output_result):
+        """
+        A row per service. The score is the share of the service in the CoDisp of the minute, and the service is
+        anomalous if the minute is, and its share of the score is at least its share of the threshold.
+        """
+        shares = self.rrcf.attribution(self._features(data), 2 * len(self.services))
+        rows = []
+        for k, svc in enumerate(self.services):
+            score = output_result['score'] * (shares[2 * k] + shares[2 * k + 1])
+            estimate = output_result['estimate']
+            if estimate == 'Anomaly' and score < self.rrcf.threshold / len(self.services):
+                estimate = 'Normal'
+            row = [self.ip, date[-1], svc, data[-1][2 * k], data[-1][2 * k + 1], score, estimate]
+            if isinstance(output_result['percentage'], list):
+                row.append(output_result['percentage'][-1])
+            rows.append(row)
+        return rows
@@ -1,3 +1,4 @@
+import weakref
 import numpy as np
 
 
@@ -106,6 +107,67 @@ class RCTree:
             # Set bboxes of all branches
             self._get_bbox_top_down(self.root)
 
+    @classmethod
+    def from_points(cls, X, index_labels, random_state=None):
+        """
+        Builds a tree from a batch of points, as __init__ does, but each cut only
+        looks at the points under it, instead of masking the whole dataset.
+
+        Parameters:
+        -----------
+        X: np.ndarray (n x d)
+           Array containing n data points, each with dimension d.
+        index_labels: sequence of length n
+                      Index labels of the points. Duplicate points share a leaf.
+        random_state: int, RandomState instance or None (optional) (default=None)
+                      Random number generator of the tree.
+
+        Returns:
+        --------
+        tree: RCTree
+              Tree containing every point.
+        """
+        tree = cls(random_state=random_state)
+        index_labels = list(index_labels)
+        if not index_labels:
+            return tree
+        X = np.asarray(X, dtype=np.float64).reshape(len(index_labels), -1)
+        U, I, N = np.unique(X, return_inverse=True, return_counts=True, axis=0)
+        I = np.asarray(I).ravel()
+        tree.ndim = U.shape[1]
+        leaves = [None] * U.shape[0]
+        # Iterative pre-order construction: (points under node, parent, side, depth)
+        stack = [(np.arange(U.shape[0]), None, 'root', 0)]
+        while stack:
+            S, parent, side, depth = stack.pop()
+            if S.shape[0] == 1:
+                k = S[0]
+                node = Leaf(i=None, d=depth, u=parent, x=U[k].copy(), n=int(N[k]))
+                leaves[k] = node
+            else:
+                Y = U[S]
+                xmin = Y.min(axis=0)
+                xmax = Y.max(axis=0)
+                l = xmax - xmin
+                q = int(tree.rng.choice(tree.ndim, p=l / l.sum()))
+                p = float(tree.rng.uniform(xmin[q], xmax[q]))
+                node = Branch(q=q, p=p, u=parent, n=int(N[S].sum()),
+                              b=np.vstack([xmin, xmax]))
+                left = Y[:, q] <= p
+                stack.append((S[~left], node, 'r', depth + 1))
+                stack.append((S[left], node, 'l', depth + 1))
+            if parent is None:
+                tree.root = node
+            else:
+                setattr(parent, side, node)
+        # Index of a leaf is the first label of its point
+        for label, k in zip(index_labels, I.tolist()):
+            leaf = leaves[k]
+            if leaf.i is None:
+                leaf.i = label
+            tree.leaves[label] = leaf
+        return tree
+
     def __repr__(self):
         depth = ""
         treestr = ""
@@ -440,10 +502,11 @@ class RCTree:
         # If tree has points and point is not a duplicate, continue with main algorithm...
         node = self.root
         parent = node.u
-        maxdepth = max([leaf.d for leaf in self.leaves.values()])
         depth = 0
         branch = None
-        for _ in range(maxdepth + 1):
+        # A cut is always found at the latest on the leaf the point falls into,
+        # so the walk is bounded without scanning every leaf for the max depth.
+        while True:
             bbox = node.b
             cut_dimension, cut = self._insert_point_cut(point, bbox)
             if cut <= bbox[0, cut_dimension]:
@@ -628,6 +691,139 @@ class RCTree:
         co_displacement = max(results)
         return co_displacement
 
+    def codisp_all(self):
+        """
+        Compute collusive displacement of every leaf in one top-down pass.
+        The CoDisp of a leaf is the max of sibling.n / node.n over the nodes on
+        its path, so the running max is carried down from the root instead of
+        walking up from each leaf. O(n) per tree, instead of O(n * depth).
+
+        Returns:
+        --------
+        codisplacements: dict
+                         Collusive displacement by index of leaf.
+
+        Example:
+        --------
+        # Create RCTree
+        >>> X = np.random.randn(100, 2)
+        >>> tree = rrcf.RCTree(X)
+
+        # Same as tree.codisp(i) for each leaf
+        >>> scores = tree.codisp_all()
+        """
+        if self.root is None:
+            return {}
+        by_leaf = {}
+        stack = [(self.root, 0)]
+        while stack:
+            node, running = stack.pop()
+            if isinstance(node, Leaf):
+                by_leaf[id(node)] = running
+                continue
+            left, right = node.l, node.r
+            stack.append((left, max(running, right.n / left.n)))
+            stack.append((right, max(running, left.n / right.n)))
+        return {key: by_leaf[id(leaf)] for key, leaf in self.leaves.items()}
+
+    def codisp_cut(self, leaf):
+        """
+        Compute collusive displacement at leaf, and the dimension of the cut
+        that separates the colluding subtree from its sibling. That cut is the
+        one which isolates the point, so its dimension explains the score.
+
+        Parameters:
+        -----------
+        leaf: index of leaf or Leaf instance
+
+        Returns:
+        --------
+        codisplacement: float
+                        Collusive displacement if leaf is removed.
+        dimension: int
+                   Cut dimension of the max displacement (None if leaf is root)
+        """
+        if not isinstance(leaf, Leaf):
+            try:
+                leaf = self.leaves[leaf]
+            except KeyError:
+                raise KeyError(
+                    'leaf must be a Leaf instance or key to self.leaves')
+        # Handle case where leaf is root
+        if leaf is self.root:
+            return 0, None
+        node = leaf
+        co_displacement = None
+        dimension = None
+        for _ in range(node.d):
+            parent = node.u
+            if parent is None:
+                break
+            if node is parent.l:
+                sibling = parent.r
+            else:
+                sibling = parent.l
+            result = sibling.n / node.n
+            if co_displacement is None or result > co_displacement:
+                co_displacement = result
+                dimension = parent.q
+            node = parent
+        return co_displacement, dimension
+
+    def query_codisp(self, point):
+        """
+        Expected collusive displacement of a point if it were inserted, without inserting it.
+        The insertion cut separates the point at a node on its path with a probability given by how much
+        the point extends the bounding box of the node. Each case gives a known CoDisp, so the expectation
+        over the random cut is computed in one walk down the tree.
+
+        Parameters:
+        -----------
+        point: np.ndarray (1 x d)
+               Point to score
+
+        Returns:
+        --------
+        codisplacement: float
+                        Expected collusive displacement of the point.
+
+        Example:
+        --------
+        # Create RCTree
+        >>> X = np.random.randn(100, 2)
+        >>> tree = rrcf.RCTree(X)
+
+        # Score a new point without changing the tree
+        >>> tree.query_codisp(np.array([4, 4]))
+
+        33.512
+        """
+        if not isinstance(point, np.ndarray):
+            point = np.asarray(point)
+        point = point.ravel()
+        node = self.root
+        if node is None:
+            return 0
+
+        expected = 0.0
+        remaining = 1.0
+        upper = 0.0
+        while True:
+            bbox = node.b
+            span = (bbox[-1, :] - bbox[0, :]).sum()
+            span_hat = (np.maximum(bbox[-1, :], point) - np.minimum(bbox[0, :], point)).sum()
+            separate = (span_hat - span) / span_hat if span_hat > 0 else 0.0
+            # A new branch above this node: the point is displaced by the node, and by the siblings above.
+            expected += remaining * separate * max(upper, node.n)
+            remaining *= 1 - separate
+            if isinstance(node, Leaf) or remaining <= 0:
+                break
+            child, sibling = (node.l, node.r) if point[node.q] <= node.p else (node.r, node.l)
+            upper = max(upper, sibling.n / (child.n + 1))
+            node = child
+        # Duplicate of a leaf: its count is incremented.
+        return expected + remaining * upper
+
     def get_bbox(self, branch=None):
         """
         Compute bounding box of all points underneath a given branch.
@@ -865,6 +1061,26 @@ class RCTree:
         return cut_dimension, cut
 
 
+def _get_parent(node):
+    ref = getattr(node, '_u', None)
+    return ref() if ref is not None else None
+
+
+def _set_parent(node, parent):
+    # Parents are weak references, so a tree has no reference cycle. Nodes are freed by reference
+    # counting as soon as they are forgotten, and the cyclic garbage collector has nothing to do.
+    node._u = weakref.ref(parent) if parent is not None else None
+
+
+def _set_state(node, state):
+    # Trees pickled with strong parent links have the default state of __slots__ classes: (None, slots).
+    if isinstance(state, tuple):
+        state = state[1]
+    for key, value in state.items():
+        if key != 'u':
+            setattr(node, key, value)
+
+
 class Branch:
     """
     Branch of RCTree containing two children and at most one parent.
@@ -875,11 +1091,12 @@ class Branch:
     p: Value of cut
     l: Pointer to left child
     r: Pointer to right child
-    u: Pointer to parent
+    u: Pointer to parent (weak reference)
     n: Number of leaves under branch
     b: Bounding box of points under branch (2 x d)
     """
-    __slots__ = ['q', 'p', 'l', 'r', 'u', 'n', 'b']
+    __slots__ = ['q', 'p', 'l', 'r', '_u', 'n', 'b', '__weakref__']
+    u = property(_get_parent, _set_parent)
 
     def __init__(self, q, p, l=None, r=None, u=None, n=0, b=None):
         self.l = l
@@ -890,6 +1107,16 @@ class Branch:
         self.n = n
         self.b = b
 
+    def __getstate__(self):
+        return {'q': self.q, 'p': self.p, 'l': self.l, 'r': self.r, 'n': self.n, 'b': self.b}
+
+    def __setstate__(self, state):
+        _set_state(self, state)
+        # Children are built before their parent, so the parent links are restored here.
+        for child in (self.l, self.r):
+            if child is not None:
+                child.u = self
+
     def __repr__(self):
         return "Branch(q={}, p={:.2f})".format(self.q, self.p)
 
@@ -902,12 +1129,13 @@ class Leaf:
     -----------
     i: Index of leaf (user-specified)
     d: Depth of leaf
-    u: Pointer to parent
+    u: Pointer to parent (weak reference)
     x: Original point (1 x d)
     n: Number of points in leaf (1 if no duplicates)
     b: Bounding box of point (1 x d)
     """
-    __slots__ = ['i', 'd', 'u', 'x', 'n', 'b']
+    __slots__ = ['i', 'd', '_u', 'x', 'n', 'b', '__weakref__']
+    u = property(_get_parent, _set_parent)
 
     def __init__(self, i, d=None, u=None, x=None, n=1):
         self.u = u
@@ -917,5 +1145,11 @@ class Leaf:
         self.n = n
         self.b = x.reshape(1, -1)
 
+    def __getstate__(self):
+        return {'i': self.i, 'd': self.d, 'x': self.x, 'n': self.n, 'b': self.b}
+
+    def __setstate__(self, state):
+        _set_state(self, state)
+
     def __repr__(self):
         return "Leaf({0})".format(self.i)
@@ -8,13 +8,15 @@
 import models.rrcf as rrcf
 import models.shingle as shingle
 import timeit
-import pandas as pd
+import threading
+import numpy as np
 import utils.marker as marker
 from utils.queue import Queue
+from statistics import NormalDist
 
 
 class RRCF(object):
-    def __init__(self, num_trees, sequences, leaves_size):
+    def __init__(self, num_trees, sequences, leaves_size, stride=1):
         """Create RRCF object that contains train and emit anomaly scores.
 
         Args:
@@ -24,23 +26,102 @@ class RRCF(object):
                 However, if the shingle size is too large, then smaller scale anomalies might be lost.
             :param leaves_size: An integer. This parameter dictates how many randomly sampled training data points are sent
                 to each tree.
+            :param stride: An integer. Minutes between scored points. The window moves every minute, but the forest
+                is updated and scored every 'stride' minutes.
         """
         self.num_trees = num_trees
         self.sequences = sequences
         self.leaves_size = leaves_size
+        self.stride = stride
         self.index_queue = Queue(size=self.leaves_size)
         self.forest = None
         self.threshold = None
 
-    def train_rrcf(self, date_time, data, timer=False):
+    def __getstate__(self):
+        # NOTE: A running rebuild is not a part of the model. The next one starts after loading.
+        state = self.__dict__.copy()
+        state.pop('rebuild', None)
+        return state
+
+    def set_early_exit(self, confidence=0.0, min_trees=0, seed=None):
+        """
+        Confidence based early exit of anomaly_score.
+        Trees are updated and scored in a random order, and it stops once the mean CoDisp is far enough from the
+        threshold, so the decision is the same as the one of every tree with the given confidence. The score is then
+        the mean of the scored trees. Updates of the other trees are deferred until flush_deferred.
+        Once a threshold exists, it takes precedence over set_sampling. Every tree is updated, the unscored ones later.
+        :param confidence: A Float. Confidence of the decision. (0: off, every tree is scored)
+        :param min_trees: An Integer. Trees scored before an exit. (0: a tenth of the trees, at least 5)
+        :param seed: An Integer. Seed of the tree order.
+        :return: None
+        """
+        if confidence < 0 or confidence >= 1:
+            marker.debug_info("Confidence should be range in 0 <= confidence < 1", m_type="ERROR")
+            raise SystemExit
+        self.early_exit = confidence
+        self.min_trees = min_trees
+        self.order_rng = np.random.RandomState(seed)
+        self.exit_stats = {'points': 0, 'early': 0, 'trees': 0}
+        self.last_trees = None
+
+    def set_sampling(self, rate=1.0, seed=None):
+        """
+        Sub-sampled tree updates of anomaly_score, once the trees are full.
+        Each tree accepts a new point with probability 'rate'. An accepted point takes the slot of its leaf
+        index (index % leaves_size) and evicts the point that tree last accepted into the same slot, which is
+        not necessarily the oldest one the tree keeps. A slot is refreshed with probability 'rate' every
+        leaves_size points, so a tree keeps up to leaves_size points of a time-decayed sample, whose age is
+        about leaves_size / rate points on average. Trees that don't accept the point score it by
+        RCTree.query_codisp, the expected CoDisp of an insertion, without changing the tree.
+        Sampling is not used while set_early_exit is on and a threshold exists. The early exit takes precedence.
+        :param rate: A Float. Probability that a tree accepts a point. (1: every tree is updated)
+        :param seed: An Integer. Seed of the acceptance.
+        :return: None
+        """
+        if rate <= 0 or rate > 1:
+            marker.debug_info("Sample rate should be range in 0 < rate <= 1", m_type="ERROR")
+            raise SystemExit
+        self.sample_rate = rate
+        self.sample_rng = np.random.RandomState(seed)
+        self.last_updates = None
+
+    def set_rebuild(self, epoch=0, seed=None):
+        """
+        Epoch-based batch rebuild of the trees, instead of forgetting every expired point.
+        Expired points are only tombstoned: dropped from the leaves of a tree but left in its nodes, so there is no
+        bbox or depth update. Every 'epoch' points, the trees are rebuilt from their current windows by
+        RCTree.from_points in a background thread, and swapped in between two points. Updates made while it builds
+        are replayed on the new trees.
+        :param epoch: An Integer. Points between rebuilds. (0: off, every expired point is forgotten)
+        :param seed: An Integer. Seed of the rebuilt trees.
+        :return: None
+        """
+        if epoch < 0:
+            marker.debug_info("Rebuild epoch should be range in 0 <= epoch", m_type="ERROR")
+            raise SystemExit
+        if epoch == 0:
+            self.compact()
+        self.rebuild_epoch = epoch
+        self.rebuild_rng = np.random.RandomState(seed)
+        self.rebuild_stats = {'rebuilds': 0, 'failures': 0, 'last_seconds': None}
+        self.since_rebuild = getattr(self, 'since_rebuild', 0)
+        self.tombstones = getattr(self, 'tombstones', {})
+        self.rebuild = None
+
+    def train_rrcf(self, date_time, data, timer=False, sample_rate=1.0, skip_warmup=False, seed=None):
         """
         Training the RRCF(Robust Random Cut Forest) model using given data.
+        Every point builds the forest. CoDisp is computed only on the calibration sample, which is
+        every point by default.
         Args:
             :param date_time: A Datatime object. Date and time for data recorded.
             :param data: A Numpy object. The n-dimension data for input.
             :param timer: A Boolean. Returns training time.
+            :param sample_rate: A Float. Fraction of points to compute CoDisp for threshold calibration. (0 < rate <= 1)
+            :param skip_warmup: A Boolean. Don't compute CoDisp until the trees are full of leaves.
+            :param seed: An Integer. Seed of the calibration sampling.
             :return:
-                - avg_codisp: A dictionary. The Collusive displacement(anomaly score)
+                - avg_codisp: A dictionary. The Collusive displacement(anomaly score) of sampled points.
                 - training time
         """
         if self.forest is not None:
@@ -58,19 +139,29 @@ class RRCF(object):
             tree = rrcf.RCTree()
             self.forest.append(tree)
 
-        # NOTE: Build a sequences points.
-        points = shingle.shingle(data, size=self.sequences)
+        # NOTE: Build a sequences points. (Models pickled before the stride don't have it)
+        stride = getattr(self, 'stride', 1)
+        points = shingle.shingle(data, size=self.sequences, stride=stride)
 
         # NOTE: Initialize the average of Collusive Displacement(CoDisp).
         avg_codisp = {}
         remove_index = None
 
+        # NOTE: Calibration sampling.
+        if sample_rate <= 0 or sample_rate > 1:
+            marker.debug_info("Sample rate should be range in 0 < sample_rate <= 1", m_type="ERROR")
+        rng = np.random.RandomState(seed)
+
         for index, point in enumerate(points):
             # NOTE: For each tree in the forest...
             if self.index_queue.full():
                 # NOTE: If leaves are full, get first index in queue(FIFO).
                 remove_index = self.index_queue.get()
 
+            sampled = not (skip_warmup and index < self.leaves_size)
+            if sampled and sample_rate < 1:
+                sampled = rng.random_sample() < sample_rate
+
             for tree in self.forest:
                 # NOTE: If tree is above permitted size, drop the oldest point (FIFO)
                 if len(tree.leaves) >= self.leaves_size:
@@ -78,10 +169,14 @@ class RRCF(object):
                 # NOTE: Insert the new point into the tree
                 tree.insert_point(point, index=index)
 
+                if not sampled:
+                    continue
+
                 # NOTE: Compute CoDisp on the new point and take the average among all trees
-                if not date_time[index+self.sequences-1] in avg_codisp:
-                    avg_codisp[date_time[index+self.sequences-1]] = 0
-                avg_codisp[date_time[index+self.sequences-1]] += tree.codisp(index) / self.num_trees
+                last = date_time[index*stride+self.sequences-1]
+                if not last in avg_codisp:
+                    avg_codisp[last] = 0
+                avg_codisp[last] += tree.codisp(index) / self.num_trees
 
             # NOTE: Insert new points
             self.index_queue.put(index)
@@ -110,6 +205,15 @@ class RRCF(object):
         avg_codisp = 0
         insert_index = -1
 
+        # NOTE: Tree updates deferred by the early exit of the last point.
+        self.flush_deferred()
+
+        # NOTE: Rebuilt trees are swapped in between two points.
+        self.maintain()
+
+        # NOTE: Trees are full of points. (Sub-sampled updates start from here)
+        full = self.index_queue.full()
+
         # NOTE: Get index
         if self.index_queue.full():
             # NOTE: If queue is full, remove first index.
@@ -127,15 +231,32 @@ class RRCF(object):
             index = self.index_queue.indexList[-1]
             index += 1
 
-        # NOTE: Adding a node to the tree
-        for tree in self.forest:
-            if len(tree.leaves) >= self.leaves_size:
-                tree.forget_point(index)
+        # NOTE: Models pickled before early exit, degraded mode and sampling don't have their attributes.
+        early_exit = getattr(self, 'early_exit', 0)
+        sample_rate = getattr(self, 'sample_rate', 1.0)
+        active = getattr(self, 'active_trees', None)
+        forest = self.forest[:active] if active else self.forest
 
+        if early_exit > 0 and forest and self.threshold is not None and not np.isnan(self.threshold):
             insert_index = index % self.leaves_size
-            tree.insert_point(data, index=insert_index)
+            avg_codisp, trees = self._bounded_codisp(forest, index, insert_index, data, self.threshold, early_exit)
+            self.last_trees = trees
+            self.exit_stats['points'] += 1
+            self.exit_stats['trees'] += trees
+            if trees < len(forest):
+                self.exit_stats['early'] += 1
+        elif sample_rate < 1 and forest and full:
+            insert_index = index % self.leaves_size
+            avg_codisp = self._sampled_codisp(forest, index, insert_index, data, sample_rate)
+        else:
+            # NOTE: Adding a node to the tree
+            for t, tree in enumerate(forest):
+                insert_index = index % self.leaves_size
+                self._update_tree(t, index, data, insert_index)
 
-            avg_codisp += tree.codisp(insert_index) / self.num_trees
+                avg_codisp += tree.codisp(insert_index) / len(forest)
+            if early_exit > 0:
+                self.last_trees = len(forest)
 
         if insert_index <= -1:
             marker.debug_info("Invalid \'insert_index\' value. We have \'{}\'".format(-1), m_type="ERROR")
@@ -143,12 +264,242 @@ class RRCF(object):
 
         # NOTE: Inserting new index number
         self.index_queue.put(insert_index)
+        if getattr(self, 'rebuild_epoch', 0) > 0:
+            self.since_rebuild += 1
 
         if with_date is True:
             return [date[-1], avg_codisp]
         else:
             return avg_codisp
 
+    def codisp_all(self):
+        """
+        CoDisp of every point in the window, averaged over the trees. (e.g. rescoring the window after a threshold
+        change) Each tree is scored by one pass of RCTree.codisp_all, instead of a codisp walk per leaf.
+        :return:
+            - A Numpy array. Mean CoDisp by leaf index. (index_queue has their time order, NaN: not in any tree)
+        """
+        total = np.zeros(self.leaves_size)
+        count = np.zeros(self.leaves_size)
+        for tree in self.forest or []:
+            scores = tree.codisp_all()
+            keys = np.fromiter(scores.keys(), dtype=np.int64, count=len(scores))
+            np.add.at(total, keys, np.fromiter(scores.values(), dtype=float, count=len(scores)))
+            np.add.at(count, keys, 1)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return total / count
+
+    def attribution(self, data, features):
+        """
+        Share of each feature in the CoDisp of the last point of anomaly_score.
+        In each tree, the CoDisp of the point goes to the feature of the cut that isolates its colluding subtree.
+        Trees that don't hold the point (deferred by the early exit, or not updated by sampling) are left out.
+        :param data: A Numpy array. The last point. (window x features)
+        :param features: An integer. Number of features of a window row.
+        :return:
+            - A Numpy array. Shares by feature, which sum to 1. (Equal shares if no tree holds the point)
+        """
+        shares = np.zeros(features)
+        point = np.ravel(data)
+        index = self.index_queue.indexList[-1] if self.index_queue.indexList else None
+        active = getattr(self, 'active_trees', None)
+        for tree in (self.forest[:active] if active else self.forest) or []:
+            leaf = tree.leaves.get(index)
+            if leaf is None or not np.array_equal(leaf.x, point):
+                continue
+            codisp, dimension = tree.codisp_cut(leaf)
+            if dimension is not None:
+                shares[dimension % features] += codisp
+
+        total = shares.sum()
+        return shares / total if total > 0 else np.full(features, 1.0 / features)
+
+    def flush_deferred(self):
+        """
+        Apply the tree updates deferred by an early exit. It is called before the next point, or when idle.
+        :return:
+            - An Integer. Number of applied tree updates.
+        """
+        deferred = getattr(self, 'deferred', None)
+        if not deferred or self.forest is None:
+            return 0
+
+        for t, index, data, insert_index in deferred:
+            self._update_tree(t, index, data, insert_index)
+        self.deferred = []
+        return len(deferred)
+
+    def set_active_trees(self, count=None):
+        """
+        Update and score only the first 'count' trees. (e.g. degraded mode of a detector)
+        The other trees keep their points, and replace them with new ones once they are active again.
+        :param count: An Integer. Number of active trees. (None: every tree)
+        :return: None
+        """
+        self.active_trees = count
+
+    def maintain(self, block=False):
+        """
+        Swap in the trees of a finished rebuild, and start a new one once 'rebuild_epoch' points have passed.
+        It is called before each point, or when idle.
+        :param block: A Boolean. Wait for a running rebuild.
+        :return:
+            - A Float. Build time of the swapped rebuild in seconds, or None.
+        """
+        if getattr(self, 'rebuild_epoch', 0) <= 0 or not self.forest:
+            return None
+
+        rebuild = getattr(self, 'rebuild', None)
+        if rebuild is not None:
+            if block:
+                rebuild['thread'].join()
+            if rebuild['thread'].is_alive():
+                return None
+            return self._swap(rebuild)
+
+        if self.since_rebuild >= self.rebuild_epoch:
+            self.flush_deferred()
+            self._start_rebuild()
+        return None
+
+    def compact(self):
+        """
+        Finish a running rebuild, and forget the tombstoned points for real. (e.g. before the forest is written out)
+        :return: None
+        """
+        rebuild = getattr(self, 'rebuild', None)
+        if rebuild is not None:
+            rebuild['thread'].join()
+            if self.forest is not None:
+                self._swap(rebuild)
+            else:
+                self.rebuild = None
+        tombstones = getattr(self, 'tombstones', None)
+        if tombstones and self.forest is not None:
+            for t, leaves in tombstones.items():
+                tree = self.forest[t]
+                for leaf in leaves:
+                    # NOTE: forget_point works by key, so the leaf gets a temporary one. (indices are never negative)
+                    tree.leaves[-1] = leaf
+                    tree.forget_point(-1)
+        self.tombstones = {}
+
+    def tombstone_count(self):
+        return sum(len(leaves) for leaves in getattr(self, 'tombstones', {}).values())
+
+    def _start_rebuild(self):
+        # NOTE: Windows are taken here, and the worker only reads them. Leaf points are never changed in place.
+        windows = [(dict(tree.leaves), self.rebuild_rng.randint(2 ** 31)) for tree in self.forest]
+        rebuild = {'delta': [[] for _ in self.forest], 'trees': None, 'error': None, 'seconds': None}
+        rebuild['thread'] = threading.Thread(target=_build_forest, args=(windows, rebuild), name='rrcf-rebuild',
+                                             daemon=True)
+        self.rebuild = rebuild
+        self.since_rebuild = 0
+        rebuild['thread'].start()
+
+    def _swap(self, rebuild):
+        self.rebuild = None
+        if rebuild['error'] is not None:
+            # NOTE: Not an ERROR, which exits. The old trees keep scoring, with their tombstones forgotten.
+            marker.debug_info("Rebuild failed: {}".format(rebuild['error']), m_type="WARNING")
+            self.rebuild_stats['failures'] += 1
+            self.compact()
+            return None
+
+        trees = rebuild['trees']
+        for tree, delta in zip(trees, rebuild['delta']):
+            for index, data, insert_index in delta:
+                self._replace_point(tree, index, data, insert_index)
+        self.forest = trees
+        self.tombstones = {}
+        self.rebuild_stats['rebuilds'] += 1
+        self.rebuild_stats['last_seconds'] = rebuild['seconds']
+        return rebuild['seconds']
+
+    def _update_tree(self, t, index, data, insert_index):
+        tombstones = self.tombstones.setdefault(t, []) if getattr(self, 'rebuild_epoch', 0) > 0 else None
+        self._replace_point(self.forest[t], index, data, insert_index, tombstones)
+        # NOTE: The trees being rebuilt don't have this update yet.
+        if getattr(self, 'rebuild', None) is not None:
+            self.rebuild['delta'][t].append((index, data, insert_index))
+
+    def _replace_point(self, tree, index, data, insert_index, tombstones=None):
+        # NOTE: Drop the oldest point (FIFO) and insert the new one.
+        if len(tree.leaves) >= self.leaves_size and index in tree.leaves:
+            self._expire(tree, index, tombstones)
+        # NOTE: Old point of the same slot in a tree that was not active, or that skipped points by sampling.
+        if insert_index in tree.leaves:
+            self._expire(tree, insert_index, tombstones)
+        tree.insert_point(data, index=insert_index)
+
+    @staticmethod
+    def _expire(tree, key, tombstones):
+        if tombstones is None:
+            tree.forget_point(key)
+        else:
+            # NOTE: Tombstone. The leaf stays in the tree until the next rebuild.
+            tombstones.append(tree.leaves.pop(key))
+
+    def _sampled_codisp(self, forest, index, insert_index, data, rate):
+        """
+        Update the trees that accept the point, and score it against every tree.
+        An accepted point evicts the point that tree last accepted into the slot insert_index. See set_sampling.
+        :param forest: A List of RCTree objects. Active trees.
+        :param index: An Integer. Leaf index to forget.
+        :param insert_index: An Integer. Leaf index of the point.
+        :param data: A Numpy array. The point.
+        :param rate: A Float. Probability that a tree accepts the point.
+        :return:
+            - A Float. Mean CoDisp.
+        """
+        accepted = self.sample_rng.random_sample(len(forest)) < rate
+        total = 0.0
+        for t, (tree, accept) in enumerate(zip(forest, accepted)):
+            if accept:
+                self._update_tree(t, index, data, insert_index)
+                total += tree.codisp(insert_index)
+            else:
+                total += tree.query_codisp(data)
+        self.last_updates = int(accepted.sum())
+        return total / len(forest)
+
+    def _bounded_codisp(self, forest, index, insert_index, data, threshold, confidence):
+        """
+        Update and score the trees in a random order, until the mean CoDisp is away from the threshold.
+        The bound is a normal one with the finite population correction, as the trees are drawn without replacement.
+        Its level is split over every look (Bonferroni), so checking after each tree keeps the confidence.
+        :param forest: A List of RCTree objects. Active trees.
+        :param index: An Integer. Leaf index to forget.
+        :param insert_index: An Integer. Leaf index of the point.
+        :param data: A Numpy array. The point.
+        :param threshold: A Float. Anomaly threshold.
+        :param confidence: A Float. Confidence of the decision.
+        :return:
+            - A Float. Mean CoDisp of the scored trees.
+            - An Integer. Number of scored trees.
+        """
+        n = len(forest)
+        z = NormalDist().inv_cdf(1 - (1 - confidence) / (2 * n))
+        min_trees = max(self.min_trees, 2) if self.min_trees > 0 else max(5, n // 10)
+
+        order = self.order_rng.permutation(n)
+        total = 0.0
+        square = 0.0
+        for k, t in enumerate(order, start=1):
+            tree = forest[t]
+            self._update_tree(t, index, data, insert_index)
+            s = tree.codisp(insert_index)
+            total += s
+            square += s * s
+            if min_trees <= k < n:
+                mean = total / k
+                var = max(square / k - mean * mean, 0.0) * k / (k - 1)
+                if abs(mean - threshold) > z * np.sqrt(var / k * (n - k) / (n - 1)):
+                    self.deferred = [(int(r), index, data, insert_index) for r in order[k:]]
+                    return mean, k
+        return total / n, n
+
     def calc_threshold(self, score, q, with_data=False):
         """
         Computing the threshold according to given quantile.
@@ -164,19 +515,74 @@ class RRCF(object):
             marker.debug_info("Quantile value \'q\' should be range in 0 < q < 1", m_type="ERROR")
             raise SystemExit
 
-        sdf = None
-
         if type(score) == dict:
-            sdf = pd.DataFrame(score.items(), columns=["DATE", "Anomaly_score"])
+            scores = np.fromiter(score.values(), dtype=float, count=len(score))
         elif type(score) == list:
-            sdf = pd.DataFrame(score, columns=["DATE", "Anomaly_score"])
+            scores = np.array([s[1] for s in score], dtype=float)
         else:
             marker.debug_info('Invalid data type \'{}\''.format(type(score)), m_type='ERROR')
 
-        threshold = sdf.quantile(q=q)
+        # [*]Same as the linear interpolation of pandas quantile, without loading pandas on the detector path.
+        threshold = np.nanquantile(scores, q) if len(scores) > 0 else np.nan
 
         if with_data:
-            anomaly_result = sdf[sdf['Anomaly_score'] >= threshold['Anomaly_score']]
-            return threshold['Anomaly_score'], anomaly_result
+            import pandas as pd
+
+            if type(score) == dict:
+                sdf = pd.DataFrame(score.items(), columns=["DATE", "Anomaly_score"])
+            else:
+                sdf = pd.DataFrame(score, columns=["DATE", "Anomaly_score"])
+            anomaly_result = sdf[sdf['Anomaly_score'] >= threshold]
+            return threshold, anomaly_result
+        else:
+            return threshold
+
+    def calc_threshold_ci(self, score, q, confidence=0.95):
+        """
+        Computing the threshold from sampled scores with a distribution-free confidence interval.
+        The interval is given by order statistics around rank n*q, so it holds for any score distribution.
+        :param score: A Dictionary or a List. The sampled anomaly scores.
+        :param q: A float. Quantile value (0 < q < 1)
+        :param confidence: A float. Confidence level of the interval.
+        :return:
+            - threshold
+            - lower: Lower bound of the interval.
+            - upper: Upper bound of the interval.
+        """
+        threshold = self.calc_threshold(score, q, with_data=False)
+
+        if type(score) == dict:
+            scores = np.fromiter(score.values(), dtype=float, count=len(score))
         else:
-            return threshold['Anomaly_score']
+            scores = np.array([s[1] for s in score], dtype=float)
+        scores = np.sort(scores[~np.isnan(scores)])
+
+        n = len(scores)
+        if n == 0:
+            return threshold, np.nan, np.nan
+
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        spread = z * np.sqrt(n * q * (1 - q))
+        lower = int(max(np.floor(n * q - spread), 0))
+        upper = int(min(np.ceil(n * q + spread), n - 1))
+        return threshold, scores[lower], scores[upper]
+
+
+def _build_forest(windows, rebuild):
+    """
+    Worker of RRCF rebuild. Builds a tree from each window into rebuild['trees'].
+    :param windows: A List. (leaves, seed) of each tree.
+    :param rebuild: A Dictionary. Rebuild state.
+    :return: None
+    """
+    stime = timeit.default_timer()
+    try:
+        trees = []
+        for leaves, seed in windows:
+            keys = list(leaves)
+            X = np.array([leaves[key].x for key in keys], dtype=np.float64)
+            trees.append(rrcf.RCTree.from_points(X, keys, random_state=int(seed)))
+        rebuild['trees'] = trees
+    except Exception as e:
+        rebuild['error'] = e
+    rebuild['seconds'] = timeit.default_timer() - stime
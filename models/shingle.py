@@ -2,7 +2,7 @@ from collections import deque
 import numpy as np
 
 
-def shingle(sequence, size):
+def shingle(sequence, size, stride=1):
     """
     Generator that yields shingles (a rolling window) of a given size.
 
@@ -12,6 +12,8 @@ def shingle(sequence, size):
                Sequence to be shingled
     size : int
            size of shingle (window)
+    stride : int
+             number of elements between yielded shingles (default 1, every shingle)
     """
     iterator = iter(sequence)
     init = (next(iterator) for _ in range(size))
@@ -19,6 +21,7 @@ def shingle(sequence, size):
     if len(window) < size:
         raise IndexError('Sequence smaller than window size')
     yield np.asarray(window)
-    for elem in iterator:
+    for count, elem in enumerate(iterator, 1):
         window.append(elem)
-        yield np.asarray(window)
+        if count % stride == 0:
+            yield np.asarray(window)
@@ -0,0 +1,211 @@
+"""
+@ File name: snapshot.py
+@ Version: 1.0.0
+@ Last update: 2026.OCT.19
+@ Company: Ntels Co., Ltd
+
+Compact array form of a forest of RCTrees.
+A tree is stored in pre-order as flat arrays: cut dimension and value of branches, and point, depth,
+count and index of leaves. Branch bounding boxes and counts are not stored. They are rebuilt bottom-up
+from the leaves, which gives the same values, since a bbox is always the min/max of the points under it.
+Leaf indices have to be integers, as they are in RRCF.
+Trees with their own RandomState (e.g. rebuilt by RCTree.from_points) keep its MT19937 state, so random cuts
+after a restore are the same as without it. Trees on the shared np.random module use the process state.
+"""
+import sys
+import numpy as np
+import models.rrcf as rrcf
+
+from models.rrcf import Branch, Leaf
+
+
+def forest_to_arrays(forest):
+    """
+    Flatten a forest.
+    :param forest: A List of RCTree objects.
+    :return:
+        - A Dictionary of numpy arrays.
+    """
+    tree_nodes, tree_keys = [], []
+    is_leaf, q, p = [], [], []
+    x, leaf_n, leaf_d, leaf_i = [], [], [], []
+    keys, key_leaf = [], []
+    rng_tree, rng_keys, rng_pos, rng_gauss = [], [], [], []
+    ndim = 0
+
+    for t, tree in enumerate(forest):
+        if isinstance(tree.rng, np.random.RandomState):
+            _, state_keys, pos, has_gauss, gauss = tree.rng.get_state()
+            rng_tree.append(t)
+            rng_keys.append(state_keys)
+            rng_pos.append(pos)
+            rng_gauss.append(gauss if has_gauss else np.nan)
+
+        start = len(is_leaf)
+        ordinal = {}
+        if tree.root is not None:
+            ndim = tree.ndim
+            stack = [tree.root]
+            while stack:
+                node = stack.pop()
+                if isinstance(node, Leaf):
+                    ordinal[id(node)] = len(x)
+                    is_leaf.append(True)
+                    q.append(-1)
+                    p.append(0.0)
+                    x.append(node.x)
+                    leaf_n.append(node.n)
+                    leaf_d.append(node.d)
+                    leaf_i.append(node.i)
+                else:
+                    is_leaf.append(False)
+                    q.append(node.q)
+                    p.append(node.p)
+                    # [*]Right is pushed first, so the left subtree comes first. (pre-order)
+                    stack.append(node.r)
+                    stack.append(node.l)
+        tree_nodes.append(len(is_leaf) - start)
+
+        for key, leaf in tree.leaves.items():
+            keys.append(key)
+            key_leaf.append(ordinal[id(leaf)])
+        tree_keys.append(len(tree.leaves))
+
+    return {
+        'ndim': np.array(ndim, dtype=np.int64),
+        'tree_nodes': np.array(tree_nodes, dtype=np.int64),
+        'tree_keys': np.array(tree_keys, dtype=np.int64),
+        'is_leaf': np.array(is_leaf, dtype=bool),
+        'q': np.array(q, dtype=np.int32),
+        'p': np.array(p, dtype=np.float64),
+        'x': np.array(x, dtype=np.float64).reshape(len(x), ndim),
+        'leaf_n': np.array(leaf_n, dtype=np.int64),
+        'leaf_d': np.array(leaf_d, dtype=np.int64),
+        'leaf_i': np.array(leaf_i, dtype=np.int64),
+        'keys': np.array(keys, dtype=np.int64),
+        'key_leaf': np.array(key_leaf, dtype=np.int64),
+        'rng_tree': np.array(rng_tree, dtype=np.int64),
+        'rng_keys': np.array(rng_keys, dtype=np.uint32).reshape(len(rng_keys), 624),
+        'rng_pos': np.array(rng_pos, dtype=np.int64),
+        'rng_gauss': np.array(rng_gauss, dtype=np.float64)
+    }
+
+
+def arrays_to_forest(arrays):
+    """
+    Rebuild a forest from forest_to_arrays.
+    :param arrays: A Dictionary (or NpzFile) of numpy arrays.
+    :return:
+        - forest: A List of RCTree objects.
+    """
+    ndim = int(arrays['ndim'])
+    is_leaf = arrays['is_leaf'].tolist()
+    q = arrays['q'].tolist()
+    p = arrays['p']
+    x = arrays['x']
+    leaf_n = arrays['leaf_n'].tolist()
+    leaf_d = arrays['leaf_d'].tolist()
+    leaf_i = arrays['leaf_i'].tolist()
+    keys = arrays['keys'].tolist()
+    key_leaf = arrays['key_leaf'].tolist()
+
+    forest = []
+    leaves = []
+    node_pos = 0
+    key_pos = 0
+    for count, key_count in zip(arrays['tree_nodes'].tolist(), arrays['tree_keys'].tolist()):
+        tree = rrcf.RCTree()
+        branches = []
+        open_branches = []
+        for pos in range(node_pos, node_pos + count):
+            if is_leaf[pos]:
+                k = len(leaves)
+                node = Leaf(i=leaf_i[k], d=leaf_d[k], x=x[k].copy(), n=leaf_n[k])
+                leaves.append(node)
+            else:
+                node = Branch(q=q[pos], p=p[pos])
+                branches.append(node)
+
+            if open_branches:
+                parent = open_branches[-1]
+                node.u = parent
+                if parent.l is None:
+                    parent.l = node
+                else:
+                    parent.r = node
+                    open_branches.pop()
+            else:
+                tree.root = node
+            if not is_leaf[pos]:
+                open_branches.append(node)
+
+        # [*]Children come after their parent in pre-order, so reversed order is bottom-up.
+        for branch in reversed(branches):
+            branch.n = branch.l.n + branch.r.n
+            branch.b = np.vstack([np.minimum(branch.l.b[0, :], branch.r.b[0, :]),
+                                  np.maximum(branch.l.b[-1, :], branch.r.b[-1, :])])
+
+        for k in range(key_pos, key_pos + key_count):
+            tree.leaves[keys[k]] = leaves[key_leaf[k]]
+        tree.ndim = ndim if tree.root is not None else None
+
+        node_pos += count
+        key_pos += key_count
+        forest.append(tree)
+
+    # [*]Files written before the RNG state was stored have no 'rng_tree'. Those trees use np.random.
+    if 'rng_tree' in arrays:
+        for t, state_keys, pos, gauss in zip(arrays['rng_tree'].tolist(), arrays['rng_keys'],
+                                             arrays['rng_pos'].tolist(), arrays['rng_gauss'].tolist()):
+            rng = np.random.RandomState()
+            rng.set_state(('MT19937', state_keys, pos, int(not np.isnan(gauss)), 0.0 if np.isnan(gauss) else gauss))
+            forest[t].rng = rng
+    return forest
+
+
+def save_forest(path, forest, compress=False):
+    """
+    Write a forest into a .npz file.
+    :param path: A String. File path. It is written into a temporary file first and then replaced.
+    :param forest: A List of RCTree objects.
+    :param compress: A Boolean. Use zip compression.
+    :return:
+        - An Integer. File size in bytes.
+    """
+    import os
+
+    temp = path + ".tmp"
+    with open(temp, "wb") as file:
+        (np.savez_compressed if compress else np.savez)(file, **forest_to_arrays(forest))
+    os.replace(temp, path)
+    return os.path.getsize(path)
+
+
+def load_forest(path):
+    """
+    Read a forest written by save_forest.
+    """
+    with np.load(path) as arrays:
+        return arrays_to_forest(arrays)
+
+
+def forest_bytes(forest):
+    """
+    Rough resident size of a forest: node objects and their numpy arrays.
+    :param forest: A List of RCTree objects. (None: 0)
+    :return:
+        - An Integer. Bytes.
+    """
+    if not forest:
+        return 0
+    total = 0
+    for tree in forest:
+        if tree.root is None:
+            continue
+        leaf = next(iter(tree.leaves.values()))
+        leaf_size = sys.getsizeof(leaf) + sys.getsizeof(leaf.x) + sys.getsizeof(leaf.b)
+        branch_size = sys.getsizeof(tree.root) + sys.getsizeof(tree.root.b) if isinstance(tree.root, Branch) else 0
+        distinct = 1 if isinstance(tree.root, Leaf) else len(set(map(id, tree.leaves.values())))
+        # [*]Leaves dict entry is about 100 bytes with its integer key.
+        total += distinct * leaf_size + max(distinct - 1, 0) * branch_size + len(tree.leaves) * 100
+    return total
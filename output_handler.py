@@ -8,23 +8,32 @@
 
 import os
 import csv
-import pandas as pd
+import heapq
+import queue
+import signal
 import config.file_path as fp
 import time
 import traceback
 import glob
 import timeit
 import utils.marker as mk
-import numpy as np
 import argparse
 
+from collections import namedtuple
 from multiprocessing import Process, Queue
 from utils.logger import StreamLogger, FileLogger
-from datetime import datetime, timedelta
+from utils.logger import shutdown as log_shutdown
+from datetime import date, datetime
 from utils.graceful_killer import GracefulKiller
+from utils.watermark import MinuteWatermark
+from utils.metrics import Metrics, event_lag, LAG_BUCKETS
+from utils.profiler import Profiler
 
 STREAM_LOG_LEVEL = "WARNING"
 
+# [*]Typed detector output row. Measures are parsed once in the worker, instead of passing string tuples around.
+OutputRow = namedtuple('OutputRow', ['ip', 'dtmm', 'svc', 'up', 'dn', 'score', 'estimate', 'percentage'])
+
 
 class Clean(GracefulKiller):
     def exit_gracefully(self, signum, frame):
@@ -51,61 +60,221 @@ def get_running_process():
             running_process[pgw_ip] = [service]
         else:
             running_process[pgw_ip].append(service)
-    logger.debug("Running process - {}".format(running_process))
+    logger.debug("Running process - %s", running_process)
     return running_process
 
 
-def multi_process_by_ip(pid, svc_list, mq):
+def parse_row(line):
+    """
+    Parse a detector output line into a typed row.
+    :param line: A List. Fields of a '|' separated output line.
+    :return:
+        - An OutputRow. percentage is nan, if the line doesn't have it.
+    """
+    percentage = float(line[7]) if len(line) > 7 else float('nan')
+    return OutputRow(line[0], line[1], line[2], float(line[3]), float(line[4]), float(line[5]), line[6], percentage)
+
+
+def multi_process_by_ip(pid, svc_list):
     """
-    This method is worked by multi-processing. It gather the output data from each service directory using thread.
-    And then write a file.
+    Gather the output data of every anomaly detector under a p-gateway. It is worked by a pool worker.
 
     :param pid: A String. P-gateway IP.
     :param svc_list: A List. List of working anomaly detector.
-    :return: None.
+    :return:
+        - reports: A List. (svc, dtmm, rows) per detector output file. rows is a list of OutputRow.
     """
-    # [*] Initializing variables.
-    files = []
+    reports = []
     for svc in svc_list:
         stime = timeit.default_timer()
         info_file = glob.glob(fp.management_dir() + "/{}/{}/output/*.DAT.INFO".format(pid, svc))
-        logger.debug("INFO files: {}/{}::{}".format(pid, svc, info_file))
+        logger.debug("INFO files: %s/%s::%s", pid, svc, info_file)
         etime = timeit.default_timer()
-        logger.debug(".INFO searched time: {}".format(etime-stime))
+        logger.debug(".INFO searched time: %s", etime-stime)
 
-        # [*] Remove .INFO extension.
-        stime = timeit.default_timer()
+        # [*] Detector output is named as '{ip}_{svc}_{DTmm}.DAT'.
+        prefix = "{}_{}_".format(pid, svc)
         for info in info_file:
-            temp = info[:-5]
-            files.append(temp)
+            # [*] Remove .INFO extension.
+            f = info[:-5]
+            dtmm = os.path.basename(f)[len(prefix):-4]
 
-        etime = timeit.default_timer()
-        logger.debug("Extension removal time: {}".format(etime-stime))
-
-    if not files:
-        logger.info("There is no data to process in: {}".format(pid))
-        return
-
-    all_data = []
-    # [*] Integrate all data in files.
-    for f in files:
-        with open(f, "r") as file:
-            csv_reader = csv.reader(file, delimiter="|")
-            for line in csv_reader:
-                if len(line) < 8:
-                    line.append(np.nan)
-                all_data.append(line)
-
-    logger.info("Collected data - {}".format(all_data))
-    mq.put(all_data)
-
-    # [*] Remove finished files.
-    for f in files:
-        alpha = f + ".INFO"
-        os.remove(f)
-        os.remove(alpha)
-        logger.debug("file is deleted: {}".format(f))
-        logger.debug("info files are deleted: {}".format(alpha))
+            rows = []
+            with open(f, "r") as file:
+                csv_reader = csv.reader(file, delimiter="|")
+                for line in csv_reader:
+                    rows.append(parse_row(line))
+            reports.append((svc, dtmm, rows))
+
+            # [*] Remove finished files.
+            os.remove(f)
+            os.remove(info)
+            logger.debug("file is deleted: %s", f)
+            logger.debug("info files are deleted: %s", info)
+
+    if not reports:
+        logger.debug("There is no data to process in: %s", pid)
+    return reports
+
+
+def worker_loop(slot, task_q, result_q):
+    """
+    Long-lived pool worker. It takes p-gateway tasks from its own queue until it gets None.
+    :param slot: An Integer. Slot of the worker in the pool.
+    :param task_q: A multiprocessing Queue. (task_id, pid, svc_list) tasks of this worker.
+    :param result_q: A multiprocessing Queue. (slot, task_id, pid, reports, error) results shared by the pool.
+    :return: None.
+    """
+    # [*]Parent process handles the signals and shuts the pool down.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    while True:
+        task = task_q.get()
+        if task is None:
+            break
+        task_id, pid, svc_list = task
+        try:
+            result_q.put((slot, task_id, pid, multi_process_by_ip(pid, svc_list), None))
+        except Exception:
+            result_q.put((slot, task_id, pid, [], traceback.format_exc()))
+
+    # [*]Worker exits without atexit. Flush background log writers.
+    log_shutdown()
+
+
+class WorkerPool(object):
+    def __init__(self, size):
+        """
+        Persistent pool of output gathering workers.
+        Each worker has its own task queue, so the pool knows which task every worker is running.
+        :param size: An Integer. Number of worker processes.
+        """
+        self.size = size
+        self.result_q = Queue()
+        self.workers = [None] * size
+        self.task_qs = [None] * size
+        # [*]Task id running on each slot, None if idle.
+        self.running = [None] * size
+        # [*]Task ids keep increasing across maps, so a late result of an old map is never taken as a new one.
+        self.task_id = 0
+        for slot in range(size):
+            self._spawn(slot)
+
+    def _spawn(self, slot):
+        task_q = Queue()
+        worker = Process(target=worker_loop, args=(slot, task_q, self.result_q,), daemon=True)
+        worker.start()
+        self.workers[slot] = worker
+        self.task_qs[slot] = task_q
+        self.running[slot] = None
+
+    def _respawn_dead(self):
+        """
+        Replace dead workers.
+        :return:
+            - lost: A List. Task ids which were running on the dead workers. Idle dead workers lose nothing.
+        """
+        lost = []
+        for slot, w in enumerate(self.workers):
+            if w.is_alive():
+                continue
+            elogger.error("Output worker is dead: %s (exit code: %s, task: %s)", w.pid, w.exitcode, self.running[slot])
+            if self.running[slot] is not None:
+                lost.append(self.running[slot])
+            self._spawn(slot)
+        return lost
+
+    def _dispatch(self, todo):
+        # [*]Hand out tasks to idle workers only.
+        for slot in range(self.size):
+            if not todo:
+                break
+            if self.running[slot] is None:
+                task_id, task = todo.pop()
+                self.running[slot] = task_id
+                self.task_qs[slot].put((task_id,) + tuple(task))
+
+    def map(self, tasks):
+        """
+        Run tasks on the pool. Results are drained while workers are running, so large payloads can't deadlock.
+        Only a task that was running on a dead worker is lost. A result is matched by its task id.
+        :param tasks: A List. (pid, svc_list) tasks.
+        :return:
+            - results: A List. (pid, reports) results.
+        """
+        todo = []
+        for task in tasks:
+            self.task_id += 1
+            todo.append((self.task_id, task))
+        # [*]Tasks are popped from the end. Keep the given order.
+        todo.reverse()
+        outstanding = set(task_id for task_id, _ in todo)
+
+        results = []
+        while outstanding:
+            # [*]Replace dead workers before handing them a task.
+            for lost in self._respawn_dead():
+                elogger.error("Output task is lost: %s", lost)
+                outstanding.discard(lost)
+            self._dispatch(todo)
+            try:
+                slot, task_id, pid, reports, error = self.result_q.get(timeout=1)
+            except queue.Empty:
+                continue
+
+            if self.running[slot] == task_id:
+                self.running[slot] = None
+            if task_id in outstanding:
+                outstanding.discard(task_id)
+            else:
+                # [*]Result of a task that was already given up. Its files are gone, so keep the rows as a late arrival.
+                elogger.warning("Late output result of %s (task: %s)", pid, task_id)
+            if error is not None:
+                elogger.error("Output worker failed on %s:\n%s", pid, error)
+            results.append((pid, reports))
+        return results
+
+    def close(self):
+        for task_q in self.task_qs:
+            task_q.put(None)
+        for w in self.workers:
+            w.join(timeout=5)
+
+
+def result_name(dtmm, sequence):
+    """
+    Result file name of a minute. Late arrivals of an already written minute get a sequence suffix.
+    :param dtmm: A String. Minute of the result.
+    :param sequence: An Integer. Flush sequence of the minute.
+    :return:
+        - A String. File name.
+    """
+    digits = "".join(c for c in dtmm if c.isdigit())
+    if len(digits) >= 12:
+        stamp = "{}_{}".format(digits[:8], digits[8:12])
+    else:
+        stamp = datetime.now().strftime("%Y%m%d_%H%M")
+    if sequence > 0:
+        stamp = "{}_{}".format(stamp, sequence)
+    return "POFCSSA.POLICY.{}.DAT.RESULT".format(stamp)
+
+
+def write_result(streams, output_path):
+    """
+    K-way merge of time ordered detector streams, written straight into a result file.
+    :param streams: A List. OutputRow lists, each sorted by DTmm.
+    :param output_path: A String. Result file path.
+    :return:
+        - An Integer. Number of written rows.
+    """
+    count = 0
+    with open(output_path, "w") as file:
+        csv_writer = csv.writer(file, delimiter='|')
+        for row in heapq.merge(*streams, key=lambda r: r.dtmm):
+            csv_writer.writerow(row)
+            count += 1
+    return count
 
 
 def directory_check():
@@ -124,30 +293,15 @@ def directory_check():
 
 
 def main():
-    global today, tomorrow
     global elogger, logger, slogger
     global killer
     global sleep_time
     global LOG_LEVEL, ID
+    global pool, watermark
 
     while not killer.kill_now:
         directory_check()
-        today = datetime.now().date()
-        # [*]If Day pass by create a new log file.
-        if today >= tomorrow:
-            today = tomorrow
-            tomorrow = today + timedelta(days=1)
-
-            # [*]Log handler updates
-            update_elog_path = fp.log_dir() + 'output_handler_error_{}.log'.format(today)
-            update_log_path = fp.log_dir() + 'output_handler_{}.log'.format(today)
-
-            elogger = FileLogger("output_handler_error", update_elog_path, level="WARNING").get_instance()
-            logger = FileLogger("output_handler", update_log_path, level=LOG_LEVEL).get_instance()
-
-        # [*]Multi-process init.
-        multi_process = []
-
+        profiler.tick()
         try:
             # --------------------------------------
             slogger.debug("Running process list up starts.")
@@ -155,90 +309,78 @@ def main():
 
             # [*]Get all files from management path.
             process_list = get_running_process()
+            expected = set((p, svc) for p in process_list.keys() for svc in process_list[p])
 
-            if not process_list:
-                time.sleep(sleep_time)
-                continue
-
-            slogger.debug("Got running process: {}".format(process_list))
             etime = timeit.default_timer()
-            logger.info("'get_running_process' function required time: {}".format(etime-stime))
+            logger.debug("'get_running_process' function required time: %s", etime-stime)
             # --------------------------------------
 
-            slogger.debug("Multiprocessing starts.")
-            stime = timeit.default_timer()
-
-            # [*] Multi-process Queue.
-            q = Queue()
-
-            # [*] Multi-process by ip address.
-            for p in process_list.keys():
-                process = Process(target=multi_process_by_ip, args=(p, process_list[p], q,), name=p)
-                process.start()
-                multi_process.append(process)
-
-            logger.info("Multiprocess starts: {}".format(multi_process))
-
-            for mp in multi_process:
-                mp.join()
-
-            # [*] Sleep time to join.
-            time.sleep(sleep_time)
-
-            # [*] Collect data.
-            final_data = []
-
-            while not q.empty():
-                final_data += q.get()
+            if process_list:
+                stime = timeit.default_timer()
 
-            etime = timeit.default_timer()
-
-            logger.info("Multiprocessing require time: {}".format(etime - stime))
-            slogger.debug("Multiprocessing ends.")
+                # [*] Gather by ip address on the persistent pool.
+                results = pool.map([(p, process_list[p]) for p in process_list.keys()])
+                for p, reports in results:
+                    for svc, dtmm, rows in reports:
+                        watermark.add(p, svc, dtmm, rows)
 
-            # [*] To file.
-            if final_data:
-                # [*] Integrate date frames from queue.
-                df_all_data = pd.DataFrame(final_data, columns=["PGW_IP", "DTmm", "SVC_TYPE", "REAL_UP", "REAL_DN",
-                                                                "ANOMALY_SCORE", "ESTIMATION", "PERCENTAGE"])
-                # [*] Sort by time and re-indexing.
-                if not df_all_data.empty:
-                    df_all_data.sort_values(by=["DTmm"], inplace=True)
-                    df_all_data = df_all_data.reset_index(drop=True)
+                etime = timeit.default_timer()
+                logger.debug("Gathering require time: %s", etime - stime)
+                metrics.observe('gather_seconds', etime - stime, help_text="Time to gather detector outputs.")
 
-                logger.debug("Integrated data - {}\n".format(df_all_data))
+            # [*] Write every minute that all reporting detectors reported, or whose deadline passed.
+            for dtmm, streams, sequence, missing in watermark.pop_complete(expected):
+                if missing:
+                    logger.warning("Minute %s is written by deadline. Missing detectors: %s", dtmm, missing)
+                    metrics.inc('missing_detectors_total', len(missing),
+                                help_text="Detectors missing from a minute written by deadline.")
+                if not streams:
+                    continue
 
-                dt = datetime.now()
-                dt = dt.strftime("%Y%m%d_%H%M")
                 # [*] Write into OUTPUT file.
-                output_path = fp.final_output_path() + "POFCSSA.POLICY.{}.DAT.RESULT".format(dt)
+                output_path = fp.final_output_path() + result_name(dtmm, sequence)
 
-                with open(output_path, "w") as file:
-                    csv_writer = csv.writer(file, delimiter='|')
-                    np_data = df_all_data.to_numpy()
-                    for d in np_data:
-                        csv_writer.writerow(d)
-                logger.info("File is written {}".format(output_path))
+                with metrics.time('write_seconds', help_text="Merge and write time of a result file."):
+                    count = write_result(streams, output_path)
+                logger.info("File is written %s (%s rows)", output_path, count)
 
                 with open(output_path + ".INFO", "w") as file_pointer:
                     file_pointer.write("")
-                logger.info("INFO file is written {}".format(output_path + ".INFO"))
+                logger.info("INFO file is written %s", output_path + ".INFO")
+
+                metrics.inc('files_total', help_text="Written result files.")
+                metrics.inc('rows_total', count, help_text="Written result rows.")
+                lag = event_lag(dtmm)
+                if lag is not None:
+                    metrics.observe('lag_seconds', lag, buckets=LAG_BUCKETS, help_text="Result lag from DTmm.")
+                    metrics.set('last_lag_seconds', lag, help_text="Result lag of the last written DTmm.")
+
+            metrics.set('queue_depth', watermark.pending_count(), help_text="Minutes waiting for detectors.")
+            metrics.set('detectors', len(expected), help_text="Running detectors.")
+            metrics.set('reporting_detectors', len(watermark.reporting(expected)),
+                        help_text="Running detectors that reported recently. Only these are waited for.")
+            metrics.flush()
+
+            # [*] Polling interval.
+            time.sleep(sleep_time)
         except Exception:
             elogger.error(traceback.format_exc())
-            slogger.error("Output handler didn't work properly. Check your error log: {}".format(log_path))
+            slogger.error("Output handler didn't work properly. Check your error log: %s",
+                          elog_path.format(date.today()))
             os.remove(fp.run_dir() + "output_handler.run")
+            pool.close()
             raise SystemExit
 
+    pool.close()
+    metrics.flush(force=True)
 
-if __name__ == "__main__":
+
+def parse_args(argv=None):
     """
-    Work flow:
-        1) Log directory create, if doesn't exist.
-        2) Logger define.
-        3) While roof
-            3-1) Get running process of anomaly detection module.
-            3-2) Each IP address got it's process to integrate all output data from it's service type.
-            3-3) Gathered data is converted into pandas DataFrame and write into a file.
+    Parse command line arguments.
+    :param argv: A List. Arguments to parse. (Default: sys.argv)
+    :return:
+        - An argparse Namespace.
     """
     parser = argparse.ArgumentParser(description='CDR output handler module.')
 
@@ -246,10 +388,35 @@ if __name__ == "__main__":
     parser.add_argument('--id', type=str, help='ID of ML processor', default="main")
 
     # [*]Hyper parameters.
-    parser.add_argument('--sleep', type=int, help='Sleep time.(Default:60)', default=60)
+    parser.add_argument('--sleep', type=float, help='Polling interval in seconds.(Default: 1)', default=1)
+    parser.add_argument('--deadline', type=int, help='Seconds to wait for late detectors of a minute.(Default: 60)',
+                        default=60)
+    parser.add_argument('--idle', type=int, help='Seconds without a report, after which a detector isn\'t waited '
+                                                 'for. e.g. warming up or no traffic.(Default: 180)', default=180)
     parser.add_argument('--log', type=str, help='Set log level', default="INFO")
+    parser.add_argument('--workers', type=int, help='Number of gathering workers.(Default: min(4, cpu count))',
+                        default=min(4, os.cpu_count() or 1))
+
+    return parser.parse_args(argv)
+
 
-    args = parser.parse_args()
+def run(args):
+    """
+    Entry point of the output handler process. It is called by __main__ or by a forked supervisor child.
+    Work flow:
+        1) Log directory create, if doesn't exist.
+        2) Logger define.
+        3) While roof
+            3-1) Get running process of anomaly detection module.
+            3-2) Each IP address is sent to the persistent worker pool to gather output data of its service types.
+            3-3) Reports are tracked per DTmm minute.
+            3-4) A minute is k-way merged into a file once every reporting detector reported it, or by deadline.
+    :param args: An argparse Namespace. Parsed by parse_args.
+    :return: None.
+    """
+    global LOG_LEVEL, sleep_time
+    global logger, elogger, slogger, log_path, elog_path
+    global killer, pool, watermark, metrics, profiler
 
     fp.IDX = args.id
 
@@ -264,12 +431,9 @@ if __name__ == "__main__":
     '''
     killer = Clean()
 
-    # [*]Every day logging in different file.
-    today = datetime.now().date()
-    tomorrow = today + timedelta(days=1)
-
-    elog_path = fp.log_dir() + 'output_handler_error_{}.log'.format(today)
-    log_path = fp.log_dir() + 'output_handler_{}.log'.format(today)
+    # [*]Every day logging in different file. '{}' is replaced by the date and rotates daily.
+    elog_path = fp.log_dir() + 'output_handler_error_{}.log'
+    log_path = fp.log_dir() + 'output_handler_{}.log'
 
     elogger = FileLogger("output_handler_error", elog_path, level="WARNING").get_instance()
     slogger = StreamLogger("stream_output_handler", level=STREAM_LOG_LEVEL).get_instance()
@@ -282,5 +446,21 @@ if __name__ == "__main__":
         with open(fp.run_dir() + "output_handler.run", "w") as run_file:
             run_file.write(str(os.getpid()))
 
+    # [*]Persistent worker pool. Workers inherit the loggers above.
+    pool = WorkerPool(args.workers)
+
+    # [*]Per-minute completion tracker.
+    watermark = MinuteWatermark(deadline=args.deadline, idle=args.idle)
+
+    # [*]Stage metrics. Written into the metrics directory of the processor.
+    metrics = Metrics('output_handler', {'stage': 'output_handler'})
+
+    # [*]On-demand profiling by SIGUSR1 or 'output_handler.profile' in the running directory.
+    profiler = Profiler('output_handler', fp.run_dir(), fp.log_dir(), logger)
+
     mk.debug_info("output_handler starts running.")
     main()
+
+
+if __name__ == '__main__':
+    run(parse_args())
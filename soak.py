@@ -0,0 +1,232 @@
+"""
+@ File name: soak.py
+@ Version: 1.0.0
+@ Last update: 2026.OCT.19
+@ Company: Ntels Co., Ltd
+
+End to end soak test of file_handler -> anomaly detectors -> output_handler.
+The pipeline is run by the supervisor in foreground on an isolated ID, and fed by the synthetic load generator.
+The offered rate (simulated minutes per second) is raised step by step. For each step it reports
+    - offered and delivered records per second,
+    - end to end latency of a minute, from its input file to its result file (p50, p99),
+    - backlog growth: emitted minutes that have no result yet.
+The first step whose backlog keeps growing is reported as the saturation point.
+
+Usage:
+    python3 soak.py --id soak --ips 4 --svcs 4 --steps 0.2,0.5,1,2 --step_time 120
+"""
+import os
+import sys
+import glob
+import time
+import shutil
+import signal
+import argparse
+import subprocess
+import numpy as np
+import config.file_path as fp
+import utils.marker as mk
+
+from datetime import datetime, timedelta
+from loadgen import CdrGenerator, write_input, DTMM_FORMAT
+
+
+class ResultTracker(object):
+    def __init__(self, output_dir, warmup):
+        """
+        Watch result files of output_handler and match them with emitted minutes.
+        :param output_dir: A String. Final output directory.
+        :param warmup: An Integer. First minutes that never have a result, while detectors fill their sequences.
+        """
+        self.output_dir = output_dir
+        self.warmup = warmup
+        self.emitted = {}
+        self.seen = set()
+        self.latencies = []
+        self.records = 0
+
+    def emit(self, minute, now):
+        self.emitted[minute.strftime("%Y%m%d_%H%M")] = now
+
+    def poll(self, now):
+        for path in glob.glob(self.output_dir + "POFCSSA.POLICY.*.DAT.RESULT"):
+            name = os.path.basename(path)
+            if name in self.seen:
+                continue
+            self.seen.add(name)
+
+            with open(path, "r") as file:
+                self.records += sum(1 for line in file if line.strip())
+
+            # [*]Late flushes have a sequence suffix. Only the first flush of a minute is a latency sample.
+            stamp = name[len("POFCSSA.POLICY."):-len(".DAT.RESULT")]
+            if stamp in self.emitted:
+                self.latencies.append(now - self.emitted.pop(stamp))
+
+    def backlog(self):
+        """
+        Emitted minutes without result, except the detector warm-up minutes.
+        """
+        return max(len(self.emitted) - self.warmup, 0)
+
+
+def clean(mother_dir):
+    if os.path.exists(mother_dir):
+        mk.debug_info("Removing previous soak directory: {}".format(mother_dir), m_type="WARNING")
+        shutil.rmtree(mother_dir)
+
+
+def start_pipeline(args, detectors):
+    """
+    Run the supervisor in foreground with every detector of the generator.
+    :return:
+        - A Popen object.
+    """
+    for d in [fp.run_dir(), fp.log_dir(), fp.original_input_path()]:
+        if not os.path.exists(d):
+            os.makedirs(d)
+
+    detector_file = fp.run_dir() + "soak_detectors.txt"
+    with open(detector_file, "w") as file:
+        for ip, svc in detectors:
+            file.write("{} {} --trees {} --leaves {} --seq {} --transport {}\n".format(
+                ip, svc, args.trees, args.leaves, args.seq, args.transport))
+
+    command = [sys.executable, "supervisor.py", "run", "--id", args.id, "--detectors", detector_file,
+               "--log", args.log, "--file_handler_args", "--transport {}".format(args.transport),
+               "--output_handler_args", "--deadline {}".format(args.deadline)]
+    log = open(fp.log_dir() + "soak_supervisor.log", "a")
+    return subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_ready(detectors, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        running = glob.glob(fp.run_dir() + "*.detector.run")
+        if len(running) >= len(detectors):
+            return True
+        time.sleep(0.5)
+    return False
+
+
+def run_step(rate, step_time, generator, tracker, minute, poll):
+    """
+    Offer load at a rate for step_time seconds.
+    :return:
+        - result: A Dictionary. Step statistics.
+        - minute: A datetime object. Next minute to emit.
+    """
+    latency_start = len(tracker.latencies)
+    records_start = tracker.records
+    samples = []
+    emitted = 0
+
+    stime = time.time()
+    next_emit = stime
+    while time.time() - stime < step_time:
+        now = time.time()
+        if now >= next_emit:
+            rows, _ = generator.rows(minute)
+            write_input(rows, minute)
+            tracker.emit(minute, time.time())
+            minute += timedelta(minutes=1)
+            emitted += len(rows)
+            next_emit += 1 / rate
+
+        tracker.poll(time.time())
+        samples.append((time.time() - stime, tracker.backlog()))
+        time.sleep(min(poll, max(next_emit - time.time(), 0)))
+
+    elapsed = time.time() - stime
+    latencies = tracker.latencies[latency_start:]
+
+    # [*]Backlog trend in minutes per second, by least squares over the second half of the step.
+    #    The first half is left for the in-flight minutes to settle after a rate change.
+    t, b = np.asarray([s for s in samples if s[0] >= elapsed / 2], dtype=float).reshape(-1, 2).T
+    slope = np.polyfit(t, b, 1)[0] if len(t) > 2 else 0.0
+
+    result = {
+        'rate': rate,
+        'offered': emitted / elapsed,
+        'delivered': (tracker.records - records_start) / elapsed,
+        'p50': np.percentile(latencies, 50) if latencies else float('nan'),
+        'p99': np.percentile(latencies, 99) if latencies else float('nan'),
+        'backlog': samples[-1][1],
+        'slope': slope
+    }
+    return result, minute
+
+
+def report(results, saturation):
+    print("{:>8} {:>12} {:>12} {:>9} {:>9} {:>8} {:>10}".format(
+        "MIN/S", "OFFERED/S", "DELIVERED/S", "P50(s)", "P99(s)", "BACKLOG", "GROWTH/S"))
+    for r in results:
+        print("{:>8.2f} {:>12.1f} {:>12.1f} {:>9.2f} {:>9.2f} {:>8} {:>10.3f}".format(
+            r['rate'], r['offered'], r['delivered'], r['p50'], r['p99'], r['backlog'], r['slope']))
+    if saturation is None:
+        print("Backlog did not grow in any step.")
+    else:
+        print("Backlog starts to grow at {} minutes/s ({:.1f} records/s).".format(
+            saturation['rate'], saturation['offered']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End to end soak test of the CDR pipeline.')
+    parser.add_argument('--id', type=str, help='ID of the isolated ML processor.(Default: soak)', default="soak")
+    parser.add_argument('--ips', type=int, help='Number of P-gateways.(Default: 4)', default=4)
+    parser.add_argument('--svcs', type=int, help='Number of service types per P-gateway.(Default: 4)', default=4)
+    parser.add_argument('--steps', type=str, help='Comma separated offered rates in minutes/s.(Default: 0.2,0.5,1,2)',
+                        default='0.2,0.5,1,2')
+    parser.add_argument('--step_time', type=float, help='Seconds per step.(Default: 120)', default=120)
+    parser.add_argument('--growth', type=float, help='Backlog growth regarded as saturation, in minutes/s.'
+                                                     '(Default: 0.05)', default=0.05)
+    parser.add_argument('--trees', type=int, help='Number of trees of detectors.(Default: 20)', default=20)
+    parser.add_argument('--leaves', type=int, help='Leaf size of detectors.(Default: 256)', default=256)
+    parser.add_argument('--seq', type=int, help='Sequences of detectors.(Default: 6)', default=6)
+    parser.add_argument('--transport', type=str, choices=['file', 'socket'], default='file',
+                        help='Handoff from file handler to detectors.(Default: file)')
+    parser.add_argument('--deadline', type=int, help='Deadline of output handler.(Default: 60)', default=60)
+    parser.add_argument('--anomaly_rate', type=float, help='Anomaly probability per series and minute.'
+                                                           '(Default: 0.001)', default=0.001)
+    parser.add_argument('--seed', type=int, help='Random seed.(Default: 0)', default=0)
+    parser.add_argument('--keep', action='store_true', help='Keep the soak directory of a previous run.')
+    parser.add_argument('--log', type=str, help='Log level of the pipeline.(Default: WARNING)', default="WARNING")
+    args = parser.parse_args()
+
+    # [*]Paths of the pipeline are relative to the repository root.
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    fp.IDX = args.id
+    if not args.keep:
+        clean(fp.mother_dir())
+
+    generator = CdrGenerator(args.ips, args.svcs, anomaly_rate=args.anomaly_rate, seed=args.seed)
+    detectors = generator.detectors()
+    pipeline = start_pipeline(args, detectors)
+
+    results = []
+    saturation = None
+    try:
+        if not wait_ready(detectors, timeout=60):
+            mk.debug_info("Detectors did not start in time. Check {}".format(fp.log_dir()), m_type="ERROR")
+            return
+
+        tracker = ResultTracker(fp.final_output_path(), warmup=args.seq)
+        minute = datetime.strptime("201908010000", DTMM_FORMAT)
+        for rate in [float(s) for s in args.steps.split(",") if s]:
+            mk.debug_info("Step: {} minutes/s for {}s".format(rate, args.step_time))
+            result, minute = run_step(rate, args.step_time, generator, tracker, minute, poll=0.2)
+            results.append(result)
+            if saturation is None and result['slope'] > args.growth:
+                saturation = result
+    finally:
+        pipeline.send_signal(signal.SIGTERM)
+        try:
+            pipeline.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            pipeline.kill()
+
+    report(results, saturation)
+
+
+if __name__ == '__main__':
+    main()
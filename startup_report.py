@@ -0,0 +1,172 @@
+"""
+@ File name: startup_report.py
+@ Version: 1.0.0
+@ Last update: 2026.OCT.19
+@ Company: Ntels Co., Ltd
+
+Start up report of the pipeline entry points.
+Every entry point is launched as a daemon under a temporary processor root, and the time from the process start
+to the first poll of its main loop is measured. The target is checked against it.
+Import time of the module is broken down by 'python -X importtime' in a fresh interpreter.
+
+Usage:
+    python3 startup_report.py --target 150
+    python3 startup_report.py --modules anomaly_detection --top 20
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+from utils.profiler import READY_ENV
+
+ENTRY_POINTS = ['anomaly_detection', 'file_handler', 'output_handler']
+# [*]Arguments of an entry point, besides '--id'.
+ENTRY_ARGS = {'anomaly_detection': ['--ip', '0.0.0.0', '--svc', 'STARTUP']}
+# [*]Modules that should stay off the detector hot path.
+HEAVY_MODULES = ['pandas', 'dill']
+
+PROBE = ("import time, resource, sys\n"
+         "t = time.perf_counter()\n"
+         "import {module}\n"
+         "e = time.perf_counter() - t\n"
+         "heavy = [m for m in {heavy!r} if m in sys.modules]\n"
+         "print(e, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, ','.join(heavy), sep='|')\n")
+
+
+def parse_importtime(stderr):
+    """
+    Parse '-X importtime' output.
+    :param stderr: A String. Standard error of the probe.
+    :return:
+        - A List of (self_us, cumulative_us, module name) tuples.
+    """
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3:
+            continue
+        entries.append((int(fields[0]), int(fields[1]), fields[2].strip()))
+    return entries
+
+
+def probe(module, cwd):
+    """
+    Import a module in a fresh interpreter.
+    :param module: A String. Module name.
+    :param cwd: A String. Working directory, the repository root.
+    :return:
+        - A dictionary. wall, import, rss, heavy modules and importtime entries.
+    """
+    stime = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                           PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                          cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    wall = time.perf_counter() - stime
+    if proc.returncode != 0:
+        raise RuntimeError("Failed to import {}:\n{}".format(module, proc.stderr[-2000:]))
+
+    elapsed, rss, heavy = proc.stdout.strip().splitlines()[-1].split("|")
+    return {
+        'wall': wall,
+        'import': float(elapsed),
+        'rss_kb': int(rss),
+        'heavy': [h for h in heavy.split(",") if h],
+        'entries': parse_importtime(proc.stderr)
+    }
+
+
+def probe_ready(module, cwd, timeout):
+    """
+    Launch an entry point and wait for the first poll of its main loop. It is stopped by SIGTERM after that.
+    The processor root is '../SVCTYPE_{id}' of the working directory, so it is made in a temporary directory.
+    :param module: A String. Module name of the entry point.
+    :param cwd: A String. Repository root.
+    :param timeout: A Float. Seconds to wait for the first poll.
+    :return:
+        - A Float. Seconds from the process start to the first poll. None, if it didn't poll in time.
+    """
+    root = tempfile.mkdtemp(prefix="startup_report_")
+    work = os.path.join(root, "work")
+    os.makedirs(work)
+    ready = os.path.join(root, "ready")
+    env = dict(os.environ)
+    env[READY_ENV] = ready
+
+    stime = time.time()
+    proc = subprocess.Popen([sys.executable, os.path.join(cwd, module + ".py"), "--id", "startup"] +
+                            ENTRY_ARGS.get(module, []),
+                            cwd=work, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while not os.path.exists(ready) and proc.poll() is None and time.time() - stime < timeout:
+            time.sleep(0.002)
+        if not os.path.exists(ready):
+            return None
+        with open(ready, "r") as file:
+            return float(file.read()) - stime
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def report(module, result, ready, top, target):
+    print("=" * 78)
+    print("{}".format(module))
+    if ready is None:
+        print("  process start to first poll   :   not ready")
+    else:
+        print("  process start to first poll   : {:8.1f} ms".format(ready * 1000))
+    print("  process start to module import: {:8.1f} ms".format(result['wall'] * 1000))
+    print("  import of the module          : {:8.1f} ms".format(result['import'] * 1000))
+    print("  max RSS                       : {:8.1f} MB".format(result['rss_kb'] / 1024))
+    print("  heavy modules loaded          : {}".format(", ".join(result['heavy']) or "-"))
+
+    print("  top {} imports by cumulative time:".format(top))
+    entries = sorted(result['entries'], key=lambda e: e[1], reverse=True)
+    for self_us, cumulative_us, name in entries[:top]:
+        print("    {:>10.1f} ms {:>10.1f} ms  {}".format(cumulative_us / 1000, self_us / 1000, name))
+
+    ok = ready is not None and ready * 1000 <= target
+    print("  target {} ms: {}".format(target, "PASS" if ok else "FAIL"))
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Start up time report of the pipeline entry points.')
+    parser.add_argument('--modules', type=str, help='Comma separated modules.(Default: all entry points)',
+                        default=",".join(ENTRY_POINTS))
+    parser.add_argument('--top', type=int, help='Number of imports to list.(Default: 15)', default=15)
+    parser.add_argument('--target', type=float, help='Target of start up time in ms.(Default: 150)', default=150)
+    parser.add_argument('--repeat', type=int, help='Take the best of N runs.(Default: 3)', default=3)
+    parser.add_argument('--timeout', type=float, help='Seconds to wait for the first poll.(Default: 60)', default=60)
+    args = parser.parse_args()
+
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    failed = []
+    for module in args.modules.split(","):
+        results = [probe(module, cwd) for _ in range(max(args.repeat, 1))]
+        best = min(results, key=lambda r: r['wall'])
+        readies = [probe_ready(module, cwd, args.timeout) for _ in range(max(args.repeat, 1))]
+        ready = None if None in readies else min(readies)
+        if not report(module, best, ready, args.top, args.target):
+            failed.append(module)
+
+    print("=" * 78)
+    if failed:
+        print("Over target: {}".format(", ".join(failed)))
+        sys.exit(1)
+    print("Every entry point is within the target.")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@ import config.file_path as fp
 import utils.marker as mk
 import glob
 import argparse
+import utils.supervisor_control as supervisor_control
 
 parser = argparse.ArgumentParser(description='CDR output handler module.')
 
@@ -14,9 +15,12 @@ args = parser.parse_args()
 IDX = args.id
 fp.IDX = IDX
 
-running_files = glob.glob(fp.run_dir() + "*.run")
-for f in running_files:
-    with open(f, "r") as file:
-        pid = file.readline()
-    os.system('kill {}'.format(pid))
-    mk.debug_info("Process '{}' is successfully terminated.".format(pid))
+# [*]Supervisor stops its own children with the pids it tracks.
+if not supervisor_control.command_stop(args):
+    # [*]Fallback for stages started by hand.
+    running_files = glob.glob(fp.run_dir() + "*.run")
+    for f in running_files:
+        with open(f, "r") as file:
+            pid = file.readline()
+        os.system('kill {}'.format(pid))
+        mk.debug_info("Process '{}' is successfully terminated.".format(pid))
@@ -0,0 +1,436 @@
+"""
+@ File name: supervisor.py
+@ Version: 1.0.0
+@ Last update: 2026.OCT.19
+@ Company: Ntels Co., Ltd
+
+Pre-forking supervisor of the pipeline stages.
+Heavy modules are imported once here, and every stage is forked from this warm parent,
+so children share the interpreter and library pages copy-on-write.
+
+Usage:
+    python3 supervisor.py --id 1 --detectors detectors.txt start
+    python3 supervisor.py --id 1 status
+    python3 supervisor.py --id 1 --top 10 --sort lag metrics
+    python3 supervisor.py --id 1 --target 10.0.0.1:5 --seconds 60 profile
+    python3 supervisor.py --id 1 stop
+
+The detector list file has one detector per line: '<ip> <svc> [anomaly_detection.py options]'.
+Empty lines and lines start with '#' are ignored.
+"""
+import os
+import gc
+import sys
+import json
+import time
+import shlex
+import signal
+import argparse
+
+# [*]Heavy modules. Imported once and shared by every forked child.
+import numpy
+import dill
+import pickle
+import anomaly_detection
+import file_handler
+import output_handler
+import models.anomaly_detector
+import utils.metrics as metrics
+import utils.profiler as profiler
+import config.file_path as fp
+import utils.marker as mk
+
+from utils.graceful_killer import GracefulKiller
+from utils.logger import shutdown as log_shutdown
+from utils.supervisor_control import STOP_TIMEOUT, pid_path, state_path, running_pid, command_stop
+
+# [*]Restart backoff in seconds.
+BACKOFF_BASE = 1
+BACKOFF_MAX = 300
+# [*]A child is regarded stable after this seconds, and its backoff is reset.
+STABLE_TIME = 600
+
+
+class Child(object):
+    def __init__(self, name, module, argv, run_file):
+        """
+        Child process spec.
+        :param name: A String. Display name.
+        :param module: A Module. Stage module that has parse_args and run.
+        :param argv: A List. Command line arguments of the stage.
+        :param run_file: A String. Running marker the stage writes for itself.
+        """
+        self.name = name
+        self.module = module
+        self.argv = argv
+        self.run_file = run_file
+        self.pid = None
+        self.started = None
+        self.failures = 0
+        self.restarts = 0
+        self.next_start = 0
+        self.last_exit = None
+
+    def state(self):
+        return {
+            'name': self.name,
+            'pid': self.pid,
+            'started': self.started,
+            'restarts': self.restarts,
+            'last_exit': self.last_exit,
+            'next_start': self.next_start if self.pid is None else None
+        }
+
+
+class Supervisor(GracefulKiller):
+    def __init__(self, children):
+        super().__init__()
+        self.children = children
+        self.by_pid = {}
+
+    def spawn(self, child):
+        # [*]Stale marker of a crashed child blocks its restart.
+        if os.path.exists(child.run_file):
+            os.remove(child.run_file)
+
+        pid = os.fork()
+        if pid == 0:
+            # [*]Child process.
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            code = 0
+            try:
+                child.module.run(child.module.parse_args(child.argv))
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else 1
+            except BaseException:
+                code = 1
+            finally:
+                # [*]os._exit skips atexit, so background log writers are flushed here.
+                log_shutdown()
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+
+        child.pid = pid
+        child.started = time.time()
+        self.by_pid[pid] = child
+        mk.debug_info("{} is started: {}".format(child.name, pid))
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            child = self.by_pid.pop(pid, None)
+            if child is None:
+                continue
+
+            child.pid = None
+            child.last_exit = os.waitstatus_to_exitcode(status) if hasattr(os, 'waitstatus_to_exitcode') else status
+            if self.kill_now:
+                mk.debug_info("{} is stopped ({}).".format(child.name, child.last_exit))
+                continue
+
+            now = time.time()
+            if now - child.started >= STABLE_TIME:
+                child.failures = 0
+            backoff = min(BACKOFF_BASE * (2 ** child.failures), BACKOFF_MAX)
+            child.failures += 1
+            child.restarts += 1
+            child.next_start = now + backoff
+            mk.debug_info("{} is exited ({}). Restart in {} seconds.".format(child.name, child.last_exit, backoff),
+                          m_type="WARNING")
+
+    def write_state(self):
+        state = {
+            'pid': os.getpid(),
+            'updated': time.time(),
+            'children': [c.state() for c in self.children]
+        }
+        temp = state_path() + ".tmp"
+        with open(temp, "w") as file:
+            json.dump(state, file)
+        os.replace(temp, state_path())
+
+    def supervise(self):
+        # [*]Everything imported so far is never collected. Keeps the shared pages clean in children.
+        gc.collect()
+        if hasattr(gc, 'freeze'):
+            gc.freeze()
+
+        while not self.kill_now:
+            self.reap()
+            now = time.time()
+            for child in self.children:
+                if child.pid is None and child.next_start <= now and not self.kill_now:
+                    self.spawn(child)
+            self.write_state()
+            time.sleep(1)
+
+        self.shutdown()
+
+    def shutdown(self):
+        for child in self.children:
+            if child.pid is not None:
+                try:
+                    os.kill(child.pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+
+        deadline = time.time() + STOP_TIMEOUT
+        while self.by_pid and time.time() < deadline:
+            self.reap()
+            time.sleep(0.2)
+
+        for pid, child in list(self.by_pid.items()):
+            mk.debug_info("{} did not stop in time. Killed: {}".format(child.name, pid), m_type="WARNING")
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self.reap()
+
+        for path in [pid_path(), state_path()]:
+            if os.path.exists(path):
+                os.remove(path)
+        mk.debug_info("supervisor running end..")
+
+
+def load_children(args):
+    """
+    Build child specs from arguments and detector list file.
+    :param args: An argparse Namespace.
+    :return:
+        - children: A List of Child objects.
+    """
+    children = []
+    common = ['--id', args.id, '--log', args.log]
+
+    if not args.no_handlers:
+        children.append(Child("file_handler", file_handler, common + shlex.split(args.file_handler_args),
+                              fp.run_dir() + "file_handler.run"))
+        children.append(Child("output_handler", output_handler, common + shlex.split(args.output_handler_args),
+                              fp.run_dir() + "output_handler.run"))
+
+    if args.detectors:
+        with open(args.detectors, "r") as file:
+            for line in file:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                tokens = shlex.split(line)
+                ip, svc = tokens[0], tokens[1]
+                children.append(Child("detector {}:{}".format(ip, svc), anomaly_detection,
+                                      common + ['--ip', ip, '--svc', svc] + tokens[2:],
+                                      fp.run_dir() + "{}_{}.detector.run".format(ip, svc)))
+
+    if args.metrics_port:
+        children.append(Child("metrics", metrics, common + ['--port', str(args.metrics_port)],
+                              fp.run_dir() + "metrics.run"))
+    return children
+
+
+def daemonize(log_file):
+    """
+    Detach from the terminal with double fork. Stdout and stderr go to log_file.
+    """
+    if os.fork() > 0:
+        os._exit(0)
+    os.setsid()
+    if os.fork() > 0:
+        os._exit(0)
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    with open(os.devnull, "r") as null:
+        os.dup2(null.fileno(), sys.stdin.fileno())
+    with open(log_file, "a") as out:
+        os.dup2(out.fileno(), sys.stdout.fileno())
+        os.dup2(out.fileno(), sys.stderr.fileno())
+
+
+def command_run(args, detach=False):
+    if running_pid() is not None:
+        mk.debug_info("supervisor is already running. Check your process.", m_type="WARNING")
+        return
+
+    for d in [fp.run_dir(), fp.log_dir()]:
+        if not os.path.exists(d):
+            os.makedirs(d)
+
+    children = load_children(args)
+    if detach:
+        daemonize(fp.log_dir() + "supervisor.log")
+
+    with open(pid_path(), "w") as file:
+        file.write(str(os.getpid()))
+
+    mk.debug_info("supervisor starts running: {} children.".format(len(children)))
+    Supervisor(children).supervise()
+
+
+def command_status(args):
+    pid = running_pid()
+    if pid is None or not os.path.exists(state_path()):
+        print("supervisor is not running.")
+        return
+
+    with open(state_path(), "r") as file:
+        state = json.load(file)
+
+    now = time.time()
+    print("supervisor pid: {} (updated {:.0f}s ago)".format(state['pid'], now - state['updated']))
+    print("{:<40} {:>8} {:>10} {:>9} {:>10}".format("NAME", "PID", "UPTIME", "RESTARTS", "LAST_EXIT"))
+    for c in state['children']:
+        uptime = "-" if c['pid'] is None else "{:.0f}s".format(now - c['started'])
+        pid = "-" if c['pid'] is None else c['pid']
+        last_exit = "-" if c['last_exit'] is None else c['last_exit']
+        print("{:<40} {:>8} {:>10} {:>9} {:>10}".format(c['name'], pid, uptime, c['restarts'], last_exit))
+
+
+def metrics_summary():
+    """
+    Summarize metrics files of the processor by process.
+    :return:
+        - A Dictionary. (stage, ip, svc) -> {metric name: value}. Histograms give '<name>_mean'.
+    """
+    summary = {}
+    for text in metrics.read_all():
+        types, samples = metrics.parse(text)
+        for name, labels, value, _ in samples:
+            if 'le' in labels:
+                continue
+            key = (labels.get('stage'), labels.get('ip', '-'), labels.get('svc', '-'))
+            entry = summary.setdefault(key, {})
+            name = name[len(metrics.PREFIX):]
+            entry[name] = entry.get(name, 0) + value if name.endswith('_total') else value
+
+    for entry in summary.values():
+        for name in list(entry.keys()):
+            if name.endswith('_sum') and entry.get(name[:-4] + '_count'):
+                entry[name[:-4] + '_mean'] = entry[name] / entry[name[:-4] + '_count']
+    return summary
+
+
+def command_metrics(args):
+    summary = metrics_summary()
+    if not summary:
+        print("There is no metrics file in {}".format(fp.metrics_dir()))
+        return
+
+    now = time.time()
+
+    def fmt(entry, name, scale=1.0, pattern="{:.1f}"):
+        return "-" if name not in entry else pattern.format(entry[name] * scale)
+
+    print("{:<16} {:>10} {:>8} {:>8} {:>12} {:>10}".format("STAGE", "ROWS", "FILES", "QUEUE", "LAST_LAG(s)", "UPDATED"))
+    for stage in ['file_handler', 'output_handler']:
+        entry = summary.get((stage, '-', '-'))
+        if entry is None:
+            continue
+        print("{:<16} {:>10} {:>8} {:>8} {:>12} {:>10}".format(
+            stage, fmt(entry, 'rows_total', pattern="{:.0f}"), fmt(entry, 'files_total', pattern="{:.0f}"),
+            fmt(entry, 'queue_depth', pattern="{:.0f}"), fmt(entry, 'last_lag_seconds'),
+            "{:.0f}s ago".format(now - entry.get('updated_timestamp_seconds', now))))
+
+    keys = {
+        'score': 'score_seconds_mean',
+        'detection': 'detection_seconds_mean',
+        'lag': 'last_lag_seconds',
+        'queue': 'queue_depth'
+    }
+    detectors = [(k, e) for k, e in summary.items() if k[0] == 'detector']
+    detectors.sort(key=lambda d: d[1].get(keys[args.sort], 0), reverse=True)
+
+    print()
+    print("Slowest {} of {} detectors by {}:".format(min(args.top, len(detectors)), len(detectors), args.sort))
+    print("{:<32} {:>10} {:>8} {:>11} {:>12} {:>11} {:>12} {:>10}".format(
+        "DETECTOR", "ROWS", "QUEUE", "SCORE(ms)", "THRESH(ms)", "WRITE(ms)", "LAST_LAG(s)", "UPDATED"))
+    for (_, ip, svc), entry in detectors[:args.top]:
+        print("{:<32} {:>10} {:>8} {:>11} {:>12} {:>11} {:>12} {:>10}".format(
+            "{}:{}".format(ip, svc), fmt(entry, 'rows_total', pattern="{:.0f}"),
+            fmt(entry, 'queue_depth', pattern="{:.0f}"), fmt(entry, 'score_seconds_mean', 1000, "{:.2f}"),
+            fmt(entry, 'threshold_seconds_mean', 1000, "{:.2f}"), fmt(entry, 'write_seconds_mean', 1000, "{:.2f}"),
+            fmt(entry, 'last_lag_seconds'), "{:.0f}s ago".format(now - entry.get('updated_timestamp_seconds', now))))
+
+
+def command_profile(args):
+    """
+    Request a profile of a running stage through its control file.
+    Results are written into the log directory of the stage.
+    """
+    if args.target in ('file_handler', 'output_handler'):
+        name = args.target
+    elif ':' in args.target:
+        name = "detector_{}_{}".format(*args.target.split(':', 1))
+    else:
+        mk.debug_info("Profile target should be file_handler, output_handler or <ip>:<svc>.", m_type="ERROR")
+        return
+
+    path = profiler.control_path(fp.run_dir(), name)
+    with open(path + ".tmp", "w") as file:
+        file.write("mode={}\nseconds={}\niterations={}\n".format(args.mode, args.seconds, args.iterations))
+    os.replace(path + ".tmp", path)
+    mk.debug_info("Profile is requested: {}".format(path))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Pre-forking supervisor of CDR pipeline.')
+    parser.add_argument('command', type=str, choices=['start', 'run', 'stop', 'status', 'metrics', 'profile'],
+                        help='start: run in background, run: run in foreground, stop, status, '
+                             'metrics: stage metrics and the slowest detectors, profile: profile a running stage.')
+
+    # [*]Mandatory parameter.
+    parser.add_argument('--id', type=str, help='ID of ML processor', default="main")
+
+    # [*]Children.
+    parser.add_argument('--detectors', type=str, help='Detector list file. One \'<ip> <svc> [options]\' per line.',
+                        default=None)
+    parser.add_argument('--no_handlers', action='store_true', help='Do not run file_handler and output_handler.')
+    parser.add_argument('--file_handler_args', type=str, help='Extra options of file_handler.', default='')
+    parser.add_argument('--output_handler_args', type=str, help='Extra options of output_handler.', default='')
+    parser.add_argument('--log', type=str, help='Set log level of children', default="INFO")
+    parser.add_argument('--metrics_port', type=int, help='Serve metrics on localhost at this port.(Default: 0, off)',
+                        default=0)
+
+    # [*]Metrics command.
+    parser.add_argument('--top', type=int, help='Number of detectors to list.(Default: 10)', default=10)
+    parser.add_argument('--sort', type=str, choices=['score', 'detection', 'lag', 'queue'], default='score',
+                        help='Order of the detector list.(Default: score)')
+
+    # [*]Profile command.
+    parser.add_argument('--target', type=str, help='file_handler, output_handler or <ip>:<svc>.',
+                        default='output_handler')
+    parser.add_argument('--mode', type=str, choices=['cprofile', 'sample'], default='cprofile',
+                        help='cprofile or stack sampling.(Default: cprofile)')
+    parser.add_argument('--seconds', type=float, help='Profiling duration.(Default: 30)', default=30)
+    parser.add_argument('--iterations', type=int, help='Main loop iterations to profile instead of seconds.',
+                        default=0)
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    fp.IDX = args.id
+
+    if args.command == 'start':
+        command_run(args, detach=True)
+    elif args.command == 'run':
+        command_run(args)
+    elif args.command == 'stop':
+        command_stop(args)
+    elif args.command == 'status':
+        command_status(args)
+    elif args.command == 'metrics':
+        command_metrics(args)
+    elif args.command == 'profile':
+        command_profile(args)
+
+
+if __name__ == '__main__':
+    main()
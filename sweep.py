@@ -0,0 +1,160 @@
+"""
+@ File name: sweep.py
+@ Version: 1.0.0
+@ Last update: 2026.OCT.19
+@ Company: Ntels Co., Ltd
+
+Hyper parameter sweep of the RRCF training.
+    - Each series is shingled once per sequences value.
+    - Per (sequences, leaves), only the largest forest is built. Every point is scored by every tree once.
+    - Smaller tree counts are evaluated as prefixes of that forest, since trees are independent.
+    - Every quantile is evaluated from the same score vector.
+
+Usage:
+    python3 sweep.py --trees 20,40,80 --leaves 864,1440 --seq 5,6 --q 0.95,0.99 --out sweep_result.csv
+"""
+import os
+import csv
+import glob
+import timeit
+import argparse
+import numpy as np
+import models.rrcf as rrcf
+import models.shingle as shingle
+import utils.marker as marker
+import training_module
+
+from collections import deque
+from multiprocessing import Pool
+from utils.data_cache import SeriesCache
+
+COLUMNS = ['pgw_ip', 'svc_type', 'sequences', 'leaves', 'trees', 'quantile', 'threshold', 'anomalies', 'points',
+           'shingle_time', 'build_time', 'eval_time']
+
+
+def parse_list(value, cast):
+    return [cast(v) for v in value.split(",") if v]
+
+
+def tree_scores(points, num_trees, leaves_size):
+    """
+    Stream the points into a forest in the same way as RRCF.train_rrcf, keeping CoDisp per tree.
+    :param points: A numpy array. Shingled points (n x d).
+    :param num_trees: An Integer. Number of trees.
+    :param leaves_size: An Integer. Leaf size.
+    :return:
+        - scores: A numpy array. (n x num_trees) CoDisp of each point on each tree.
+    """
+    forest = [rrcf.RCTree() for _ in range(num_trees)]
+    window = deque()
+    scores = np.empty((len(points), num_trees), dtype=np.float64)
+    remove_index = None
+
+    for index, point in enumerate(points):
+        if len(window) >= leaves_size:
+            remove_index = window.popleft()
+
+        for t, tree in enumerate(forest):
+            if len(tree.leaves) >= leaves_size:
+                tree.forget_point(remove_index)
+            tree.insert_point(point, index=index)
+            scores[index, t] = tree.codisp(index)
+
+        window.append(index)
+    return scores
+
+
+def sweep_series(job):
+    """
+    Sweep every configuration of a series. It is worked by a pool worker.
+    :param job: A Tuple. (pgw_ip, svc_type, trees, leaves, sequences, quantiles, seed)
+    :return:
+        - rows: A List of result rows. See COLUMNS.
+    """
+    pgw_ip, svc_type, trees, leaves, sequences, quantiles, seed = job
+    (_, data), _ = training_module.data_separation(pgw_ip, svc_type)
+
+    rows = []
+    for seq in sequences:
+        if len(data) < seq:
+            marker.debug_info("{}::{} is shorter than sequences {}.".format(pgw_ip, svc_type, seq), m_type="WARNING")
+            continue
+
+        stime = timeit.default_timer()
+        points = np.asarray(list(shingle.shingle(data, size=seq)))
+        shingle_time = timeit.default_timer() - stime
+
+        for leaf in leaves:
+            if seed is not None:
+                np.random.seed(seed)
+
+            stime = timeit.default_timer()
+            scores = tree_scores(points, max(trees), leaf)
+            build_time = timeit.default_timer() - stime
+
+            # [*]Running sum over trees. Column t-1 is the sum of the first t trees.
+            cumulative = np.cumsum(scores, axis=1)
+            for t in sorted(trees):
+                stime = timeit.default_timer()
+                avg_codisp = cumulative[:, t - 1] / t
+                thresholds = np.nanquantile(avg_codisp, quantiles)
+                eval_time = timeit.default_timer() - stime
+
+                for q, threshold in zip(quantiles, thresholds):
+                    rows.append([pgw_ip, svc_type, seq, leaf, t, q, threshold, int((avg_codisp >= threshold).sum()),
+                                 len(avg_codisp), shingle_time, build_time, eval_time])
+
+        marker.debug_info("{}::{} sequences {} is done.".format(pgw_ip, svc_type, seq))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Hyper parameter sweep of CDR anomaly detector training.')
+    parser.add_argument('--trees', type=str, help='Comma separated number of trees.(Default: 20,40,80)',
+                        default='20,40,80')
+    parser.add_argument('--leaves', type=str, help='Comma separated leaf sizes.(Default: 864,1440)',
+                        default='864,1440')
+    parser.add_argument('--seq', type=str, help='Comma separated sequences.(Default: 5,6)', default='5,6')
+    parser.add_argument('--q', type=str, help='Comma separated quantiles.(Default: 0.95,0.99,0.995)',
+                        default='0.95,0.99,0.995')
+    parser.add_argument('--out', type=str, help='Result table.(Default: ./sweep_result.csv)',
+                        default='./sweep_result.csv')
+    parser.add_argument('--workers', type=int, help='Number of processes.(Default: cpu count)',
+                        default=os.cpu_count() or 1)
+    parser.add_argument('--seed', type=int, help='Random seed of forests.', default=None)
+    parser.add_argument('--cache_dir', type=str, help='Parsed data cache directory.(Default: ./cache)',
+                        default='./cache')
+    parser.add_argument('--cache_size', type=int, help='Size limit of the cache in MB.(Default: 4096)', default=4096)
+    args = parser.parse_args()
+
+    trees = parse_list(args.trees, int)
+    leaves = parse_list(args.leaves, int)
+    sequences = parse_list(args.seq, int)
+    quantiles = parse_list(args.q, float)
+
+    training_module.cache = SeriesCache(args.cache_dir, args.cache_size * 1024 * 1024)
+
+    jobs = []
+    for pgw_ip in training_module.pgw_ip_list.l_pgw_ip:
+        for fname in glob.glob("./data/{}/*.csv".format(pgw_ip)):
+            svc_type = fname.split('/')[-1].split('.')[0]
+            jobs.append((pgw_ip, svc_type, trees, leaves, sequences, quantiles, args.seed))
+    jobs.sort(key=lambda j: os.path.getsize("./data/{}/{}.csv".format(j[0], j[1])), reverse=True)
+
+    marker.debug_info("Sweep {} series x {} configurations.".format(
+        len(jobs), len(trees) * len(leaves) * len(sequences) * len(quantiles)))
+
+    stime = timeit.default_timer()
+    with open(args.out, "w") as file:
+        writer = csv.writer(file)
+        writer.writerow(COLUMNS)
+        with Pool(processes=args.workers) as pool:
+            for rows in pool.imap_unordered(sweep_series, jobs):
+                writer.writerows(rows)
+                file.flush()
+
+    marker.debug_info("Sweep is finished: {} ({:.1f}s)".format(args.out, timeit.default_timer() - stime))
+
+
+if __name__ == '__main__':
+    main()
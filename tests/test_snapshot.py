@@ -0,0 +1,78 @@
+"""
+@ File name: test_snapshot.py
+@ Version: 1.0.0
+@ Last update: 2026.OCT.19
+@ Company: Ntels Co., Ltd
+
+Round trip of the compact forest snapshot.
+"""
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from models.rrcf import RCTree
+from models.snapshot import forest_to_arrays, arrays_to_forest, save_forest, load_forest
+
+
+def forest():
+    points = np.random.RandomState(3).rand(40, 3)
+    # [*]Duplicate points share a leaf.
+    points[10] = points[11] = points[12]
+    labels = list(range(40))
+    return [RCTree.from_points(points, labels, random_state=seed) for seed in (1, 2)] + \
+        [RCTree.from_points(points, labels), RCTree()]
+
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp() + "/"
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_round_trip(self):
+        original = forest()
+        save_forest(self.directory + "forest.npz", original)
+        restored = load_forest(self.directory + "forest.npz")
+
+        before, after = forest_to_arrays(original), forest_to_arrays(restored)
+        for key in before:
+            np.testing.assert_array_equal(after[key], before[key], err_msg=key)
+        for a, b in zip(original, restored):
+            self.assertEqual(sorted(a.leaves), sorted(b.leaves))
+            for key in a.leaves:
+                self.assertEqual(b.codisp(key), a.codisp(key))
+                self.assertEqual(b.leaves[key].n, a.leaves[key].n)
+            if a.root is not None:
+                np.testing.assert_array_equal(b.root.b, a.root.b)
+                self.assertEqual(b.root.n, a.root.n)
+
+    def test_duplicate_leaves(self):
+        restored = arrays_to_forest(forest_to_arrays(forest()))
+        for tree in restored[:3]:
+            self.assertIs(tree.leaves[10], tree.leaves[12])
+            self.assertEqual(tree.leaves[10].n, 3)
+            self.assertEqual(len(tree.leaves), 40)
+
+    def test_rng_state(self):
+        original = forest()
+        # [*]A cached gaussian is a part of the state as well.
+        original[0].rng.standard_normal()
+        restored = arrays_to_forest(forest_to_arrays(original))
+
+        for a, b in zip(original[:2], restored[:2]):
+            self.assertIsInstance(b.rng, np.random.RandomState)
+            self.assertEqual(b.rng.standard_normal(), a.rng.standard_normal())
+            np.testing.assert_array_equal(b.rng.uniform(size=5), a.rng.uniform(size=5))
+        self.assertIs(restored[2].rng, np.random)
+
+    def test_snapshot_without_rng_state(self):
+        arrays = forest_to_arrays(forest())
+        for key in ('rng_tree', 'rng_keys', 'rng_pos', 'rng_gauss'):
+            del arrays[key]
+        self.assertTrue(all(tree.rng is np.random for tree in arrays_to_forest(arrays)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+"""
+@ File name: test_wal.py
+@ Version: 1.0.0
+@ Last update: 2026.OCT.19
+@ Company: Ntels Co., Ltd
+
+Recovery of a detector from a checkpoint and the WAL tail.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from collections import deque
+from models.rrcf_cls import RRCF
+from models.snapshot import forest_to_arrays
+from utils.wal import WriteAheadLog, read_segment, write_checkpoint, read_checkpoint
+
+SEQUENCES = 3
+
+
+def records(count):
+    rng = np.random.RandomState(1)
+    return [['10.0.0.1', '2026-01-01 {:02d}:{:02d}'.format(i // 60, i % 60), 'A',
+             float(rng.randint(100, 200)), float(rng.randint(50, 100))] for i in range(count)]
+
+
+def feed(model, window, rows):
+    """
+    Score rows the way the detector does: a point is a window of the last SEQUENCES minutes.
+    """
+    scores = []
+    for r in rows:
+        window.append([r[3], r[4]])
+        if len(window) == SEQUENCES:
+            scores.append(model.anomaly_score([r[1]], np.array(window, dtype=float)))
+    return scores
+
+
+class WriteAheadLogTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp() + "/"
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_torn_last_line_is_skipped(self):
+        wal = WriteAheadLog(self.directory + "wal/")
+        wal.append(records(3))
+        wal.close()
+        path = wal.segments()[-1][1]
+        with open(path, "a") as file:
+            file.write("10.0.0.1|2026-01-01 00:03|A|12")
+
+        self.assertEqual(read_segment(path), records(3))
+
+    def test_truncate_keeps_open_segment(self):
+        wal = WriteAheadLog(self.directory + "wal/")
+        wal.append(records(1))
+        self.assertEqual(wal.rotate(), 0)
+        wal.append(records(2))
+        self.assertEqual(wal.rotate(), 1)
+        wal.append(records(3))
+        wal.flush()
+
+        wal.truncate(10)
+        self.assertEqual([s for s, _ in wal.segments()], [2])
+        self.assertEqual(read_segment(wal.segments()[0][1]), records(3))
+        wal.close()
+
+    def test_new_process_never_appends_to_old_segment(self):
+        wal = WriteAheadLog(self.directory + "wal/")
+        wal.append(records(2))
+        wal.close()
+
+        reopened = WriteAheadLog(self.directory + "wal/")
+        self.assertEqual(reopened.segment, 1)
+        self.assertEqual([s for s, _ in reopened.segments(after=0)], [1])
+        reopened.close()
+
+    def test_checkpoint_and_replay_match_uninterrupted_run(self):
+        rows = records(80)
+        split = 45
+
+        # [*]Uninterrupted run.
+        np.random.seed(7)
+        model = RRCF(num_trees=5, sequences=SEQUENCES, leaves_size=20)
+        expected = feed(model, deque(maxlen=SEQUENCES), rows)
+
+        # [*]Checkpoint after 'split' records, and the rest is only in the WAL when the process dies.
+        np.random.seed(7)
+        crashed = RRCF(num_trees=5, sequences=SEQUENCES, leaves_size=20)
+        window = deque(maxlen=SEQUENCES)
+        before = feed(crashed, window, rows[:split])
+        wal = WriteAheadLog(self.directory + "wal/")
+        write_checkpoint(self.directory + "checkpoint.pkl",
+                         {'model': crashed, 'window': window, 'random': np.random.get_state(),
+                          'segment': wal.segment - 1})
+        wal.append(rows[split:])
+        wal.flush()
+        np.random.seed(99)
+
+        # [*]Recovery.
+        state = read_checkpoint(self.directory + "checkpoint.pkl")
+        np.random.set_state(state['random'])
+        after = []
+        reopened = WriteAheadLog(self.directory + "wal/")
+        for _, path in reopened.segments(after=state['segment']):
+            after += feed(state['model'], state['window'], read_segment(path))
+        reopened.close()
+
+        self.assertEqual(before + after, expected)
+        restored, uninterrupted = forest_to_arrays(state['model'].forest), forest_to_arrays(model.forest)
+        for key in uninterrupted:
+            np.testing.assert_array_equal(restored[key], uninterrupted[key], err_msg=key)
+
+
+if __name__ == '__main__':
+    unittest.main()
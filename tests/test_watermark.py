@@ -0,0 +1,77 @@
+"""
+@ File name: test_watermark.py
+@ Version: 1.0.0
+@ Last update: 2026.OCT.19
+@ Company: Ntels Co., Ltd
+
+Minute completion of the output handler.
+"""
+import unittest
+
+from utils.watermark import MinuteWatermark
+
+A = ('10.0.0.1', 'A')
+B = ('10.0.0.1', 'B')
+C = ('10.0.0.2', 'A')
+
+
+class MinuteWatermarkTest(unittest.TestCase):
+    def setUp(self):
+        self.watermark = MinuteWatermark(deadline=60, idle=180)
+        # [*]Every detector has reported once before.
+        for detector in (A, B, C):
+            self.watermark.add(detector[0], detector[1], '2026-01-01 00:00', [], now=0)
+        self.watermark.pop_complete({A, B, C}, now=0)
+
+    def test_complete_when_every_detector_reported(self):
+        self.watermark.add(A[0], A[1], '2026-01-01 00:01', [1], now=10)
+        self.watermark.add(B[0], B[1], '2026-01-01 00:01', [2], now=11)
+        self.assertEqual(self.watermark.pop_complete({A, B, C}, now=12), [])
+
+        self.watermark.add(C[0], C[1], '2026-01-01 00:01', [], now=13)
+        self.assertEqual(self.watermark.pop_complete({A, B, C}, now=14),
+                         [('2026-01-01 00:01', [[1], [2]], 0, set())])
+        self.assertEqual(self.watermark.pending_count(), 0)
+
+    def test_written_by_deadline(self):
+        self.watermark.add(A[0], A[1], '2026-01-01 00:01', [1], now=10)
+        self.assertEqual(self.watermark.pop_complete({A, B, C}, now=69), [])
+        self.assertEqual(self.watermark.pop_complete({A, B, C}, now=70),
+                         [('2026-01-01 00:01', [[1]], 0, {B, C})])
+
+    def test_late_arrival_gets_next_sequence(self):
+        self.watermark.add(A[0], A[1], '2026-01-01 00:01', [1], now=10)
+        self.watermark.pop_complete({A, B, C}, now=70)
+        self.watermark.add(B[0], B[1], '2026-01-01 00:01', [2], now=80)
+        self.watermark.add(C[0], C[1], '2026-01-01 00:01', [], now=80)
+        # [*]A already reported the minute in its first flush, so the late one waits for it until the deadline.
+        self.assertEqual(self.watermark.pop_complete({A, B, C}, now=81), [])
+        self.assertEqual(self.watermark.pop_complete({A, B, C}, now=140),
+                         [('2026-01-01 00:01', [[2]], 1, {A})])
+
+    def test_minutes_are_ready_in_order(self):
+        for dtmm in ('2026-01-01 00:02', '2026-01-01 00:01'):
+            for detector in (A, B, C):
+                self.watermark.add(detector[0], detector[1], dtmm, [dtmm], now=10)
+        self.assertEqual([r[0] for r in self.watermark.pop_complete({A, B, C}, now=11)],
+                         ['2026-01-01 00:01', '2026-01-01 00:02'])
+
+    def test_idle_and_new_detectors_are_not_waited_for(self):
+        warming_up = ('10.0.0.3', 'A')
+        self.watermark.add(A[0], A[1], '2026-01-01 00:05', [1], now=200)
+        self.watermark.add(B[0], B[1], '2026-01-01 00:05', [2], now=200)
+        # [*]C has been silent for more than 'idle' seconds, and the new one never reported.
+        self.assertEqual(self.watermark.reporting({A, B, C, warming_up}, now=201), {A, B})
+        self.assertEqual(self.watermark.pop_complete({A, B, C, warming_up}, now=201),
+                         [('2026-01-01 00:05', [[1], [2]], 0, set())])
+
+    def test_stopped_detector_is_forgotten(self):
+        self.watermark.add(A[0], A[1], '2026-01-01 00:01', [1], now=10)
+        self.watermark.add(B[0], B[1], '2026-01-01 00:01', [2], now=10)
+        self.assertEqual(self.watermark.pop_complete({A, B}, now=11),
+                         [('2026-01-01 00:01', [[1], [2]], 0, set())])
+        self.assertNotIn(C, self.watermark.last_report)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,52 +6,93 @@
 @ Company: Ntels Co., Ltd
 """
 
-import pandas as pd
+import numpy as np
 import pickle
 import os
 import dill
 import glob
+import timeit
+import resource
 import config.pgw_ip_address as pgw_ip_list
 import utils.marker as marker
 import argparse
 from models.rrcf_cls import RRCF
+from multiprocessing import Pool
+from datetime import datetime
+from utils.data_cache import SeriesCache, parse_csv
+
+# [*]Parsed training data cache. None means csv is parsed every time.
+cache = None
 
 
 def data_separation(pgw_ip, svc_type):
     """
-    Data load from csv file.
+    Data load from csv file. Parsed series come from the cache, if it is enabled.
+    :return:
+        - train: A Tuple. (date, data) before 2019-08-01.
+        - test: A Tuple. (date, data) from 2019-08-01.
     """
-    df = pd.read_csv("./data/{}/{}.csv".format(pgw_ip, svc_type))
-    df['DTmm'] = pd.to_datetime(df['DTmm'], format='%Y-%m-%d %H:%M')
-    df_train = df.loc[df['DTmm'] < '2019-08-01']
-    df_test = df.loc[df['DTmm'] >= '2019-08-01'].reset_index(drop=True)
-
-    return df_train, df_test
-
-
-def train_models(data, num_of_trees, sequences, num_of_leaves, quantile, write_file=False):
-    date = data['data']['DTmm']
-    train_data = data['data'][['Real_Up', 'Real_Dn']]
-    train_data = train_data.to_numpy()
-    o_rrcf = RRCF(num_trees=num_of_trees, sequences=sequences, leaves_size=num_of_leaves)
-    score, ftime = o_rrcf.train_rrcf(date, train_data, timer=True)
+    path = "./data/{}/{}.csv".format(pgw_ip, svc_type)
+    if cache is not None:
+        ts, values = cache.load(path)
+    else:
+        ts, values = parse_csv(path)
+
+    split = np.datetime64('2019-08-01', 'm').astype(np.int64)
+    if len(ts) < 2 or (ts[1:] >= ts[:-1]).all():
+        # [*]Time ordered data is split without copying the memory map.
+        n = np.searchsorted(ts, split)
+        train = (ts[:n].astype('datetime64[m]'), values[:n])
+        test = (ts[n:].astype('datetime64[m]'), values[n:])
+    else:
+        mask = ts < split
+        train = (ts[mask].astype('datetime64[m]'), values[mask])
+        test = (ts[~mask].astype('datetime64[m]'), values[~mask])
+
+    return train, test
+
+
+def train_models(data, num_of_trees, sequences, num_of_leaves, quantile, write_file=False, calibration=None,
+                 instance_dir='instances'):
+    """
+    Train a model and calibrate its threshold.
+    :param calibration: A Dictionary. 'sample_rate', 'skip_warmup', 'seed', 'confidence' and 'stride'.
+        (None: every point)
+    :param instance_dir: A String. Directory name of the written models. (Default: instances)
+    """
+    calibration = calibration or {}
+    date, train_data = data['data']
+    o_rrcf = RRCF(num_trees=num_of_trees, sequences=sequences, leaves_size=num_of_leaves,
+                  stride=calibration.get('stride', 1))
+    score, ftime = o_rrcf.train_rrcf(date, train_data, timer=True,
+                                     sample_rate=calibration.get('sample_rate', 1.0),
+                                     skip_warmup=calibration.get('skip_warmup', False),
+                                     seed=calibration.get('seed'))
     marker.debug_info("Required time: {}".format(ftime))
 
-    _ = o_rrcf.calc_threshold(score, quantile, with_data=False)
-    marker.debug_info("Threshold: {}".format(o_rrcf.threshold))
+    o_rrcf.threshold, lower, upper = o_rrcf.calc_threshold_ci(score, quantile,
+                                                              confidence=calibration.get('confidence', 0.95))
+    marker.debug_info("Threshold: {} ({}% CI: {} ~ {}, {} sampled scores)".format(
+        o_rrcf.threshold, calibration.get('confidence', 0.95) * 100, lower, upper, len(score)))
 
     if write_file:
-        instance_path = "./{}/{}/{}/".format(INSTANCE_DIR, data['pgw_ip'], data['svc_type'])
+        instance_path = "./{}/{}/{}/".format(instance_dir, data['pgw_ip'], data['svc_type'])
 
         if not os.path.exists(instance_path):
             marker.debug_info("Instance directory is not exist. Creating one...")
-            os.makedirs(instance_path)
+            # [*]Parallel jobs of the same pgw ip could create the parent at the same time.
+            os.makedirs(instance_path, exist_ok=True)
 
         with open(instance_path + "hyper_parameter.txt", "w") as file:
             file.write("number of trees: {}\n".format(o_rrcf.num_trees))
             file.write("number of leaves: {}\n".format(o_rrcf.leaves_size))
             file.write("sequences: {}\n".format(o_rrcf.sequences))
             file.write("required time: {}\n".format(ftime))
+            file.write("threshold: {}\n".format(o_rrcf.threshold))
+            file.write("threshold interval: {} ~ {} ({} confidence)\n".format(
+                lower, upper, calibration.get('confidence', 0.95)))
+            file.write("calibration sample: {} scores (rate: {}, skip warm-up: {})\n".format(
+                len(score), calibration.get('sample_rate', 1.0), calibration.get('skip_warmup', False)))
 
         with open(instance_path + "model.pkl", "wb") as output:
             dill.dump(o_rrcf, output)
@@ -60,50 +101,115 @@ def train_models(data, num_of_trees, sequences, num_of_leaves, quantile, write_f
             dill.dump(score, file)
 
 
-def load(pgw_ip, svc_type):
-    with open('./{}/{}/{}/model.pkl'.format(INSTANCE_DIR, pgw_ip, svc_type), "rb") as file:
+def load(pgw_ip, svc_type, instance_dir='instances'):
+    with open('./{}/{}/{}/model.pkl'.format(instance_dir, pgw_ip, svc_type), "rb") as file:
         rrcf_object = pickle.load(file)
     return rrcf_object
 
 
-def main(num_of_trees, num_of_leaves, sequences, quantile=0.99):
-    l_pgw_ip = pgw_ip_list.l_pgw_ip
+def report(file_name, line):
+    """
+    Append a line into the error report directory.
+    """
+    os.makedirs('./error_report', exist_ok=True)
+    with open("./error_report/{}".format(file_name), "a") as file:
+        file.write(line)
 
-    for pgw_ip in l_pgw_ip:
 
-        marker.debug_info("Running \'pgw_ip - {}\'".format(pgw_ip))
-        l_svc_type = glob.glob("./data/{}/*.csv".format(pgw_ip))
+def train_job(job):
+    """
+    Train a model of a (pgw_ip, svc_type) pair. It is worked by a pool worker.
+    :param job: A Tuple. (pgw_ip, fname, num_of_trees, num_of_leaves, sequences, quantile, max_mem, calibration,
+        instance_dir)
+    :return:
+        - A Tuple. (pgw_ip, fname, status, message, required time)
+    """
+    pgw_ip, fname, num_of_trees, num_of_leaves, sequences, quantile, max_mem, calibration, instance_dir = job
+    svc_type = fname.split('/')[-1].split('.')[0]
+    stime = timeit.default_timer()
+
+    if max_mem > 0:
+        # [*]Address space limit of this job. The worker process is not reused after the job.
+        limit = max_mem * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
 
-        for fname in l_svc_type:
+    marker.debug_info("\t \'pgw_ip - {}\' \'svc_type - {}\'".format(pgw_ip, svc_type))
 
-            name = fname.split('/')[-1]
-            svc_type = name.split('.')[0]
+    try:
+        train, test = data_separation(pgw_ip, svc_type)
 
-            marker.debug_info("\t \'svc_type - {}\'".format(svc_type))
+        if len(train[0]) < sequences:
+            # NOTE: If there are not enough data length, it will pass
+            return pgw_ip, fname, 'skipped', 'not enough data', timeit.default_timer() - stime
 
-            df_train, df_test = data_separation(pgw_ip, svc_type)
+        data = {
+            'pgw_ip': pgw_ip,
+            'svc_type': svc_type,
+            'data': train
+        }
 
-            if len(df_train.index) < sequences:
-                # NOTE: If there are not enough data length, it will pass
-                if not os.path.exists('./error_report/'):
-                    os.mkdir('./error_report')
-                with open("./error_report/untrained_model.txt", "a") as file:
-                    file.write("{}::{}\n".format(pgw_ip, fname))
-                continue
+        train_models(data, num_of_trees, sequences, num_of_leaves, quantile, write_file=True,
+                     calibration=calibration, instance_dir=instance_dir)
+    except MemoryError:
+        return pgw_ip, fname, 'failed', 'memory limit exceeded ({} MB)'.format(max_mem), timeit.default_timer() - stime
+    except (Exception, SystemExit) as e:
+        return pgw_ip, fname, 'failed', repr(e), timeit.default_timer() - stime
 
-            data = {
-                'pgw_ip': pgw_ip,
-                'svc_type': svc_type,
-                'data': df_train
-            }
+    return pgw_ip, fname, 'done', '', timeit.default_timer() - stime
 
-            try:
-                train_models(data, num_of_trees, sequences, num_of_leaves, quantile, write_file=True)
-            except Exception as e:
-                marker.debug_info("PGW IP: {} / SVC_TYPE: {} / Error occurs: {}".format(pgw_ip, svc_type, e))
-                with open("./error_report/untrained_model.txt", "a") as file:
-                    file.write("{}::{} - Error: {}\n".format(pgw_ip, fname, e))
-                continue
+
+def main(num_of_trees, num_of_leaves, sequences, quantile=0.99, workers=1, max_mem=0, cache_dir=None, cache_size=0,
+         calibration=None, instance_dir='instances'):
+    """
+    Train every (pgw_ip, svc_type) pair on a process pool.
+    Jobs are ordered by data size, so the stragglers start first.
+    A failed job is reported into './error_report/' and doesn't abort the batch.
+    :param num_of_trees: An Integer. Number of trees.
+    :param num_of_leaves: An Integer. Leaf size.
+    :param sequences: An Integer. Sequences.
+    :param quantile: A Float. Quantile.
+    :param workers: An Integer. Number of worker processes.
+    :param max_mem: An Integer. Memory limit per job in MB. (0: no limit)
+    :param cache_dir: A String. Parsed data cache directory. (None: no cache)
+    :param cache_size: An Integer. Size limit of the cache in MB.
+    :param calibration: A Dictionary. Threshold calibration options. See train_models.
+    :param instance_dir: A String. Directory name of the written models.
+    :return: None.
+    """
+    global cache
+
+    if cache_dir is not None:
+        cache = SeriesCache(cache_dir, cache_size * 1024 * 1024)
+
+    l_pgw_ip = pgw_ip_list.l_pgw_ip
+
+    jobs = []
+    for pgw_ip in l_pgw_ip:
+        for fname in glob.glob("./data/{}/*.csv".format(pgw_ip)):
+            jobs.append((pgw_ip, fname, num_of_trees, num_of_leaves, sequences, quantile, max_mem, calibration,
+                         instance_dir))
+
+    # [*]Largest data first.
+    jobs.sort(key=lambda j: os.path.getsize(j[1]), reverse=True)
+    marker.debug_info("Training {} models with {} workers.".format(len(jobs), workers))
+    report("training_progress.txt", "{} - start {} jobs\n".format(datetime.now(), len(jobs)))
+
+    failed = 0
+    # [*]Fresh process per job, so memory limit and memory of a finished job don't leak into the next one.
+    with Pool(processes=workers, maxtasksperchild=1) as pool:
+        for done, (pgw_ip, fname, status, message, ftime) in enumerate(pool.imap_unordered(train_job, jobs), 1):
+            line = "[{}/{}] {}::{} - {} ({:.1f}s) {}".format(done, len(jobs), pgw_ip, fname, status, ftime, message)
+            marker.debug_info(line)
+            report("training_progress.txt", "{} - {}\n".format(datetime.now(), line))
+
+            if status == 'skipped':
+                report("untrained_model.txt", "{}::{}\n".format(pgw_ip, fname))
+            elif status == 'failed':
+                failed += 1
+                marker.debug_info("PGW IP: {} / SVC_TYPE: {} / Error occurs: {}".format(pgw_ip, fname, message))
+                report("untrained_model.txt", "{}::{} - Error: {}\n".format(pgw_ip, fname, message))
+
+    report("training_progress.txt", "{} - finish ({} failed)\n".format(datetime.now(), failed))
 
 
 if __name__ == "__main__":
@@ -112,9 +218,30 @@ if __name__ == "__main__":
     parser.add_argument('--sequences', type=int, help='Sequences to observe.(Default: 5)', default=5)
     parser.add_argument('--leaves', type=int, help='Leaf size to memorize.(Default: 1440)', default=1440)
     parser.add_argument('--dir_name', type=str, help='Directory name for object', default='instances')
+    parser.add_argument('--workers', type=int, help='Number of training processes.(Default: cpu count)',
+                        default=os.cpu_count() or 1)
+    parser.add_argument('--max_mem', type=int, help='Memory limit per training job in MB.(Default: 0, no limit)',
+                        default=0)
+
+    parser.add_argument('--cache_dir', type=str, help='Parsed data cache directory.(Default: ./cache)',
+                        default='./cache')
+    parser.add_argument('--cache_size', type=int, help='Size limit of the cache in MB.(Default: 4096)', default=4096)
+    parser.add_argument('--no_cache', action='store_true', help='Parse csv files without the cache.')
+
+    # [*]Threshold calibration.
+    parser.add_argument('--sample', type=float, help='Fraction of points scored for threshold.(Default: 1.0)',
+                        default=1.0)
+    parser.add_argument('--skip_warmup', action='store_true', help='Don\'t score points until trees are full.')
+    parser.add_argument('--confidence', type=float, help='Confidence level of threshold interval.(Default: 0.95)',
+                        default=0.95)
+    parser.add_argument('--seed', type=int, help='Seed of calibration sampling.', default=None)
+    parser.add_argument('--stride', type=int, help='Minutes between scored points. Same as the one of the detector.'
+                                                   '(Default: 1)', default=1)
 
     args = parser.parse_args()
 
-    INSTANCE_DIR = args.dir_name
-
-    main(args.trees, args.leaves, args.sequences)
+    main(args.trees, args.leaves, args.sequences, workers=args.workers, max_mem=args.max_mem,
+         cache_dir=None if args.no_cache else args.cache_dir, cache_size=args.cache_size,
+         calibration={'sample_rate': args.sample, 'skip_warmup': args.skip_warmup,
+                      'confidence': args.confidence, 'seed': args.seed, 'stride': args.stride},
+         instance_dir=args.dir_name)
@@ -0,0 +1,120 @@
+"""
+@ File name: backpressure.py
+@ Version: 1.0.0
+@ Last update: 2026.OCT.19
+@ Company: Ntels Co., Ltd
+
+Backpressure between file handler and detectors.
+    - Each detector publishes its backlog (pending input files) and output lag into '{run_dir}/{name}.load'.
+    - File handler reads them, and batches input files more aggressively while any detector is behind.
+    - A detector enters a degraded mode by its own backlog or lag, and leaves it once both have recovered
+      for a while. (hysteresis, so it doesn't flap)
+"""
+import os
+import json
+import time
+import glob
+
+
+def publish_load(path, backlog, lag, degraded):
+    """
+    Write the load of a detector.
+    :param path: A String. Load file path.
+    :param backlog: An Integer. Pending input files.
+    :param lag: A Float. Output lag in seconds. (None: unknown)
+    :param degraded: A Boolean. Degraded mode.
+    :return: None
+    """
+    temp = path + ".tmp"
+    with open(temp, "w") as file:
+        json.dump({'backlog': backlog, 'lag': lag, 'degraded': degraded, 'pid': os.getpid(), 'time': time.time()},
+                  file)
+    os.replace(temp, path)
+
+
+def read_loads(run_dir, max_age=60):
+    """
+    Read the loads of running detectors.
+    :param run_dir: A String. Running directory.
+    :param max_age: A Float. Loads older than this are ignored.
+    :return:
+        - A Dictionary. Load by detector name.
+    """
+    loads = {}
+    now = time.time()
+    for path in glob.glob(run_dir + "*.load"):
+        try:
+            with open(path, "r") as file:
+                load = json.load(file)
+            if now - load['time'] > max_age:
+                continue
+            # [*]Load of a killed detector.
+            os.kill(load['pid'], 0)
+        except (OSError, ValueError, KeyError):
+            continue
+        loads[os.path.basename(path)[:-5]] = load
+    return loads
+
+
+class Degrader(object):
+    def __init__(self, backlog=0, lag=0, hold=30, metrics=None, logger=None):
+        """
+        Degraded mode switch of a detector.
+        :param backlog: An Integer. Pending input files to enter the degraded mode. (0: not by backlog)
+        :param lag: A Float. Output lag in seconds to enter the degraded mode. (0: not by lag)
+        :param hold: A Float. Seconds under half of both limits before it leaves the degraded mode.
+        :param metrics: A Metrics object. (None: not recorded)
+        :param logger: A Logger object. (None: not logged)
+        """
+        self.backlog = backlog
+        self.lag = lag
+        self.hold = hold
+        self.metrics = metrics
+        self.logger = logger
+        self.degraded = False
+        self.recovered_since = None
+
+    def enabled(self):
+        return self.backlog > 0 or self.lag > 0
+
+    def update(self, backlog, lag):
+        """
+        Update the mode by the current load.
+        :param backlog: An Integer. Pending input files.
+        :param lag: A Float. Output lag in seconds. (None: unknown)
+        :return:
+            - A Boolean. True if the mode is changed.
+        """
+        if not self.enabled():
+            return False
+
+        over = (self.backlog > 0 and backlog >= self.backlog) or \
+               (self.lag > 0 and lag is not None and lag >= self.lag)
+        under = (self.backlog <= 0 or backlog <= self.backlog / 2) and \
+                (self.lag <= 0 or lag is None or lag <= self.lag / 2)
+
+        changed = False
+        if not self.degraded and over:
+            self._switch(True, backlog, lag)
+            changed = True
+        elif self.degraded:
+            if not under:
+                self.recovered_since = None
+            elif self.recovered_since is None:
+                self.recovered_since = time.time()
+            elif time.time() - self.recovered_since >= self.hold:
+                self._switch(False, backlog, lag)
+                changed = True
+
+        if self.metrics is not None:
+            self.metrics.set('degraded', int(self.degraded), help_text="Degraded mode. (1: degraded)")
+        return changed
+
+    def _switch(self, degraded, backlog, lag):
+        self.degraded = degraded
+        self.recovered_since = None
+        state = 'degraded' if degraded else 'normal'
+        if self.metrics is not None:
+            self.metrics.inc('mode_transitions_total', help_text="Transitions of the degraded mode.", to=state)
+        if self.logger is not None:
+            self.logger.warning("Detector is switched to %s mode. (backlog: %s files, lag: %s s)", state, backlog, lag)
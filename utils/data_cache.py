@@ -0,0 +1,107 @@
+"""
+@ File name: data_cache.py
+@ Version: 1.0.0
+@ Last update: 2026.OCT.19
+@ Company: Ntels Co., Ltd
+
+Preprocessed training data cache.
+Each csv is parsed once into a pair of .npy files, int64 minute timestamps and float64 (UP, DN),
+keyed by source path, size and mtime. Entries are memory mapped on load and evicted by total size (LRU).
+"""
+import os
+import hashlib
+import numpy as np
+
+TS_SUFFIX = ".ts.npy"
+VALUE_SUFFIX = ".val.npy"
+
+
+def parse_csv(path):
+    """
+    Parse a training csv.
+    :param path: A String. csv path that has 'DTmm', 'Real_Up' and 'Real_Dn' columns.
+    :return:
+        - ts: A numpy array. int64 minutes since epoch.
+        - values: A numpy array. float64 (n x 2) of Real_Up and Real_Dn.
+    """
+    import pandas as pd
+
+    df = pd.read_csv(path)
+    ts = pd.to_datetime(df['DTmm'], format='%Y-%m-%d %H:%M').to_numpy().astype('datetime64[m]').astype(np.int64)
+    values = df[['Real_Up', 'Real_Dn']].to_numpy(dtype=np.float64)
+    return ts, values
+
+
+class SeriesCache(object):
+    def __init__(self, cache_dir, max_bytes):
+        """
+        :param cache_dir: A String. Cache directory.
+        :param max_bytes: An Integer. Total size limit of the cache.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, path):
+        st = os.stat(path)
+        source = "{}|{}|{}".format(os.path.abspath(path), st.st_size, st.st_mtime_ns)
+        return hashlib.sha1(source.encode()).hexdigest()
+
+    def load(self, path):
+        """
+        Load a parsed series. csv is parsed only on a cache miss.
+        :param path: A String. csv path.
+        :return:
+            - ts: A numpy array. int64 minutes since epoch. (memory mapped)
+            - values: A numpy array. float64 (n x 2). (memory mapped)
+        """
+        base = os.path.join(self.cache_dir, self.key(path))
+        try:
+            ts = np.load(base + TS_SUFFIX, mmap_mode='r')
+            values = np.load(base + VALUE_SUFFIX, mmap_mode='r')
+            # [*]Mark recently used.
+            os.utime(base + TS_SUFFIX)
+            os.utime(base + VALUE_SUFFIX)
+            return ts, values
+        except (FileNotFoundError, ValueError):
+            pass
+
+        ts, values = parse_csv(path)
+        self._save(base + TS_SUFFIX, ts)
+        self._save(base + VALUE_SUFFIX, values)
+        self.evict()
+        return ts, values
+
+    def _save(self, path, array):
+        # [*]Write and rename, so parallel readers never see a partial file.
+        temp = "{}.{}.tmp".format(path, os.getpid())
+        with open(temp, "wb") as file:
+            np.save(file, array)
+        os.replace(temp, path)
+
+    def evict(self):
+        """
+        Remove least recently used entries until total size is under the limit.
+        """
+        entries = {}
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(TS_SUFFIX) and not name.endswith(VALUE_SUFFIX):
+                continue
+            key = name.split(".")[0]
+            try:
+                st = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue
+            size, used = entries.get(key, (0, 0))
+            entries[key] = (size + st.st_size, max(used, st.st_mtime))
+
+        total = sum(size for size, _ in entries.values())
+        for key, (size, _) in sorted(entries.items(), key=lambda e: e[1][1]):
+            if total <= self.max_bytes:
+                break
+            for suffix in [TS_SUFFIX, VALUE_SUFFIX]:
+                try:
+                    os.remove(os.path.join(self.cache_dir, key + suffix))
+                except FileNotFoundError:
+                    pass
+            total -= size
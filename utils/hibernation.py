@@ -0,0 +1,189 @@
+"""
+@ File name: hibernation.py
+@ Version: 1.0.0
+@ Last update: 2026.OCT.19
+@ Company: Ntels Co., Ltd
+
+Hibernation of an idle detector forest.
+The forest of a detector is written as a compact snapshot under its instance directory and dropped from memory,
+    - when the detector is idle for 'idle_time' seconds, or
+    - when detectors of the processor are over the memory budget, and this one is the least recently used.
+It is restored on the next record.
+
+Detectors run in separate processes, so the budget is shared through small state files in the running directory:
+'{name}.mem' holds the resident forest size and the last active time of each detector. Each detector only ever
+evicts itself, and the least recently used one goes first. The state files are written and read at most once
+per STATE_INTERVAL seconds, and the eviction is decided on the last read, so the cost doesn't grow with every
+main loop iteration of every detector.
+"""
+import os
+import gc
+import json
+import time
+import glob
+
+from models.snapshot import save_forest, load_forest, forest_bytes
+
+# [*]Seconds between writes and reads of the shared state files.
+STATE_INTERVAL = 10
+
+
+class Hibernator(object):
+    def __init__(self, name, model, instance_dir, run_dir, idle_time=0, budget=0, metrics=None, logger=None):
+        """
+        :param name: A String. Detector name. e.g. 'detector_{ip}_{svc}'
+        :param model: An RRCF object. Its forest is hibernated.
+        :param instance_dir: A String. Directory of the snapshot.
+        :param run_dir: A String. Directory of the shared state files.
+        :param idle_time: A Float. Seconds without records before hibernation. (0: never by idle time)
+        :param budget: An Integer. Bytes of resident forests of every detector. (0: no budget)
+        :param metrics: A Metrics object. (None: not recorded)
+        :param logger: A Logger object. (None: not logged)
+        """
+        self.name = name
+        self.model = model
+        self.snapshot_path = instance_dir + "forest.npz"
+        self.state_path = run_dir + "{}.mem".format(name)
+        self.run_dir = run_dir
+        self.idle_time = idle_time
+        self.budget = budget
+        self.metrics = metrics
+        self.logger = logger
+
+        self.hibernated = False
+        self.last_active = time.time()
+        self.resident = forest_bytes(model.forest)
+        self.last_state = 0
+        # [*]Last read of the shared states, and when it was read.
+        self.states = {}
+        self.last_read = 0
+
+        # [*]Left over by a process that was killed while hibernated.
+        if model.forest is None and os.path.exists(self.snapshot_path):
+            self.hibernated = True
+        self._write_state()
+
+    def enabled(self):
+        return self.idle_time > 0 or self.budget > 0
+
+    def touch(self):
+        """
+        Called before the forest is used. Restores a hibernated forest.
+        :return: None
+        """
+        self.last_active = time.time()
+        if not self.hibernated:
+            self._count('hibernation_hits_total', "Records that found the forest in memory.")
+            return
+
+        stime = time.perf_counter()
+        self.model.forest = load_forest(self.snapshot_path)
+        elapsed = time.perf_counter() - stime
+        os.remove(self.snapshot_path)
+        self.hibernated = False
+        self.resident = forest_bytes(self.model.forest)
+        self._write_state()
+
+        self._count('hibernation_misses_total', "Records that had to restore the forest.")
+        if self.metrics is not None:
+            self.metrics.observe('restore_seconds', elapsed, help_text="Restore time of a hibernated forest.")
+        self._log("Forest is restored in %.3fs (%s bytes resident).", elapsed, self.resident)
+
+    def tick(self):
+        """
+        Called once per main loop iteration. Hibernates the forest by idle time or by the budget.
+        :return: None
+        """
+        if self.hibernated or not self.model.forest:
+            return
+
+        now = time.time()
+        if self.idle_time > 0 and now - self.last_active >= self.idle_time:
+            self.hibernate('idle')
+            return
+
+        if self.budget > 0:
+            if now - self.last_read >= STATE_INTERVAL:
+                self.states = self._read_states()
+                self.last_read = now
+            # [*]Own state is always the current one.
+            states = dict(self.states)
+            states[self.name] = {'resident': self.resident, 'last_active': self.last_active}
+            total = sum(s['resident'] for s in states.values())
+            if total > self.budget:
+                resident = [(s['last_active'], n) for n, s in states.items() if s['resident'] > 0]
+                if resident and min(resident)[1] == self.name:
+                    self.hibernate('budget')
+                    return
+
+        # [*]Keep the state fresh enough for the other detectors.
+        if now - self.last_state >= STATE_INTERVAL:
+            self.resident = forest_bytes(self.model.forest)
+            self._write_state()
+
+    def hibernate(self, reason):
+        """
+        Write the forest into a snapshot and drop it from memory.
+        :param reason: A String. 'idle' or 'budget'.
+        :return: None
+        """
+        stime = time.perf_counter()
+        # [*]Tombstoned points are not a part of the snapshot.
+        self.model.compact()
+        size = save_forest(self.snapshot_path, self.model.forest)
+        self.model.forest = None
+        gc.collect()
+        elapsed = time.perf_counter() - stime
+
+        freed, self.resident = self.resident, 0
+        self.hibernated = True
+        self._write_state()
+
+        if self.metrics is not None:
+            self.metrics.inc('hibernations_total', help_text="Forests written out of memory.", reason=reason)
+            self.metrics.observe('hibernate_seconds', elapsed, help_text="Hibernation time of a forest.")
+        self._log("Forest is hibernated by %s in %.3fs (%s bytes freed, %s bytes snapshot).",
+                  reason, elapsed, freed, size)
+
+    def restore(self):
+        """
+        Restore the forest, if it is hibernated. Called before the whole model is saved.
+        """
+        if self.hibernated:
+            self.touch()
+
+    def close(self):
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+    def _write_state(self):
+        self.last_state = time.time()
+        if self.metrics is not None:
+            self.metrics.set('resident_bytes', self.resident, help_text="Estimated resident forest size.")
+        if not self.enabled():
+            return
+        temp = self.state_path + ".tmp"
+        with open(temp, "w") as file:
+            json.dump({'resident': self.resident, 'last_active': self.last_active, 'pid': os.getpid()}, file)
+        os.replace(temp, self.state_path)
+
+    def _read_states(self):
+        states = {}
+        for path in glob.glob(self.run_dir + "*.mem"):
+            try:
+                with open(path, "r") as file:
+                    state = json.load(file)
+                # [*]State of a killed detector doesn't hold any memory.
+                os.kill(state['pid'], 0)
+            except (OSError, ValueError, KeyError):
+                continue
+            states[os.path.basename(path)[:-4]] = state
+        return states
+
+    def _count(self, name, help_text):
+        if self.metrics is not None:
+            self.metrics.inc(name, help_text=help_text)
+
+    def _log(self, message, *args):
+        if self.logger is not None:
+            self.logger.info(message, *args)
@@ -1,47 +1,123 @@
 """
-    @ Version: 2.0.0
+    @ Version: 3.0.0
     @ Author: DH KIM
     @ Copyrights: Ntels Co., LTD
-    @ Last update: 2019.Nov.08
+    @ Last update: 2026.OCT.19
 """
+import os
+import queue
+import atexit
 import logging
 import utils.marker as mark
 
+from datetime import date
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVELS = {
+    'CRITICAL': logging.CRITICAL,
+    'ERROR': logging.ERROR,
+    'WARNING': logging.WARNING,
+    'INFO': logging.INFO,
+    'DEBUG': logging.DEBUG
+}
+
+# [*]Background writers by logger name.
+_listeners = {}
+
+
+def _formatter():
+    return logging.Formatter('[!]%(levelname)s: \n'
+                             '\t- File: %(filename)s:%(lineno)s\n'
+                             '\t- Time: %(asctime)s\n'
+                             '\t- Message: %(message)s')
+
+
+def _set_level(logger, level):
+    log_level = level.upper()
+
+    # [!]Log level check
+    if log_level not in LOG_LEVELS:
+        mark.debug_info("Input param \'Log level\' is not proper: {}".format(level), m_type='ERROR')
+
+    logger.setLevel(LOG_LEVELS.get(log_level, logging.NOTSET))
+
+
+def _reset(logger):
+    """
+    Detach and close every handler of the logger, so re-creating a logger never duplicates records.
+    """
+    listener = _listeners.pop(logger.name, None)
+    if listener is not None:
+        listener.stop()
+        for h in listener.handlers:
+            h.close()
+    for h in list(logger.handlers):
+        logger.removeHandler(h)
+        h.close()
+
+
+def shutdown():
+    """
+    Flush and stop every background writer.
+    """
+    for name in list(_listeners.keys()):
+        listener = _listeners.pop(name)
+        listener.stop()
+        for h in listener.handlers:
+            h.close()
+
+
+def _restart_after_fork():
+    """
+    Writer threads don't survive fork. The child gets fresh queues and writers on the same files.
+    """
+    for name, listener in list(_listeners.items()):
+        q = queue.Queue()
+        for h in logging.getLogger(name).handlers:
+            if isinstance(h, QueueHandler):
+                h.queue = q
+        new_listener = QueueListener(q, *listener.handlers, respect_handler_level=True)
+        new_listener.start()
+        _listeners[name] = new_listener
+
+
+atexit.register(shutdown)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+class DailyFileHandler(logging.FileHandler):
+    def __init__(self, log_path):
+        """
+        File handler that moves to a new file when the day passes by.
+        :param log_path: A String. Log file path. '{}' in the path is replaced by the date.
+        """
+        self.log_path = log_path
+        self.day = date.today()
+        super().__init__(log_path.format(self.day))
+
+    def emit(self, record):
+        if '{}' in self.log_path:
+            today = date.today()
+            if today != self.day:
+                self.day = today
+                if self.stream:
+                    self.stream.close()
+                    self.stream = None
+                self.baseFilename = os.path.abspath(self.log_path.format(today))
+        super().emit(record)
+
 
 class StreamLogger(object):
     def __init__(self, name, level="INFO"):
-        # [*]Formatter
-        fomatter = logging.Formatter('[!]%(levelname)s: \n'
-                                     '\t- File: %(filename)s:%(lineno)s\n'
-                                     '\t- Time: %(asctime)s\n'
-                                     '\t- Message: %(message)s')
-
         # [*]Logger instance
         self.logger = logging.getLogger(name)
-
-        log_level = level.upper()
-
-        # [!]Log level check
-        if log_level not in ['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG']:
-            mark.debug_info("Input param \'Log level\' is not proper: {}".format(level), m_type='ERROR')
-
-        # [*]Logger mode
-        if log_level == "CRITICAL":
-            self.logger.setLevel(logging.CRITICAL)
-        elif log_level == "ERROR":
-            self.logger.setLevel(logging.ERROR)
-        elif log_level == "WARNING":
-            self.logger.setLevel(logging.WARNING)
-        elif log_level == "INFO":
-            self.logger.setLevel(logging.INFO)
-        elif log_level == "DEBUG":
-            self.logger.setLevel(logging.DEBUG)
-        else:
-            self.logger.setLevel(logging.NOTSET)
+        _reset(self.logger)
+        _set_level(self.logger, level)
 
         # [*]Handler
         streamHandler = logging.StreamHandler()
-        streamHandler.setFormatter(fomatter)
+        streamHandler.setFormatter(_formatter())
         self.logger.addHandler(streamHandler)
 
     def get_instance(self):
@@ -50,39 +126,29 @@ class StreamLogger(object):
 
 class FileLogger(object):
     def __init__(self, name, log_path, level="INFO"):
-        # [*]Formatter
-        fomatter = logging.Formatter('[!]%(levelname)s: \n'
-                                     '\t- File: %(filename)s:%(lineno)s\n'
-                                     '\t- Time: %(asctime)s\n'
-                                     '\t- Message: %(message)s')
-
+        """
+        Logger that writes files in a background thread.
+        Records are put into a queue by the caller and written by a QueueListener.
+        :param name: A String. Logger name. Creating it again replaces the previous handlers.
+        :param log_path: A String. Log file path. '{}' in the path is replaced by the date and rotates daily.
+        :param level: A String. Log level.
+        """
         # [*]Logger instance
         self.logger = logging.getLogger(name)
+        _reset(self.logger)
+        _set_level(self.logger, level)
+
+        # [*]Writer
+        fileHandler = DailyFileHandler(log_path)
+        fileHandler.setFormatter(_formatter())
 
-        log_level = level.upper()
-
-        # [!]Log level check
-        if log_level not in ['CRITICAL', 'ERROR', 'WARNING', 'INFO', 'DEBUG']:
-            mark.debug_info("Input param \'Log level\' is not proper: {}".format(level), m_type='ERROR')
-
-        # [*]Logger mode
-        if log_level == "CRITICAL":
-            self.logger.setLevel(logging.CRITICAL)
-        elif log_level == "ERROR":
-            self.logger.setLevel(logging.ERROR)
-        elif log_level == "WARNING":
-            self.logger.setLevel(logging.WARNING)
-        elif log_level == "INFO":
-            self.logger.setLevel(logging.INFO)
-        elif log_level == "DEBUG":
-            self.logger.setLevel(logging.DEBUG)
-        else:
-            self.logger.setLevel(logging.NOTSET)
+        q = queue.Queue()
+        listener = QueueListener(q, fileHandler, respect_handler_level=True)
+        listener.start()
+        _listeners[name] = listener
 
         # [*]Handler
-        fileHandler = logging.FileHandler('{}'.format(log_path))
-        fileHandler.setFormatter(fomatter)
-        self.logger.addHandler(fileHandler)
+        self.logger.addHandler(QueueHandler(q))
 
     def get_instance(self):
         return self.logger
@@ -5,11 +5,20 @@
 @ Author: DH.KIM
 @ Company: Ntels Co., Ltd
 """
-from inspect import getframeinfo, stack
+import sys
+
+
+class _FrameInfo(object):
+    __slots__ = ['filename', 'lineno']
+
+    def __init__(self, frame):
+        self.filename = frame.f_code.co_filename
+        self.lineno = frame.f_lineno
 
 
 def debug_info(message, m_type='INFO'):
-    insp = getframeinfo(stack()[1][0])
+    # [*]Caller frame only. inspect.stack() reads source lines of every frame.
+    insp = _FrameInfo(sys._getframe(1))
     if m_type == "INFO":
         print("[*] INFO:\n"
               "\t - File: {}:{}\n"
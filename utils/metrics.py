@@ -0,0 +1,322 @@
+"""
+@ File name: metrics.py
+@ Version: 1.0.0
+@ Last update: 2026.OCT.19
+@ Company: Ntels Co., Ltd
+
+Per process metrics in Prometheus text format.
+    - Every stage keeps counters, gauges and histograms in memory, and writes them into
+      'management/metrics/{name}.prom' every few seconds.
+    - 'python3 -m utils.metrics --id 1 --port 9108' serves every metrics file of the processor on localhost.
+      The supervisor runs it as a child with '--metrics_port'.
+"""
+import os
+import time
+import glob
+import bisect
+import argparse
+import config.file_path as fp
+
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+PREFIX = "sofcs_"
+# [*]Seconds. Stage timings.
+TIME_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+# [*]Seconds. Lag of a minute from its event time.
+LAG_BUCKETS = (5, 10, 30, 60, 120, 300, 600, 1800, 3600, 21600, 86400)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(k, str(v).replace('"', '\\"')) for k, v in labels) + "}"
+
+
+def _format(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram(object):
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics(object):
+    def __init__(self, name, labels=None, interval=10):
+        """
+        Metrics of a process.
+        :param name: A String. File name of the process. e.g. 'detector_{ip}_{svc}'
+        :param labels: A Dictionary. Constant labels of every sample. e.g. {'stage': 'detector', 'ip': ..}
+        :param interval: A Float. Seconds between metrics file writes.
+        """
+        self.name = name
+        self.labels = tuple((labels or {}).items())
+        self.interval = interval
+        self.last_flush = 0
+        # [*]Metric name -> (type, help, {extra labels: value})
+        self.families = OrderedDict()
+
+    def _family(self, name, kind, help_text):
+        family = self.families.get(name)
+        if family is None:
+            family = (kind, help_text, OrderedDict())
+            self.families[name] = family
+        return family[2]
+
+    def inc(self, name, value=1, help_text="", **labels):
+        samples = self._family(name, 'counter', help_text)
+        key = tuple(labels.items())
+        samples[key] = samples.get(key, 0) + value
+
+    def set(self, name, value, help_text="", **labels):
+        self._family(name, 'gauge', help_text)[tuple(labels.items())] = value
+
+    def observe(self, name, value, buckets=TIME_BUCKETS, help_text="", **labels):
+        samples = self._family(name, 'histogram', help_text)
+        key = tuple(labels.items())
+        histogram = samples.get(key)
+        if histogram is None:
+            histogram = Histogram(buckets)
+            samples[key] = histogram
+        histogram.observe(value)
+
+    def time(self, name, help_text="", **labels):
+        """
+        Context manager that observes the elapsed seconds of its block.
+        """
+        return _Timer(self, name, help_text, labels)
+
+    def render(self):
+        """
+        Prometheus text exposition of every metric.
+        :return:
+            - A String.
+        """
+        lines = []
+        for name, (kind, help_text, samples) in self.families.items():
+            full = PREFIX + name
+            if help_text:
+                lines.append("# HELP {} {}".format(full, help_text))
+            lines.append("# TYPE {} {}".format(full, kind))
+            for key, value in samples.items():
+                labels = self.labels + key
+                if kind != 'histogram':
+                    lines.append("{}{} {}".format(full, _labels(labels), _format(value)))
+                    continue
+                cumulative = 0
+                for bound, count in zip(value.buckets + (float('inf'),), value.counts):
+                    cumulative += count
+                    lines.append("{}_bucket{} {}".format(full, _labels(labels + (('le', _format(bound)),)),
+                                                         cumulative))
+                lines.append("{}_sum{} {}".format(full, _labels(labels), _format(value.sum)))
+                lines.append("{}_count{} {}".format(full, _labels(labels), value.count))
+        return "\n".join(lines) + "\n"
+
+    def flush(self, force=False):
+        """
+        Write the metrics file, if the interval passed since the last write.
+        :param force: A Boolean. Write regardless of the interval.
+        :return: None
+        """
+        now = time.time()
+        if not force and now - self.last_flush < self.interval:
+            return
+        self.last_flush = now
+        self.set('updated_timestamp_seconds', now, help_text="Last write of this metrics file.")
+
+        directory = fp.metrics_dir()
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        path = directory + "{}.prom".format(self.name)
+        temp = path + ".tmp"
+        with open(temp, "w") as file:
+            file.write(self.render())
+        os.replace(temp, path)
+
+
+class _Timer(object):
+    __slots__ = ('metrics', 'name', 'help_text', 'labels', 'start')
+
+    def __init__(self, metrics, name, help_text, labels):
+        self.metrics = metrics
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, help_text=self.help_text, **self.labels)
+        return False
+
+
+def event_lag(dtmm, now=None):
+    """
+    Seconds from the end of a DTmm minute until now.
+    :param dtmm: A String. 'YYYYmmddHHMM' with or without separators.
+    :return:
+        - A Float, or None if dtmm can't be parsed.
+    """
+    digits = "".join(c for c in str(dtmm) if c.isdigit())
+    if len(digits) < 12:
+        return None
+    try:
+        minute = time.mktime(time.strptime(digits[:12], "%Y%m%d%H%M"))
+    except ValueError:
+        return None
+    return (time.time() if now is None else now) - minute - 60
+
+
+def watch_gc(metrics):
+    """
+    Record pauses and collected objects of the cyclic garbage collector.
+    :param metrics: A Metrics object.
+    :return: None
+    """
+    import gc
+
+    started = {}
+
+    def callback(phase, info):
+        generation = str(info['generation'])
+        if phase == 'start':
+            started['time'] = time.perf_counter()
+        elif 'time' in started:
+            metrics.observe('gc_pause_seconds', time.perf_counter() - started.pop('time'),
+                            help_text="Pause time of a garbage collection.", generation=generation)
+            metrics.inc('gc_collected_total', info['collected'], help_text="Objects freed by the cyclic collector.",
+                        generation=generation)
+
+    gc.callbacks.append(callback)
+
+
+def parse(text):
+    """
+    Parse Prometheus text written by Metrics.render.
+    :param text: A String.
+    :return:
+        - types: A Dictionary. Family name -> type.
+        - samples: A List. (sample name, labels dictionary, value, raw line)
+    """
+    types = {}
+    samples = []
+    for line in text.splitlines():
+        if not line:
+            continue
+        if line.startswith("# TYPE "):
+            _, _, name, kind = line.split(" ", 3)
+            types[name] = kind
+            continue
+        if line.startswith("#"):
+            continue
+        head, value = line.rsplit(" ", 1)
+        labels = {}
+        if "{" in head:
+            name, body = head[:-1].split("{", 1)
+            for pair in body.split('",'):
+                if "=" in pair:
+                    k, v = pair.split("=", 1)
+                    labels[k] = v.strip('"')
+        else:
+            name = head
+        samples.append((name, labels, float(value), line))
+    return types, samples
+
+
+def family_of(name, types):
+    for suffix in ("_bucket", "_sum", "_count"):
+        if name.endswith(suffix) and types.get(name[:-len(suffix)]) == 'histogram':
+            return name[:-len(suffix)]
+    return name
+
+
+def aggregate(texts):
+    """
+    Merge metrics files into one exposition, with every family in one block.
+    :param texts: A List. Prometheus texts.
+    :return:
+        - A String.
+    """
+    families = OrderedDict()
+    for text in texts:
+        types, samples = parse(text)
+        for name, _, _, line in samples:
+            family = family_of(name, types)
+            families.setdefault(family, (types.get(family, 'untyped'), []))[1].append(line)
+
+    lines = []
+    for family, (kind, sample_lines) in families.items():
+        lines.append("# TYPE {} {}".format(family, kind))
+        lines.extend(sample_lines)
+    return "\n".join(lines) + "\n"
+
+
+def read_all():
+    """
+    Read every metrics file of the processor.
+    :return:
+        - A List. Prometheus texts.
+    """
+    texts = []
+    for path in sorted(glob.glob(fp.metrics_dir() + "*.prom")):
+        try:
+            with open(path, "r") as file:
+                texts.append(file.read())
+        except FileNotFoundError:
+            continue
+    return texts
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = aggregate(read_all()).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        return
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Metrics endpoint of the CDR pipeline.')
+    parser.add_argument('--id', type=str, help='ID of ML processor', default="main")
+    parser.add_argument('--port', type=int, help='Port on localhost.(Default: 9108)', default=9108)
+    parser.add_argument('--log', type=str, help='Not used. Accepted from the supervisor.', default="INFO")
+    return parser.parse_args(argv)
+
+
+def run(args):
+    """
+    Serve every metrics file of the processor on http://127.0.0.1:{port}/metrics until it is killed.
+    """
+    fp.IDX = args.id
+    server = HTTPServer(("127.0.0.1", args.port), _Handler)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    run(parse_args())
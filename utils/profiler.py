@@ -0,0 +1,199 @@
+"""
+@ File name: profiler.py
+@ Version: 1.0.0
+@ Last update: 2026.OCT.19
+@ Company: Ntels Co., Ltd
+
+On-demand profiling of a running daemon, without stopping it.
+A profile is requested by SIGUSR1 (defaults) or by a control file in the running directory:
+    '{run_dir}/{name}.profile' with optional 'key=value' lines.
+        - mode: 'cprofile' (deterministic) or 'sample' (stack sampling of the main thread). (Default: cprofile)
+        - seconds: Profiling duration. (Default: 30)
+        - iterations: Stop after this number of main loop iterations instead, if it is over 0. (Default: 0)
+        - interval: Sampling interval in seconds of the 'sample' mode. (Default: 0.005)
+The daemon calls Profiler.tick() once per main loop iteration. Results are written into the log directory:
+    - profile_{name}_{time}.prof / .txt: cProfile stats and the top functions by cumulative time.
+    - profile_{name}_{time}.folded: Folded stacks of the 'sample' mode. (flamegraph.pl input)
+    - profile_{name}_{time}.tracemalloc / .mem.txt: tracemalloc snapshot and the top allocations.
+"""
+import os
+import sys
+import time
+import signal
+import threading
+
+from collections import Counter
+
+DEFAULTS = {'mode': 'cprofile', 'seconds': 30.0, 'iterations': 0, 'interval': 0.005}
+# [*]If set, the first tick writes the wall clock time into this file. Used by startup_report.py.
+READY_ENV = 'SOFCS_READY_FILE'
+
+
+def control_path(run_dir, name):
+    return "{}{}.profile".format(run_dir, name)
+
+
+def read_control(path):
+    """
+    Read a control file into profiling options. Unknown keys are ignored.
+    :param path: A String. Control file path.
+    :return:
+        - A Dictionary. Options.
+    """
+    options = dict(DEFAULTS)
+    with open(path, "r") as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith("#") or "=" not in line:
+                continue
+            key, value = [v.strip() for v in line.split("=", 1)]
+            if key in ('seconds', 'interval'):
+                options[key] = float(value)
+            elif key == 'iterations':
+                options[key] = int(value)
+            elif key == 'mode' and value in ('cprofile', 'sample'):
+                options[key] = value
+    return options
+
+
+class _Sampler(threading.Thread):
+    def __init__(self, thread_id, interval):
+        """
+        Stack sampler of a thread. Counts folded stacks.
+        """
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append("{}:{}:{}".format(os.path.basename(code.co_filename), code.co_name, frame.f_lineno))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+
+
+class Profiler(object):
+    def __init__(self, name, run_dir, out_dir, logger=None):
+        """
+        Profiling hook of a daemon main loop.
+        :param name: A String. Process name. Used for the control file and the result files.
+        :param run_dir: A String. Running directory that holds the control file.
+        :param out_dir: A String. Directory of the results. Usually the log directory of the process.
+        :param logger: A Logger object. (None: not logged)
+        """
+        self.name = name
+        self.control = control_path(run_dir, name)
+        self.out_dir = out_dir
+        self.logger = logger
+        self.requested = None
+        self.active = None
+        self.ready_file = os.environ.get(READY_ENV)
+
+        signal.signal(signal.SIGUSR1, self._on_signal)
+
+    def _on_signal(self, signum, frame):
+        # [*]Only a flag. Profiling starts at the next tick, on the main loop.
+        self.requested = dict(DEFAULTS)
+
+    def tick(self):
+        """
+        Called once per main loop iteration. Starts, counts and finishes a profile.
+        :return: None
+        """
+        if self.ready_file:
+            # [*]First poll of the main loop. The process is ready from here.
+            temp = self.ready_file + ".tmp"
+            with open(temp, "w") as file:
+                file.write(repr(time.time()))
+            os.replace(temp, self.ready_file)
+            self.ready_file = None
+
+        if self.active is not None:
+            self.active['iterations_done'] += 1
+            options = self.active['options']
+            elapsed = time.time() - self.active['start']
+            if (options['iterations'] > 0 and self.active['iterations_done'] >= options['iterations']) or \
+                    (options['iterations'] <= 0 and elapsed >= options['seconds']):
+                self._finish()
+            return
+
+        if self.requested is None and os.path.exists(self.control):
+            try:
+                self.requested = read_control(self.control)
+            except (OSError, ValueError) as e:
+                self._log("Invalid profile control file %s: %s", self.control, e)
+            finally:
+                os.remove(self.control)
+
+        if self.requested is not None:
+            options, self.requested = self.requested, None
+            self._start(options)
+
+    def _start(self, options):
+        import tracemalloc
+
+        self.active = {'options': options, 'start': time.time(), 'iterations_done': 0}
+        if options['mode'] == 'sample':
+            sampler = _Sampler(threading.get_ident(), options['interval'])
+            sampler.start()
+            self.active['sampler'] = sampler
+        else:
+            import cProfile
+
+            profile = cProfile.Profile()
+            profile.enable()
+            self.active['profile'] = profile
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+        self._log("Profiling is started: %s", options)
+
+    def _finish(self):
+        import tracemalloc
+
+        active, self.active = self.active, None
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        if not os.path.exists(self.out_dir):
+            os.makedirs(self.out_dir, exist_ok=True)
+        base = self.out_dir + "profile_{}_{}".format(self.name, time.strftime("%Y%m%d_%H%M%S"))
+
+        if 'profile' in active:
+            import pstats
+
+            profile = active['profile']
+            profile.disable()
+            profile.dump_stats(base + ".prof")
+            with open(base + ".txt", "w") as file:
+                stats = pstats.Stats(profile, stream=file)
+                stats.sort_stats('cumulative').print_stats(60)
+        else:
+            sampler = active['sampler']
+            sampler.stop()
+            with open(base + ".folded", "w") as file:
+                for stack, count in sampler.stacks.most_common():
+                    file.write("{} {}\n".format(stack, count))
+
+        snapshot.dump(base + ".tracemalloc")
+        with open(base + ".mem.txt", "w") as file:
+            for stat in snapshot.statistics('lineno')[:50]:
+                file.write("{}\n".format(stat))
+
+        self._log("Profiling is finished after %.1fs and %s iterations: %s.*",
+                  time.time() - active['start'], active['iterations_done'], base)
+
+    def _log(self, message, *args):
+        if self.logger is not None:
+            self.logger.warning(message, *args)
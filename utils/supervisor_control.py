@@ -0,0 +1,59 @@
+"""
+@ File name: supervisor_control.py
+@ Version: 1.0.0
+@ Last update: 2026.OCT.19
+@ Company: Ntels Co., Ltd
+
+Pid file and signal helpers of the supervisor.
+It has no heavy imports, so stop.py can stop the supervisor without loading the stages.
+"""
+import os
+import time
+import signal
+import config.file_path as fp
+import utils.marker as mk
+
+# [*]Seconds to wait children on stop before SIGKILL.
+STOP_TIMEOUT = 30
+
+
+def pid_path():
+    return fp.run_dir() + "supervisor.pid"
+
+
+def state_path():
+    return fp.run_dir() + "supervisor.json"
+
+
+def running_pid():
+    """
+    Returns pid of running supervisor, or None.
+    """
+    if not os.path.exists(pid_path()):
+        return None
+    with open(pid_path(), "r") as file:
+        pid = int(file.readline())
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return None
+    return pid
+
+
+def command_stop(args):
+    pid = running_pid()
+    if pid is None:
+        mk.debug_info("supervisor is not running.", m_type="WARNING")
+        return False
+
+    os.kill(pid, signal.SIGTERM)
+    deadline = time.time() + STOP_TIMEOUT + 10
+    while time.time() < deadline:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            mk.debug_info("supervisor '{}' is successfully terminated.".format(pid))
+            return True
+        time.sleep(0.5)
+    mk.debug_info("supervisor '{}' did not stop in time.".format(pid), m_type="WARNING")
+    return False
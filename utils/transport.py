@@ -0,0 +1,145 @@
+"""
+@ File name: transport.py
+@ Version: 1.0.0
+@ Last update: 2026.OCT.19
+@ Company: Ntels Co., Ltd
+
+In-memory handoff of partitioned records from file_handler to anomaly detectors.
+Each detector binds a Unix domain datagram socket; file_handler sends the same pipe-delimited
+rows it would have written into a .DAT file. If the detector is down or its buffer is full,
+the sender reports how many rows got through and the caller spills the rest into the file protocol.
+"""
+import os
+import socket
+
+# [*]Upper bound of a single datagram payload. Records are split at line boundaries.
+MAX_DATAGRAM = 65000
+# [*]Receive buffer requested by detectors, so bursts are not spilled to disk right away.
+RECV_BUFFER = 4 * 1024 * 1024
+
+
+def encode_rows(rows):
+    """
+    Encode rows into the pipe-delimited line format used by .DAT files.
+    :param rows: A List. List of [PGW_IP, DTmm, SVC_TYPE, UP, DN].
+    :return:
+        - A List of bytes. Datagram payloads, each smaller than MAX_DATAGRAM.
+    """
+    payloads = []
+    buffer = []
+    size = 0
+    for row in rows:
+        line = "|".join(str(r) for r in row) + "\n"
+        line = line.encode()
+        if buffer and size + len(line) > MAX_DATAGRAM:
+            payloads.append(b"".join(buffer))
+            buffer = []
+            size = 0
+        buffer.append(line)
+        size += len(line)
+    if buffer:
+        payloads.append(b"".join(buffer))
+    return payloads
+
+
+def decode_rows(payload):
+    """
+    Decode a datagram payload into rows.
+    :param payload: A bytes. Pipe-delimited lines.
+    :return:
+        - A List of [PGW_IP, DTmm, SVC_TYPE, UP, DN]. UP and DN are floats.
+    """
+    rows = []
+    for line in payload.decode().splitlines():
+        if not line:
+            continue
+        ip, dtmm, svc, up, dn = line.split("|")
+        rows.append([ip, dtmm, svc, float(up), float(dn)])
+    return rows
+
+
+class SocketSender(object):
+    def __init__(self):
+        """
+        Non-blocking datagram sender. It never waits for a slow detector.
+        """
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+
+    def send(self, path, rows):
+        """
+        Send rows to the detector socket.
+        :param path: A String. Socket path of the detector.
+        :param rows: A List. Rows to send in time order.
+        :return:
+            - An Integer. Number of rows delivered. Rest of them should be spilled to disk.
+        """
+        if not os.path.exists(path):
+            return 0
+
+        sent = 0
+        for payload in encode_rows(rows):
+            try:
+                self.sock.sendto(payload, path)
+            except OSError:
+                # [*]Consumer is down or busy. Caller spills the remaining rows.
+                break
+            sent += payload.count(b"\n")
+        return sent
+
+    def close(self):
+        self.sock.close()
+
+
+class SocketReceiver(object):
+    def __init__(self, path):
+        """
+        Non-blocking datagram receiver bound to the detector socket path.
+        :param path: A String. Socket path of the detector.
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        # [*]Remove stale socket file left by crashed process.
+        if os.path.exists(path):
+            os.remove(path)
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER)
+        self.sock.bind(path)
+        self.sock.setblocking(False)
+
+    def receive(self, max_messages=0):
+        """
+        Drain pending datagrams.
+        :param max_messages: An Integer. Maximum number of datagrams to read. (0: no limit)
+        :return:
+            - A List. List of decoded row lists, one per datagram.
+        """
+        messages = []
+        while max_messages <= 0 or len(messages) < max_messages:
+            try:
+                payload = self.sock.recv(MAX_DATAGRAM + 1024)
+            except BlockingIOError:
+                break
+            messages.append(decode_rows(payload))
+        return messages
+
+    def drain(self):
+        """
+        Stop receiving without losing queued datagrams. The socket path is removed first, so senders spill
+        new rows into files from then on. Datagrams that were already delivered are read, and the socket is closed.
+        :return:
+            - A List. List of decoded row lists, one per datagram.
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        messages = self.receive()
+        self.sock.close()
+        return messages
+
+    def close(self):
+        self.sock.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
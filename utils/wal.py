@@ -0,0 +1,249 @@
+"""
+@ File name: wal.py
+@ Version: 1.0.0
+@ Last update: 2026.OCT.19
+@ Company: Ntels Co., Ltd
+
+Write-ahead log and background checkpoints of detector state.
+    - Every ingested record is appended to a WAL segment, '{wal_dir}/{segment:012d}.wal',
+      in the same 'PGW_IP|DTmm|SVC_TYPE|UP|DN' format as detector input files.
+    - A checkpoint rotates the WAL, forks, and the copy-on-write child dumps the state that covers every
+      closed segment into 'checkpoint.pkl'. Scoring goes on in the parent meanwhile.
+    - Segments covered by a finished checkpoint are deleted.
+Recovery loads the latest checkpoint and replays only the segments after it,
+so restart time depends on the checkpoint interval, not on uptime.
+"""
+import os
+import gc
+import csv
+import glob
+import time
+import signal
+
+
+class WriteAheadLog(object):
+    def __init__(self, directory, fsync=False):
+        """
+        :param directory: A String. WAL directory.
+        :param fsync: A Boolean. fsync on every flush. Survives power loss as well as process crashes.
+        """
+        self.directory = directory
+        self.fsync = fsync
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        # [*]Never append to a segment of a previous process. It could end with a torn line.
+        existing = self.segments()
+        self.segment = existing[-1][0] + 1 if existing else 0
+        self.file = None
+        self.writer = None
+        self._open()
+
+    def _path(self, segment):
+        return self.directory + "{:012d}.wal".format(segment)
+
+    def _open(self):
+        self.file = open(self._path(self.segment), "a", newline="")
+        self.writer = csv.writer(self.file, delimiter='|')
+
+    def append(self, rows):
+        """
+        Append records.
+        :param rows: An iterable of [PGW_IP, DTmm, SVC_TYPE, UP, DN] rows.
+        :return: None
+        """
+        self.writer.writerows(rows)
+
+    def flush(self):
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def rotate(self):
+        """
+        Close the current segment and start a new one.
+        :return:
+            - An Integer. The closed segment.
+        """
+        self.flush()
+        self.file.close()
+        closed = self.segment
+        self.segment += 1
+        self._open()
+        return closed
+
+    def segments(self, after=-1):
+        """
+        :param after: An Integer. Only segments after this one.
+        :return:
+            - A List. (segment, path) in order.
+        """
+        result = []
+        for path in glob.glob(self.directory + "*.wal"):
+            try:
+                segment = int(os.path.basename(path)[:-4])
+            except ValueError:
+                continue
+            if segment > after:
+                result.append((segment, path))
+        return sorted(result)
+
+    def truncate(self, upto):
+        """
+        Delete segments covered by a checkpoint.
+        :param upto: An Integer. Last covered segment.
+        :return: None
+        """
+        for segment, path in self.segments():
+            if segment <= upto and segment != self.segment:
+                os.remove(path)
+
+    def close(self):
+        if self.file is not None:
+            self.flush()
+            self.file.close()
+            self.file = None
+
+
+def read_segment(path):
+    """
+    Read the records of a WAL segment. A torn last line of a crashed process is skipped.
+    :param path: A String. Segment path.
+    :return:
+        - A List. Rows of [PGW_IP, DTmm, SVC_TYPE, UP, DN]. UP and DN are floats.
+    """
+    rows = []
+    with open(path, "r", newline="") as file:
+        for r in csv.reader(file, delimiter='|'):
+            try:
+                rows.append([r[0], r[1], r[2], float(r[3]), float(r[4])])
+            except (IndexError, ValueError):
+                continue
+    return rows
+
+
+def write_checkpoint(path, state):
+    """
+    Dump a checkpoint atomically.
+    :param path: A String. Checkpoint path.
+    :param state: A Dictionary. Checkpoint contents.
+    :return: None
+    """
+    import dill
+
+    temp = path + ".tmp"
+    with open(temp, "wb") as file:
+        dill.dump(state, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp, path)
+
+
+def read_checkpoint(path, model_path=None):
+    """
+    Read a checkpoint, unless a newer model file replaced it. (e.g. a newly trained model.pkl)
+    :param path: A String. Checkpoint path.
+    :param model_path: A String. Model file path.
+    :return:
+        - A Dictionary, or None.
+    """
+    import pickle
+
+    if not os.path.exists(path):
+        return None
+    if model_path is not None and os.path.exists(model_path) \
+            and os.path.getmtime(model_path) > os.path.getmtime(path):
+        return None
+    with open(path, "rb") as file:
+        return pickle.load(file)
+
+
+class Checkpointer(object):
+    def __init__(self, path, interval, logger=None, metrics=None):
+        """
+        Periodic checkpoints in a forked child.
+        :param path: A String. Checkpoint path.
+        :param interval: A Float. Seconds between checkpoints.
+        :param logger: A Logger object. (None: not logged)
+        :param metrics: A Metrics object. (None: not recorded)
+        """
+        self.path = path
+        self.interval = interval
+        self.logger = logger
+        self.metrics = metrics
+        self.last = time.time()
+        self.child = None
+
+    def due(self):
+        return self.child is None and time.time() - self.last >= self.interval
+
+    def start(self, state_fn, segment):
+        """
+        Fork a child that dumps the state.
+        :param state_fn: A Function. Returns the checkpoint dictionary. It is called in the child.
+        :param segment: An Integer. Last WAL segment covered by the state.
+        :return: None
+        """
+        self.last = time.time()
+        if not hasattr(os, 'fork'):
+            self.run_sync(state_fn, segment)
+            return
+
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                # [*]Collection would write to shared pages and copy them.
+                gc.disable()
+                state = state_fn()
+                state['segment'] = segment
+                write_checkpoint(self.path, state)
+                code = 0
+            finally:
+                os._exit(code)
+
+        self.child = (pid, segment, time.perf_counter())
+
+    def run_sync(self, state_fn, segment):
+        """
+        Dump the state in this process.
+        """
+        stime = time.perf_counter()
+        state = state_fn()
+        state['segment'] = segment
+        write_checkpoint(self.path, state)
+        self._done(segment, time.perf_counter() - stime)
+
+    def poll(self, block=False):
+        """
+        Reap a finished checkpoint child.
+        :param block: A Boolean. Wait for the child.
+        :return:
+            - An Integer. Covered segment of a checkpoint finished successfully, or None.
+        """
+        if self.child is None:
+            return None
+        pid, segment, stime = self.child
+        done, status = os.waitpid(pid, 0 if block else os.WNOHANG)
+        if done == 0:
+            return None
+
+        self.child = None
+        if os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0:
+            self._done(segment, time.perf_counter() - stime)
+            return segment
+
+        if self.logger is not None:
+            self.logger.error("Checkpoint child failed: %s (status %s)", pid, status)
+        if self.metrics is not None:
+            self.metrics.inc('checkpoint_failures_total', help_text="Failed checkpoints.")
+        return None
+
+    def _done(self, segment, elapsed):
+        if self.logger is not None:
+            self.logger.info("Checkpoint is written in %.3fs: %s (WAL segment %s)", elapsed, self.path, segment)
+        if self.metrics is not None:
+            self.metrics.observe('checkpoint_seconds', elapsed, help_text="Time to write a checkpoint.")
+            self.metrics.inc('checkpoints_total', help_text="Written checkpoints.")
@@ -0,0 +1,101 @@
+"""
+@ File name: watermark.py
+@ Version: 1.0.0
+@ Last update: 2026.OCT.19
+@ Company: Ntels Co., Ltd
+"""
+import time
+
+from collections import OrderedDict
+
+
+class MinuteWatermark(object):
+    def __init__(self, deadline=60, history=1440, idle=180):
+        """
+        Event time completion tracker of DTmm minutes.
+        A minute is complete once every reporting detector has reported it, or its deadline passes.
+        A running detector is reporting, if it has reported any minute within the idle seconds.
+        So detectors that are warming up or have no traffic don't hold minutes until the deadline.
+
+        :param deadline: An Integer. Seconds to wait for late detectors after the first report of a minute.
+        :param history: An Integer. Number of flushed minutes to remember for late arrivals.
+        :param idle: An Integer. Seconds since the last report, after which a detector isn't waited for.
+        """
+        self.deadline = deadline
+        self.history = history
+        self.idle = idle
+        # [*](ip, svc) -> time of the last report.
+        self.last_report = {}
+        # [*]DTmm -> {'first_seen', 'reported', 'streams'}
+        self.pending = {}
+        # [*]DTmm -> number of flushes, for naming late arrivals.
+        self.flushed = OrderedDict()
+
+    def add(self, ip, svc, dtmm, rows, now=None):
+        """
+        Record a detector report of a minute.
+        :param ip: A String. P-gateway IP.
+        :param svc: A String. Service type.
+        :param dtmm: A String. Reported minute.
+        :param rows: A List. Rows of the report. It could be empty.
+        :param now: A Float. Current time. (Default: time.time())
+        :return: None
+        """
+        if now is None:
+            now = time.time()
+        minute = self.pending.get(dtmm)
+        if minute is None:
+            minute = {'first_seen': now, 'reported': set(), 'streams': []}
+            self.pending[dtmm] = minute
+        minute['reported'].add((ip, svc))
+        self.last_report[(ip, svc)] = now
+        if rows:
+            minute['streams'].append(rows)
+
+    def pop_complete(self, expected, now=None):
+        """
+        Pop minutes that are ready to be written.
+        :param expected: A Set. (ip, svc) of running detectors. Only the reporting ones are waited for.
+        :param now: A Float. Current time. (Default: time.time())
+        :return:
+            - ready: A List. (dtmm, streams, sequence, missing) sorted by dtmm.
+                     sequence is 0 for the first flush of a minute, and increases for late arrivals.
+        """
+        if now is None:
+            now = time.time()
+        # [*]Forget stopped detectors.
+        for key in [k for k in self.last_report if k not in expected]:
+            del self.last_report[key]
+        reporting = self.reporting(expected, now)
+
+        ready = []
+        for dtmm in sorted(self.pending.keys()):
+            minute = self.pending[dtmm]
+            missing = reporting - minute['reported']
+            if missing and now - minute['first_seen'] < self.deadline:
+                continue
+            del self.pending[dtmm]
+
+            sequence = self.flushed.get(dtmm, -1) + 1
+            self.flushed[dtmm] = sequence
+            self.flushed.move_to_end(dtmm)
+            while len(self.flushed) > self.history:
+                self.flushed.popitem(last=False)
+
+            ready.append((dtmm, minute['streams'], sequence, missing))
+        return ready
+
+    def reporting(self, expected, now=None):
+        """
+        Running detectors that reported within the idle seconds.
+        :param expected: A Set. (ip, svc) of running detectors.
+        :param now: A Float. Current time. (Default: time.time())
+        :return:
+            - A Set. (ip, svc) of reporting detectors.
+        """
+        if now is None:
+            now = time.time()
+        return set(k for k in expected if k in self.last_report and now - self.last_report[k] < self.idle)
+
+    def pending_count(self):
+        return len(self.pending)